@@ -1,5 +1,6 @@
 async function postDetect(formData, base, endpoint, conf) {
-  const url = base + (endpoint === 'detect' ? '/detect' : '/detect/image') + `?conf=${encodeURIComponent(conf)}`;
+  // /detect is asked for detections only: boxes are drawn here instead of shipping a base64 image
+  const url = base + (endpoint === 'detect' ? '/detect?annotated=false&' : '/detect/image?') + `conf=${encodeURIComponent(conf)}`;
   const resp = await fetch(url, { method: 'POST', body: formData });
   if (!resp.ok) {
     const text = await resp.text();
@@ -8,14 +9,23 @@ async function postDetect(formData, base, endpoint, conf) {
   return resp;
 }
 
-function b64ToBlob(b64, mime) {
-  const byteChars = atob(b64);
-  const byteNumbers = new Array(byteChars.length);
-  for (let i = 0; i < byteChars.length; i++) {
-    byteNumbers[i] = byteChars.charCodeAt(i);
+async function drawDetections(file, detections) {
+  const bitmap = await createImageBitmap(file);
+  const canvas = document.createElement('canvas');
+  canvas.width = bitmap.width;
+  canvas.height = bitmap.height;
+  canvas.style.maxWidth = '600px';
+  const ctx = canvas.getContext('2d');
+  ctx.drawImage(bitmap, 0, 0);
+  ctx.lineWidth = Math.max(2, Math.round((bitmap.width + bitmap.height) / 2 * 0.003));
+  ctx.font = `${ctx.lineWidth * 8}px sans-serif`;
+  ctx.strokeStyle = ctx.fillStyle = '#00ff00';
+  for (const d of detections) {
+    const [x1, y1, x2, y2] = d.xyxy;
+    ctx.strokeRect(x1, y1, x2 - x1, y2 - y1);
+    ctx.fillText(`${d.cls} ${d.conf.toFixed(2)}`, x1, Math.max(y1 - 4, 12));
   }
-  const byteArray = new Uint8Array(byteNumbers);
-  return new Blob([byteArray], { type: mime });
+  return canvas;
 }
 
 document.getElementById('run').addEventListener('click', async () => {
@@ -47,15 +57,7 @@ document.getElementById('run').addEventListener('click', async () => {
     if (endpoint === 'detect') {
       const data = await resp.json();
       jsonOut.textContent = JSON.stringify(data.detections || data, null, 2);
-      if (data.annotated_image_base64) {
-        const blob = b64ToBlob(data.annotated_image_base64, 'image/jpeg');
-        const url = URL.createObjectURL(blob);
-        const img = document.createElement('img');
-        img.src = url;
-        img.alt = 'Annotated';
-        img.style.maxWidth = '600px';
-        imgOut.appendChild(img);
-      }
+      imgOut.appendChild(await drawDetections(file, data.detections || []));
       status.textContent = 'Done.';
     } else {
       const blob = await resp.blob();
@@ -0,0 +1,74 @@
+"""Benchmark /detect response formats: payload size and client-side latency.
+
+Every format (json + base64, multipart, msgpack, boxes) is requested with and
+without the annotated image. Latency includes decoding the response into a
+boxes array and JPEG bytes on the client.
+
+Usage (in-process, no server needed):
+    python scripts/bench_formats.py --image data/sample1.jpg --model yolov8n.pt --iters 50
+Against a running server:
+    python scripts/bench_formats.py --image data/sample1.jpg --url http://localhost:8000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+import formats  # noqa: E402
+from api_client import PatternDetectClient  # noqa: E402
+
+
+def bench(client, content, fmt, annotated, iters, conf):
+    params = {'conf': conf, 'annotated': str(annotated).lower(), 'format': fmt}
+    times, size = [], 0
+    for i in range(iters + 2):
+        t0 = time.perf_counter()
+        resp = client.client.post(f'{client.base}/detect', files={'file': ('image.jpg', content, 'image/jpeg')},
+                                  params=params)
+        resp.raise_for_status()
+        formats.decode(resp.headers['content-type'], resp.content)
+        if i >= 2:  # warm-up
+            times.append((time.perf_counter() - t0) * 1000.0)
+        size = len(resp.content)
+    return size, np.percentile(times, 50), np.percentile(times, 99)
+
+
+def main(image, iters=50, url=None, model=None, conf=0.25):
+    with open(image, 'rb') as f:
+        content = f.read()
+    client = PatternDetectClient(url or 'http://testserver')
+    app_ctx = None
+    if url is None:
+        if model:
+            os.environ['PATTERNDETECT_MODEL'] = model
+        sys.path.insert(0, ROOT)
+        from fastapi.testclient import TestClient
+        from src.api import app
+        app_ctx = TestClient(app)
+        client.client = app_ctx.__enter__()
+
+    cases = [(fmt, annotated) for fmt in formats.FORMATS for annotated in (True, False)
+             if not (fmt == 'boxes' and annotated) and not (fmt == 'msgpack' and formats.msgpack is None)]
+    print(f"{'format':<12} {'image':<6} {'bytes':>10} {'p50 ms':>9} {'p99 ms':>9}   ({iters} iters)")
+    try:
+        for fmt, annotated in cases:
+            size, p50, p99 = bench(client, content, fmt, annotated, iters, conf)
+            print(f"{fmt:<12} {'yes' if annotated else 'no':<6} {size:>10} {p50:>9.2f} {p99:>9.2f}")
+    finally:
+        if app_ctx is not None:
+            app_ctx.__exit__(None, None, None)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--image', default='data/sample1.jpg')
+    p.add_argument('--iters', type=int, default=50)
+    p.add_argument('--url', default=None, help='benchmark a running server instead of the in-process app')
+    p.add_argument('--model', default=None, help='weights for the in-process app (PATTERNDETECT_MODEL)')
+    p.add_argument('--conf', type=float, default=0.25)
+    args = p.parse_args()
+    main(args.image, args.iters, args.url, args.model, args.conf)
@@ -0,0 +1,85 @@
+"""Benchmark the API ingest path: temp file on disk vs in-memory decode.
+
+The old `/detect` handlers wrote every upload to a NamedTemporaryFile and let the
+model read it back; the current handlers decode the upload bytes with
+`cv2.imdecode` and pass the array to the model. This script times both paths on
+the same image and prints p50/p99 latency.
+
+Usage:
+    python scripts/bench_ingest.py --image data/sample1.jpg --iters 200
+    python scripts/bench_ingest.py --image data/sample1.jpg --iters 50 --model yolov8n.pt
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from utils import decode_image  # noqa: E402
+
+
+def tempfile_path(content, suffix, predict):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(content)
+        tmp.flush()
+        tmp_path = tmp.name
+    try:
+        if predict is not None:
+            predict(tmp_path)
+        else:
+            cv2.imread(tmp_path)
+    finally:
+        os.remove(tmp_path)
+
+
+def memory_path(content, reduce, predict):
+    img = decode_image(content, reduce)
+    if predict is not None:
+        predict(img)
+
+
+def bench(fn, iters, warmup=3):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(iters):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+
+def main(image, iters=200, model_path=None, reduce=1):
+    with open(image, 'rb') as f:
+        content = f.read()
+    suffix = os.path.splitext(image)[1]
+
+    predict = None
+    if model_path:
+        from ultralytics import YOLO
+        model = YOLO(model_path)
+        predict = lambda src: model.predict(source=src, conf=0.25, save=False, verbose=False)  # noqa: E731
+
+    cases = [('tempfile', lambda: tempfile_path(content, suffix, predict)),
+             ('memory', lambda: memory_path(content, 1, predict))]
+    if reduce > 1:
+        cases.append((f'memory/reduce={reduce}', lambda: memory_path(content, reduce, predict)))
+
+    print(f"{'path':<20} {'p50 ms':>10} {'p99 ms':>10}   ({iters} iters, predict={'yes' if predict else 'no'})")
+    for name, fn in cases:
+        p50, p99 = bench(fn, iters)
+        print(f"{name:<20} {p50:>10.2f} {p99:>10.2f}")
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--image', default='data/sample1.jpg')
+    p.add_argument('--iters', type=int, default=200)
+    p.add_argument('--model', default=None, help='weights to include model.predict in the timing')
+    p.add_argument('--reduce', type=int, default=2, help='also time a reduced-resolution decode (1 to disable)')
+    args = p.parse_args()
+    main(args.image, args.iters, args.model, args.reduce)
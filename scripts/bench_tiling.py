@@ -0,0 +1,106 @@
+"""Benchmark tiled inference: recall on small objects against latency.
+
+Runs the model over a labelled image set once per configuration (whole image
+only, then every tile size x merge method) and reports per-image latency, precision,
+recall, and recall on small objects (ground truth whose longer side is below
+--small pixels). Without --images, a synthetic 4K set with YOLO labels is generated
+in a temporary folder, or in --work-dir to keep it (see scripts/generate_samples.py);
+its recall numbers are only meaningful for a model trained on such patterns.
+
+    python scripts/bench_tiling.py --model runs/detect/train3/weights/best.pt --images data/dataset/images/val --labels data/dataset/labels/val
+    python scripts/bench_tiling.py --model yolov8n.pt --tiles 0,1280,640 --merge nms,wbf --overlap 0.2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+from engine import DEFAULT_MODEL  # noqa: E402
+from evaluate import box_iou, match_predictions, read_yolo_labels  # noqa: E402
+from registry import get_engine, warm_up  # noqa: E402
+from sources import is_image, list_sources  # noqa: E402
+from tiling import tiled  # noqa: E402
+
+
+def load_set(images_dir, labels_dir):
+    samples = []
+    for path in (p for p in list_sources(images_dir) if is_image(p)):
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        stem = os.path.splitext(os.path.basename(path))[0]
+        gt = read_yolo_labels(os.path.join(labels_dir, stem + '.txt'), img.shape[1], img.shape[0])
+        samples.append((img, gt))
+    return samples
+
+
+def run(engine, samples, conf, small):
+    latencies, tp, n_pred, found, n_gt, small_found, n_small = [], 0, 0, 0, 0, 0, 0
+    for img, gt in samples:
+        t0 = time.perf_counter()
+        dets = engine.predict([img], conf=conf)[0]
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        tp += int(match_predictions(dets, gt, np.array([0.5]))[:, 0].sum())
+        n_pred += len(dets)
+        hit = (box_iou(gt[:, 1:], dets[:, :4]).max(1) >= 0.5) if len(dets) else np.zeros(len(gt), bool)
+        is_small = np.maximum(gt[:, 3] - gt[:, 1], gt[:, 4] - gt[:, 2]) < small
+        found += int(hit.sum())
+        n_gt += len(gt)
+        small_found += int(hit[is_small].sum())
+        n_small += int(is_small.sum())
+    return {'p50_ms': np.percentile(latencies, 50), 'p95_ms': np.percentile(latencies, 95),
+            'precision': tp / n_pred if n_pred else 0.0, 'recall': found / n_gt if n_gt else 0.0,
+            'small_recall': small_found / n_small if n_small else float('nan'), 'small_objects': n_small}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--model', default=DEFAULT_MODEL)
+    p.add_argument('--images', default=None, help='labelled images (default: synthetic 3840x2160 set)')
+    p.add_argument('--labels', default=None, help='YOLO labels for --images')
+    p.add_argument('--count', type=int, default=8, help='synthetic images')
+    p.add_argument('--work-dir', default=None, help='keep the synthetic set here (default: a temporary folder)')
+    p.add_argument('--tiles', default='0,1280,640', help='tile sizes to compare; 0 = whole image only')
+    p.add_argument('--overlap', type=float, default=0.2)
+    p.add_argument('--merge', default='nms,wbf', help='merge methods to compare')
+    p.add_argument('--tile-batch', type=int, default=8)
+    p.add_argument('--no-full-frame', action='store_true', help='tiles only, no whole-image pass')
+    p.add_argument('--conf', type=float, default=0.25)
+    p.add_argument('--small', type=int, default=128, help='longer side (pixels) below which an object is small')
+    args = p.parse_args(argv)
+
+    work = None
+    if args.images is None:
+        from benchmark import make_dataset
+        if args.work_dir is None:
+            work = tempfile.TemporaryDirectory(prefix='bench_tiling-')
+        args.images, args.labels, _ = make_dataset(args.work_dir or work.name, (3840, 2160), args.count, seed=0)
+    samples = load_set(args.images, args.labels or args.images)
+    if work is not None:
+        work.cleanup()  # the samples are in memory now
+    if not samples:
+        sys.exit(f'No images in {args.images}')
+    engine = get_engine(args.model)
+    warm_up(engine)
+
+    configs = [(int(t), m) for t in args.tiles.split(',') for m in (args.merge.split(',') if int(t) else ['-'])]
+    print(f"{len(samples)} images, {sum(len(gt) for _, gt in samples)} objects; overlap {args.overlap}, "
+          f"full frame {'off' if args.no_full_frame else 'on'}")
+    print(f"{'tile':>6} {'merge':<6} {'p50 ms':>9} {'p95 ms':>9} {'precision':>10} {'recall':>8} {'small rec':>10}")
+    for tile, merge in configs:
+        predictor = tiled(engine, tile, overlap=args.overlap, batch_size=args.tile_batch,
+                          full_frame=not args.no_full_frame, merge=merge) if tile else engine
+        r = run(predictor, samples, args.conf, args.small)
+        print(f"{tile or 'full':>6} {merge:<6} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['precision']:>10.3f} "
+              f"{r['recall']:>8.3f} {r['small_recall']:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""Throughput / latency benchmark suite with a regression gate.
+
+Synthesises an image set with scripts/generate_samples.py (size, count and
+seed are configurable, so runs are reproducible), then runs each suite in its
+own process so its peak RSS can be measured:
+
+    api       the FastAPI app in-process (TestClient), `--concurrency` parallel requests
+    uvicorn   the same over HTTP against a local `uvicorn src.api:app` (server RSS)
+    detect    the bulk path of src/detect.py (run_bulk)
+    evaluate  src/evaluate.py (prediction cache disabled)
+    template  src/template_match.py on every image
+
+Every suite reports images/sec, p50/p95/p99 latency in ms (per request or
+image, where the path exposes it) and peak RSS in MB. Results are written to
+`--out`. With `--baseline`, results are compared against a saved baseline, and
+the run exits with status 1 if throughput drops, or latency or memory grow, by
+more than `--tolerance`. `--update-baseline` saves this run as the new baseline.
+
+    python scripts/benchmark.py --model yolov8n.pt --size 1280x720 --count 64 --baseline benchmarks/baseline.json
+    python scripts/benchmark.py --model yolov8n.pt --suites api,uvicorn --baseline benchmarks/baseline.json --update-baseline
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+SUITES = ('api', 'uvicorn', 'detect', 'evaluate', 'template')
+# metric -> +1 if bigger is better, -1 if smaller is better
+DIRECTIONS = {'images_per_sec': 1, 'p50_ms': -1, 'p95_ms': -1, 'p99_ms': -1, 'peak_rss_mb': -1}
+
+
+# --- data ------------------------------------------------------------------------
+
+def make_dataset(root, size, count, seed):
+    """Generate (once per size/count/seed) images + YOLO labels; returns (images dir, labels dir, template)."""
+    sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+    import generate_samples
+
+    data = os.path.join(root, f'{size[0]}x{size[1]}-{count}-{seed}')
+    images, labels = os.path.join(data, 'images'), os.path.join(data, 'labels')
+    template = os.path.join(data, 'template.png')
+    if not os.path.exists(template):
+        generate_samples.main(images, count, size, seed, labels, quiet=True)
+        # keep the template out of the image set
+        shutil.move(os.path.join(images, 'template.png'), template)
+    return images, labels, template
+
+
+# --- measurement helpers ---------------------------------------------------------
+
+def summarise(n, seconds, latencies_ms=None) -> dict:
+    out = {'images': n, 'seconds': round(seconds, 3), 'images_per_sec': round(n / seconds, 2) if seconds else 0.0}
+    for q in (50, 95, 99):
+        out[f'p{q}_ms'] = round(float(np.percentile(latencies_ms, q)), 2) if latencies_ms else None
+    return out
+
+
+def drive(send, payloads, concurrency):
+    """Call send(payload) for every payload with `concurrency` threads; returns (seconds, latencies in ms)."""
+    latencies = []
+    lock = threading.Lock()
+
+    def one(payload):
+        t0 = time.perf_counter()
+        send(payload)
+        with lock:
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, payloads))
+    return time.perf_counter() - t0, latencies
+
+
+def _payloads(images, requests):
+    files = sorted(os.listdir(images))
+    blobs = []
+    for name in files:
+        with open(os.path.join(images, name), 'rb') as f:
+            blobs.append((name, f.read()))
+    return [blobs[i % len(blobs)] for i in range(requests)]
+
+
+def _api_env(model):
+    # the result cache would turn repeated images into cache hits
+    return {'PATTERNDETECT_MODEL': model, 'PATTERNDETECT_CACHE_SIZE': '0'}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait4(proc):
+    """Wait for `proc`; returns its peak RSS in MB (None where the OS can't tell)."""
+    if not hasattr(os, 'wait4') or proc.returncode is not None:  # already reaped by poll()
+        proc.wait()
+        return None
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(usage.ru_maxrss / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+
+
+# --- suites (each runs in its own process) ---------------------------------------
+
+def suite_api(args, images, labels, template):
+    os.environ.update(_api_env(args.model))
+    sys.path.insert(0, ROOT)
+    from fastapi.testclient import TestClient
+    from src.api import app
+
+    params = {'conf': args.conf, 'annotated': str(args.annotated).lower()}
+    with TestClient(app) as client:
+        def send(payload):
+            r = client.post('/detect', files={'file': (payload[0], payload[1], 'image/jpeg')}, params=params)
+            r.raise_for_status()
+        drive(send, _payloads(images, min(args.count, 4)), 1)  # warm-up
+        seconds, latencies = drive(send, _payloads(images, args.requests), args.concurrency)
+    return summarise(args.requests, seconds, latencies)
+
+
+def suite_uvicorn(args, images, labels, template):
+    import httpx
+
+    port = _free_port()
+    env = {**os.environ, **_api_env(args.model)}
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'src.api:app', '--port', str(port),
+                               '--log-level', 'warning'], cwd=ROOT, env=env)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        with httpx.Client(timeout=120, limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            deadline = time.time() + 300
+            while True:
+                try:
+                    if client.get(f'{base}/ready').status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError('uvicorn did not become ready')
+                time.sleep(0.2)
+
+            params = {'conf': args.conf, 'annotated': str(args.annotated).lower()}
+
+            def send(payload):
+                r = client.post(f'{base}/detect', files={'file': (payload[0], payload[1], 'image/jpeg')}, params=params)
+                r.raise_for_status()
+            drive(send, _payloads(images, min(args.count, 4)), 1)
+            seconds, latencies = drive(send, _payloads(images, args.requests), args.concurrency)
+    finally:
+        server.terminate()
+        server_rss = _wait4(server)
+    result = summarise(args.requests, seconds, latencies)
+    result['server_peak_rss_mb'] = server_rss
+    return result
+
+
+def suite_detect(args, images, labels, template):
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    from detect import run_bulk
+    from registry import get_engine
+
+    get_engine(args.model)  # load outside the timing
+    out = os.path.join(args.data_dir, 'detections.jsonl')
+    stats = run_bulk(images, out, conf=args.conf, model=args.model, batch_size=args.batch_size, log_every=1e9)
+    return summarise(stats['processed'], stats['seconds'])
+
+
+def suite_evaluate(args, images, labels, template):
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    from evaluate import evaluate
+    from registry import get_engine
+
+    get_engine(args.model)
+    n = len(os.listdir(images))
+    t0 = time.perf_counter()
+    evaluate(args.model, images, labels, os.path.join(args.data_dir, 'eval.csv'), batch_size=args.batch_size,
+             cache_dir=None)
+    return summarise(n, time.perf_counter() - t0)
+
+
+def suite_template(args, images, labels, template):
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    from matching import scale_range
+    from template_match import template_match
+
+    out = os.path.join(args.data_dir, 'template_out.jpg')
+    latencies = []
+    t0 = time.perf_counter()
+    for name in sorted(os.listdir(images)):
+        t = time.perf_counter()
+        template_match(os.path.join(images, name), [template], out, scale_range(0.5, 2.0, 7), threshold=0.7)
+        latencies.append((time.perf_counter() - t) * 1000.0)
+    return summarise(len(latencies), time.perf_counter() - t0, latencies)
+
+
+def run_suite(name, argv) -> dict:
+    """Run one suite in a child process; returns its result plus the child's peak RSS."""
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), *argv, '--suite-worker', name],
+                            cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    stdout = proc.stdout.read()
+    rss = _wait4(proc)
+    if proc.returncode != 0:
+        raise RuntimeError(f'suite {name} failed with exit code {proc.returncode}')
+    result = json.loads(stdout.strip().splitlines()[-1])
+    result['peak_rss_mb'] = rss
+    return result
+
+
+# --- baseline --------------------------------------------------------------------
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regression messages for every metric worse than the baseline by more than `tolerance` (a fraction)."""
+    problems = []
+    for suite, metrics in results.items():
+        for metric, sign in DIRECTIONS.items():
+            new, old = metrics.get(metric), baseline.get(suite, {}).get(metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old * sign  # negative = worse
+            if change < -tolerance:
+                problems.append(f'{suite}.{metric}: {old} -> {new} ({change * sign:+.1%}, tolerance {tolerance:.0%})')
+    return problems
+
+
+def main(args, argv):
+    images, labels, template = make_dataset(args.data_dir, args.size, args.count, args.seed)
+    if args.suite_worker:
+        fn = globals()[f'suite_{args.suite_worker}']
+        print(json.dumps(fn(args, images, labels, template)))
+        return 0
+
+    results = {}
+    for name in args.suites:
+        if name == 'uvicorn' and importlib.util.find_spec('uvicorn') is None:
+            print('skipping uvicorn: not installed', file=sys.stderr)
+            continue
+        print(f'running {name} ...', file=sys.stderr)
+        results[name] = run_suite(name, argv)
+        print(f'  {name}: {results[name]}', file=sys.stderr)
+
+    report = {
+        'config': {'model': os.path.basename(args.model), 'size': f'{args.size[0]}x{args.size[1]}',
+                   'count': args.count, 'seed': args.seed, 'requests': args.requests,
+                   'concurrency': args.concurrency, 'batch_size': args.batch_size, 'annotated': args.annotated},
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.out}', file=sys.stderr)
+
+    status = 0
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            base = json.load(f)
+        if base.get('config') != report['config']:
+            print(f"warning: baseline config {base.get('config')} differs from this run", file=sys.stderr)
+        problems = compare(results, base.get('results', {}), args.tolerance)
+        for p in problems:
+            print(f'REGRESSION {p}', file=sys.stderr)
+        status = 1 if problems else 0
+        if not problems:
+            print('No regressions against the baseline', file=sys.stderr)
+    if args.baseline and (args.update_baseline or not os.path.exists(args.baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        shutil.copy(args.out, args.baseline)
+        print(f'Saved baseline {args.baseline}', file=sys.stderr)
+    return status
+
+
+def parse_args(argv):
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    from engine import DEFAULT_MODEL
+
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--model', default=DEFAULT_MODEL)
+    p.add_argument('--suites', default=','.join(SUITES), help=f'comma-separated subset of {",".join(SUITES)}')
+    p.add_argument('--size', default='1280x720', help='synthetic image size WIDTHxHEIGHT')
+    p.add_argument('--count', type=int, default=64, help='synthetic images')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--requests', type=int, default=128, help='API requests per API suite')
+    p.add_argument('--concurrency', type=int, default=8, help='parallel API requests')
+    p.add_argument('--batch-size', type=int, default=8, help='CLI inference batch size')
+    p.add_argument('--conf', type=float, default=0.25)
+    p.add_argument('--annotated', action='store_true', help='request annotated images from the API')
+    p.add_argument('--data-dir', default=os.path.join(ROOT, 'outputs', 'bench'))
+    p.add_argument('--out', default=os.path.join(ROOT, 'outputs', 'bench', 'results.json'))
+    p.add_argument('--baseline', default=None, help='baseline JSON to compare against (created if missing)')
+    p.add_argument('--tolerance', type=float, default=0.15, help='allowed relative regression, e.g. 0.15 = 15%%')
+    p.add_argument('--update-baseline', action='store_true')
+    p.add_argument('--suite-worker', default=None, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    args.size = tuple(int(v) for v in args.size.lower().split('x'))
+    args.suites = [s for s in args.suites.split(',') if s]
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        p.error(f'unknown suites: {sorted(unknown)}')
+    args.model = os.path.abspath(args.model) if os.path.exists(args.model) else args.model
+    return args
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    sys.exit(main(parse_args(argv), argv))
@@ -5,6 +5,9 @@ and writes a small template image that can be used for template matching tests.
 
 Usage:
     python scripts/generate_samples.py --out data/samples --count 3
+    python scripts/generate_samples.py --out outputs/bench --count 200 --size 1920x1080 --seed 0 --labels outputs/bench/labels
+
+With --labels a YOLO label file (class 0 per pattern) is written next to every image.
 
 """
 from PIL import Image, ImageDraw, ImageFilter
@@ -26,14 +29,17 @@ def draw_pattern(draw, x, y, w, h, spacing=6):
 
 
 def create_image(path, size=(640, 480), n_patterns=3):
+    """Write a synthetic image and return the (x1, y1, x2, y2) box of every pattern."""
     img = Image.new('RGB', size, BG_COLOR)
     draw = ImageDraw.Draw(img)
 
+    boxes = []
     for i in range(n_patterns):
-        w = random.randint(80, 220)
-        h = random.randint(40, 160)
+        w = random.randint(80, min(220, size[0] - 20))
+        h = random.randint(40, min(160, size[1] - 20))
         x = random.randint(10, size[0] - w - 10)
         y = random.randint(10, size[1] - h - 10)
+        boxes.append((x, y, x + w, y + h))
         draw_pattern(draw, x, y, w, h, spacing=random.randint(6, 12))
         # add a small label rectangle to simulate an object's corner
         draw.rectangle([x + 3, y + 3, x + 30, y + 20], fill=(200, 60, 60))
@@ -41,6 +47,14 @@ def create_image(path, size=(640, 480), n_patterns=3):
     # optional blur to make it slightly more realistic
     img = img.filter(ImageFilter.GaussianBlur(radius=0.6))
     img.save(path, quality=90)
+    return boxes
+
+
+def write_yolo_labels(path, boxes, size):
+    W, H = size
+    with open(path, 'w') as f:
+        for x1, y1, x2, y2 in boxes:
+            f.write(f"0 {(x1 + x2) / 2 / W:.6f} {(y1 + y2) / 2 / H:.6f} {(x2 - x1) / W:.6f} {(y2 - y1) / H:.6f}\n")
 
 
 def create_template(path):
@@ -51,21 +65,33 @@ def create_template(path):
     img.save(path, quality=90)
 
 
-def main(out_dir='data/samples', count=3):
+def main(out_dir='data/samples', count=3, size=(640, 480), seed=None, labels_dir=None, quiet=False):
+    if seed is not None:
+        random.seed(seed)
     os.makedirs(out_dir, exist_ok=True)
+    if labels_dir:
+        os.makedirs(labels_dir, exist_ok=True)
     for i in range(1, count + 1):
         path = os.path.join(out_dir, f'sample{i}.jpg')
-        create_image(path)
-        print('Wrote', path)
+        boxes = create_image(path, size)
+        if labels_dir:
+            write_yolo_labels(os.path.join(labels_dir, f'sample{i}.txt'), boxes, size)
+        if not quiet:
+            print('Wrote', path)
 
     template_path = os.path.join(out_dir, 'template.png')
     create_template(template_path)
-    print('Wrote template', template_path)
+    if not quiet:
+        print('Wrote template', template_path)
 
 
 if __name__ == '__main__':
     p = argparse.ArgumentParser()
     p.add_argument('--out', default='data/samples')
     p.add_argument('--count', type=int, default=3)
+    p.add_argument('--size', default='640x480', help='image size as WIDTHxHEIGHT')
+    p.add_argument('--seed', type=int, default=None, help='make the output reproducible')
+    p.add_argument('--labels', default=None, help='also write YOLO labels to this folder')
     args = p.parse_args()
-    main(out_dir=args.out, count=args.count)
+    w, h = (int(v) for v in args.size.lower().split('x'))
+    main(out_dir=args.out, count=args.count, size=(w, h), seed=args.seed, labels_dir=args.labels)
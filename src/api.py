@@ -1,13 +1,29 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import FastAPI, File, Query, Request, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from ultralytics import YOLO
-import cv2
+from pydantic import BaseModel
 import numpy as np
-import tempfile
+import asyncio
+import contextlib
+import functools
+import itertools
+import json
 import os
-import base64
-from typing import List
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.batching import BatchScheduler, QueueFullError
+from src.engine import BACKENDS, DEFAULT_BACKEND, DEFAULT_MODEL
+from src import formats
+from src.metrics import MetricsRegistry, server_timing, stage, start_timing
+from src.registry import DEFAULT_NAME, ModelRegistry, ModelSpec
+from src.pred_cache import content_hash
+from src.result_cache import ResultCache, SQLiteBackend
+from src.sources import is_archive, iter_archive
+from src.stream import FrameReader, Tracker, frame_event
+from src.tiling import MERGE_METHODS
+from src.utils import IMAGE_FORMATS, decode_image
+from src.workers import Overloaded, WorkerPool, encode_annotated, predict_batch, predict_tiled, preload
 
 app = FastAPI(title='Truck Inspection API')
 
@@ -20,14 +36,168 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-MODEL_PATH = 'yolov8n.pt'
-model = None
+# Weights and backend come from PATTERNDETECT_MODEL / PATTERNDETECT_BACKEND (see src/engine.py).
+# Extra named models can be listed as PATTERNDETECT_MODELS="train3=runs/detect/train3/weights/best.pt,...".
+MODEL_PATH = DEFAULT_MODEL
+BACKEND = DEFAULT_BACKEND
+EXTRA_MODELS = os.environ.get('PATTERNDETECT_MODELS', '')
+# POST /models/{name} only accepts weights below this directory
+MODEL_ROOT = os.path.abspath(os.environ.get('PATTERNDETECT_MODEL_ROOT', '.'))
+# engines each worker keeps loaded (old versions are evicted least-recently-used first)
+MAX_CACHED_MODELS = int(os.environ.get('PATTERNDETECT_MAX_CACHED_MODELS', '4'))
+
+# Micro-batching: concurrent requests are grouped into one predict call of up to
+# MAX_BATCH_SIZE images, waiting at most MAX_WAIT_MS for a batch to fill.
+MAX_BATCH_SIZE = int(os.environ.get('PATTERNDETECT_MAX_BATCH_SIZE', '8'))
+MAX_WAIT_MS = float(os.environ.get('PATTERNDETECT_MAX_WAIT_MS', '10'))
+QUEUE_DEPTH = int(os.environ.get('PATTERNDETECT_QUEUE_DEPTH', '64'))
+
+# Decode, predict, plot and encode run on a worker pool (each worker holds its own
+# models) so the event loop stays free for /health and new connections. At most
+# MAX_PENDING requests are admitted; the rest get 429 + Retry-After.
+WORKER_KIND = os.environ.get('PATTERNDETECT_WORKER_KIND', 'thread')  # 'thread' or 'process'
+WORKERS = int(os.environ.get('PATTERNDETECT_WORKERS', '2'))
+MAX_PENDING = int(os.environ.get('PATTERNDETECT_MAX_PENDING', '32'))
+RETRY_AFTER = int(os.environ.get('PATTERNDETECT_RETRY_AFTER', '1'))
+
+# Results of byte-identical uploads are reused (see src/result_cache.py): up to
+# CACHE_SIZE entries / CACHE_MB megabytes for CACHE_TTL seconds (CACHE_SIZE=0
+# disables it). CACHE_PATH adds a SQLite file shared by all worker processes.
+CACHE_SIZE = int(os.environ.get('PATTERNDETECT_CACHE_SIZE', '1024'))
+CACHE_MB = int(os.environ.get('PATTERNDETECT_CACHE_MB', '256'))
+CACHE_TTL = float(os.environ.get('PATTERNDETECT_CACHE_TTL', '300'))
+CACHE_PATH = os.environ.get('PATTERNDETECT_CACHE_PATH', '')
+
+# Server-Timing headers with per-stage durations: for every response when set to 1,
+# otherwise only for requests sending `X-Server-Timing: 1`.
+SERVER_TIMING = os.environ.get('PATTERNDETECT_SERVER_TIMING', '0') == '1'
+
+# /detect/batch: images accepted per request, and how many of them are in the
+# scheduler queue at once (enough to fill two inference batches).
+MAX_BATCH_IMAGES = int(os.environ.get('PATTERNDETECT_MAX_BATCH_IMAGES', '256'))
+# Archive parts are expanded up to ARCHIVE_MEMBER_MB per image and ARCHIVE_MB in total.
+MAX_ARCHIVE_MEMBER_BYTES = int(os.environ.get('PATTERNDETECT_ARCHIVE_MEMBER_MB', '64')) * 1024 * 1024
+MAX_ARCHIVE_BYTES = int(os.environ.get('PATTERNDETECT_ARCHIVE_MB', '1024')) * 1024 * 1024
+BATCH_CONCURRENCY = 2 * MAX_BATCH_SIZE
+
+# Video sources for GET /detect/stream/events: files under PATTERNDETECT_STREAM_ROOT, and
+# rtsp:// / http(s):// URLs only when PATTERNDETECT_STREAM_URLS=1 (the server connects to them).
+STREAM_ROOT = os.path.abspath(os.environ.get('PATTERNDETECT_STREAM_ROOT', '.'))
+STREAM_URLS = os.environ.get('PATTERNDETECT_STREAM_URLS', '0') == '1'
+STREAM_SCHEMES = ('rtsp://', 'rtsps://', 'http://', 'https://')
+
+# The API-level registry is only the catalog of names -> versions; every worker has
+# its own ModelRegistry holding the loaded engines.
+registry = ModelRegistry()
+registry.register(DEFAULT_NAME, MODEL_PATH, BACKEND)
+for _entry in filter(None, EXTRA_MODELS.split(',')):
+    _name, _weights = _entry.split('=', 1)
+    registry.register(_name.strip(), _weights.strip(), BACKEND)
+
+pool = WorkerPool(functools.partial(ModelRegistry, max_cached=MAX_CACHED_MODELS, warmup=True), kind=WORKER_KIND,
+                  workers=WORKERS, max_pending=MAX_PENDING, retry_after=RETRY_AFTER)
+scheduler = BatchScheduler(predict_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                           max_queue=QUEUE_DEPTH, executor=pool, max_concurrent=WORKERS)
+result_cache = ResultCache(CACHE_SIZE, CACHE_MB << 20, CACHE_TTL,
+                           shared=SQLiteBackend(CACHE_PATH) if CACHE_PATH and CACHE_SIZE else None)
+_swap_lock = asyncio.Lock()
+# name -> version that every worker has loaded and warmed up (see /ready)
+_ready: Dict[str, str] = {}
+
+# --- metrics (GET /metrics) ------------------------------------------------------
+metrics = MetricsRegistry()
+REQUEST_SECONDS = metrics.histogram('patterndetect_request_seconds', 'Request latency', ['path'])
+REQUESTS = metrics.counter('patterndetect_requests_total', 'Requests by path and status', ['path', 'status'])
+ERRORS = metrics.counter('patterndetect_errors_total', 'Responses with status >= 400', ['path', 'status'])
+STAGE_SECONDS = metrics.histogram('patterndetect_stage_seconds',
+                                  'Time per pipeline stage (read, decode, infer, render, serialize)', ['stage'])
+QUEUE_WAIT = metrics.histogram('patterndetect_queue_wait_seconds', 'Time images wait for an inference batch')
+PREDICT_SECONDS = metrics.histogram('patterndetect_predict_seconds', 'Duration of one batched predict call')
+BATCH_SIZE = metrics.histogram('patterndetect_batch_size', 'Images per predict call',
+                               buckets=(1, 2, 4, 8, 16, 32, 64))
+MODEL_LOAD_SECONDS = metrics.gauge('patterndetect_model_load_seconds',
+                                   'Time to load and warm up a model version on all workers', ['model', 'version'])
+metrics.gauge('patterndetect_queue_depth', 'Images waiting for inference', fn=lambda: scheduler.qsize())
+metrics.gauge('patterndetect_in_flight', 'Requests being processed', fn=lambda: pool.pending)
+metrics.gauge('patterndetect_ready', '1 when every model is loaded and warmed up', fn=lambda: float(_is_ready()))
+metrics.counter('patterndetect_cache_hits_total', 'Result cache hits',
+                fn=lambda: result_cache.stats['hits'] + result_cache.stats['coalesced'])
+metrics.counter('patterndetect_cache_misses_total', 'Result cache misses', fn=lambda: result_cache.stats['misses'])
+
+
+def _observe_batch(size: int, seconds: float, waits: List[float]):
+    BATCH_SIZE.observe(size)
+    PREDICT_SECONDS.observe(seconds)
+    for wait in waits:
+        QUEUE_WAIT.observe(wait)
+
+
+scheduler.on_batch = _observe_batch
+
+
+def _is_ready() -> bool:
+    specs = registry.specs()
+    return bool(specs) and all(_ready.get(spec.name) == spec.version for spec in specs)
+
+
+def _preload_everywhere(spec: ModelSpec):
+    """Load and warm up `spec` on every worker, recording how long that took."""
+    t0 = time.perf_counter()
+    pool.broadcast(preload, spec)
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, model=spec.name, version=spec.version)
 
 
 @app.on_event('startup')
 def startup_event():
-    global model
-    model = YOLO(MODEL_PATH)  # loads / downloads model on first run
+    pool.start()
+    # every worker loads / downloads and warms up each model before we serve traffic
+    for spec in registry.specs():
+        _preload_everywhere(spec)
+        _ready[spec.name] = spec.version
+
+
+@app.on_event('startup')
+async def start_scheduler():
+    scheduler.start()
+
+
+@app.on_event('shutdown')
+async def stop_scheduler():
+    await scheduler.stop()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse({'detail': str(exc)}, status_code=429, headers={'Retry-After': str(exc.retry_after)})
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse({'detail': str(exc)}, status_code=503, headers={'Retry-After': str(RETRY_AFTER)})
+
+
+@app.middleware('http')
+async def observe_requests(request: Request, call_next):
+    timings = start_timing() if SERVER_TIMING or request.headers.get('x-server-timing') == '1' else None
+    t0 = time.perf_counter()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    except Exception:
+        status = 500
+        raise
+    finally:
+        # label by route template (/models/{name}), not the raw path
+        route = request.scope.get('route')
+        path = getattr(route, 'path', 'unmatched')
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, path=path)
+        REQUESTS.inc(path=path, status=status)
+        if status >= 400:
+            ERRORS.inc(path=path, status=status)
+    if timings:
+        response.headers['Server-Timing'] = server_timing(timings)
+    return response
 
 
 @app.get('/health')
@@ -35,69 +205,427 @@ def health():
     return {'status': 'ok'}
 
 
-@app.post('/detect')
-async def detect(file: UploadFile = File(...), conf: float = 0.25, annotated: bool = True):
+@app.get('/ready')
+def ready():
+    """200 once every registered model is loaded and warmed up on every worker, else 503."""
+    body = {'ready': _is_ready(),
+            'models': {spec.name: {'version': spec.version, 'loaded': _ready.get(spec.name) == spec.version}
+                       for spec in registry.specs()}}
+    return JSONResponse(body, status_code=200 if body['ready'] else 503)
+
+
+@app.get('/metrics')
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+@app.get('/cache')
+def cache_stats():
+    """Result cache hits, misses, coalesced requests and size."""
+    return result_cache.info()
+
+
+class ModelUpdate(BaseModel):
+    weights: str
+    backend: str = DEFAULT_BACKEND
+
+
+@app.get('/models')
+def list_models():
+    return {'models': [spec.to_dict() for spec in registry.specs()]}
+
+
+@app.post('/models/{name}')
+async def update_model(name: str, body: ModelUpdate):
+    """Register `name` (e.g. 'default') to new weights, such as a fresh best.pt.
+
+    The new version is loaded and warmed up on every worker first, then published
+    in one step; requests already in flight finish on the version they started with.
+    """
+    weights = os.path.abspath(body.weights)
+    if os.path.commonpath([weights, MODEL_ROOT]) != MODEL_ROOT:
+        raise HTTPException(status_code=400, detail='weights must be inside the model root')
+    if not os.path.isfile(weights):
+        raise HTTPException(status_code=404, detail=f'weights not found: {body.weights}')
+    if body.backend not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f'backend must be one of {BACKENDS}')
+    loop = asyncio.get_running_loop()
+    async with _swap_lock:
+        spec = await loop.run_in_executor(None, registry.make_spec, name, body.weights, body.backend)
+        try:
+            await loop.run_in_executor(None, _preload_everywhere, spec)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f'could not load {body.weights}: {e}')
+        _ready[spec.name] = spec.version
+        registry.publish(spec)
+    return spec.to_dict()
+
+
+def _resolve_model(model: Optional[str]) -> ModelSpec:
+    try:
+        return registry.spec(model)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+
+def _check_reduce(reduce: int):
+    if reduce not in (1, 2, 4, 8):
+        raise HTTPException(status_code=400, detail='reduce must be one of 1, 2, 4, 8')
+
+
+def _check_render(max_dim: Optional[int], quality: int, image_format: str):
+    if max_dim is not None and not 16 <= max_dim <= 16384:
+        raise HTTPException(status_code=400, detail='max_dim must be between 16 and 16384')
+    if not 1 <= quality <= 100:
+        raise HTTPException(status_code=400, detail='quality must be between 1 and 100')
+    if image_format not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f'image_format must be one of {sorted(IMAGE_FORMATS)}')
+
+
+def _check_tiling(tile: int, tile_overlap: float, tile_merge: str) -> Optional[tuple]:
+    if not tile:
+        return None
+    if not 128 <= tile <= 4096:
+        raise HTTPException(status_code=400, detail='tile must be 0 (off) or between 128 and 4096')
+    if not 0.0 <= tile_overlap <= 0.5:
+        raise HTTPException(status_code=400, detail='tile_overlap must be between 0 and 0.5')
+    if tile_merge not in MERGE_METHODS:
+        raise HTTPException(status_code=400, detail=f'tile_merge must be one of {MERGE_METHODS}')
+    return tile, tile_overlap, tile_merge
+
+
+async def _read_upload(file: UploadFile) -> bytes:
     if file.content_type.split('/')[0] != 'image':
         raise HTTPException(status_code=400, detail='file must be an image')
+    with stage(STAGE_SECONDS, 'read'):
+        return await file.read()
+
+
+async def _detect_bytes(content: bytes, conf: float, reduce: int, spec: ModelSpec,
+                        render: Optional[tuple] = None,
+                        tiling: Optional[tuple] = None) -> Tuple[Tuple[int, int], np.ndarray, Optional[bytes]]:
+    """Decode and predict `content` (in memory, no temp file), through the result cache.
+
+    Returns ((h, w) of the decoded image, dets, encoded annotated image or None).
+    `render` = (max_dim, image_format, quality) asks for the annotated image.
+    `tiling` = (tile, overlap, merge) predicts on overlapping tiles in one worker call
+    instead of going through the batch scheduler.
+    """
+    key = (content_hash(content), spec.sha256 or os.path.abspath(spec.weights), spec.backend, float(conf), reduce,
+           tiling)
+    decoded = None
+
+    async def decode():
+        with stage(STAGE_SECONDS, 'decode'):
+            img = await pool.run(decode_image, content, reduce)
+        if img is None:
+            raise HTTPException(status_code=400, detail='could not decode image')
+        return img
+
+    async def infer():
+        nonlocal decoded
+        decoded = await decode()
+        # the scheduler hands the BGR array to model.predict, so the image is decoded exactly once
+        with stage(STAGE_SECONDS, 'infer'):
+            if tiling is None:
+                dets = await scheduler.submit(decoded, conf, spec)
+            else:
+                dets = await pool.run(predict_tiled, decoded, conf, spec, *tiling)
+        return np.array(decoded.shape[:2]), dets
+
+    shape, dets = await result_cache.get_or_compute(key, infer)
+    if render is None:
+        return tuple(shape.tolist()), dets, None
 
-    suffix = os.path.splitext(file.filename)[1]
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp.flush()
-        tmp_path = tmp.name
-
-    # Run prediction
-    results = model.predict(source=tmp_path, conf=conf, save=False)
-    r = results[0]
-
-    # Build JSON response
-    detections = []
-    for box in r.boxes:
-        xyxy = box.xyxy[0].tolist()
-        detections.append({'xyxy': [round(float(x), 2) for x in xyxy], 'conf': float(box.conf[0]), 'cls': int(box.cls[0])})
-
-    response = {'detections': detections}
-
-    if annotated:
-        annotated_img = r.plot()  # RGB
-        # encode to JPEG bytes
-        annotated_bgr = cv2.cvtColor(annotated_img, cv2.COLOR_RGB2BGR)
-        _, img_bytes = cv2.imencode('.jpg', annotated_bgr)
-        b64 = base64.b64encode(img_bytes.tobytes()).decode('ascii')
-        response['annotated_image_base64'] = b64
-
-    # cleanup
+    async def draw():
+        # a cache hit for the detections still needs the pixels to draw on
+        img = decoded if decoded is not None else await decode()
+        with stage(STAGE_SECONDS, 'render'):
+            return await pool.run(encode_annotated, img, dets, spec, *render)
+
+    img_bytes = await result_cache.get_or_compute(key + render, draw)
+    return tuple(shape.tolist()), dets, img_bytes
+
+
+@app.post('/detect')
+async def detect(request: Request, file: UploadFile = File(...), conf: float = 0.25, annotated: bool = True,
+                 reduce: int = 1, model: Optional[str] = None, fmt: Optional[str] = Query(None, alias='format'),
+                 max_dim: Optional[int] = None, quality: int = 90, image_format: str = 'jpeg', tile: int = 0,
+                 tile_overlap: float = 0.2, tile_merge: str = 'nms'):
+    """Returns detections, optionally with the annotated image.
+
+    The response format is `format` (json, multipart, msgpack or boxes) or is
+    negotiated from the Accept header, defaulting to JSON with a base64 image
+    (see src/formats.py). `annotated=false` skips drawing and encoding the image
+    altogether; the `boxes` format never includes it. The annotated image is
+    shrunk to at most `max_dim` pixels on its longer side and encoded as
+    `image_format` (jpeg or webp) at `quality`. `reduce` (2, 4 or 8)
+    decodes the upload at reduced resolution; boxes are still reported in
+    original image coordinates. `model` selects a registered model by name
+    (see GET /models). `tile` (pixels) predicts on overlapping tiles plus the
+    full frame, merged with `tile_merge` (nms or wbf), to find small objects in
+    high-resolution images.
+    """
+    _check_reduce(reduce)
+    _check_render(max_dim, quality, image_format)
+    tiling = _check_tiling(tile, tile_overlap, tile_merge)
     try:
-        os.remove(tmp_path)
-    except Exception:
-        pass
+        fmt = formats.negotiate(request.headers.get('accept'), fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if fmt == 'msgpack' and formats.msgpack is None:
+        raise HTTPException(status_code=406, detail='msgpack is not available on this server')
+    spec = _resolve_model(model)
+    async with pool.slot():
+        render = (max_dim, image_format, quality) if annotated and fmt != 'boxes' else None
+        _, dets, img_bytes = await _detect_bytes(await _read_upload(file), conf, reduce, spec, render, tiling)
 
-    return JSONResponse(response)
+    boxes = dets.copy()
+    boxes[:, :4] *= reduce
+    with stage(STAGE_SECONDS, 'serialize'):
+        body, media_type = formats.encode(fmt, boxes, img_bytes, IMAGE_FORMATS[image_format][1])
+    return Response(body, media_type=media_type,
+                    headers={'X-Model-Version': f'{spec.name}@{spec.version}', 'Vary': 'Accept'})
 
 
 @app.post('/detect/image')
-async def detect_return_image(file: UploadFile = File(...), conf: float = 0.25):
-    """Returns annotated image bytes (image/jpeg) so it can be displayed directly."""
-    if file.content_type.split('/')[0] != 'image':
-        raise HTTPException(status_code=400, detail='file must be an image')
+async def detect_return_image(file: UploadFile = File(...), conf: float = 0.25, reduce: int = 1,
+                              model: Optional[str] = None, max_dim: Optional[int] = None, quality: int = 90,
+                              image_format: str = 'jpeg', tile: int = 0, tile_overlap: float = 0.2,
+                              tile_merge: str = 'nms'):
+    """Returns the annotated image bytes (JPEG or WebP) so it can be displayed directly."""
+    _check_reduce(reduce)
+    _check_render(max_dim, quality, image_format)
+    tiling = _check_tiling(tile, tile_overlap, tile_merge)
+    spec = _resolve_model(model)
+    async with pool.slot():
+        render = (max_dim, image_format, quality)
+        _, _, img_bytes = await _detect_bytes(await _read_upload(file), conf, reduce, spec, render, tiling)
+    return Response(img_bytes, media_type=IMAGE_FORMATS[image_format][1],
+                    headers={'X-Model-Version': f'{spec.name}@{spec.version}'})
+
+
+async def _batch_inputs(files: List[UploadFile]) -> List[Tuple[str, bytes]]:
+    """(name, bytes) of every image part, with .zip / .tar(.gz) parts expanded."""
+    loop = asyncio.get_running_loop()
+    inputs = []
+    for file in files:
+        name = file.filename or f'image{len(inputs)}'
+        if is_archive(name):
+            with stage(STAGE_SECONDS, 'read'):
+                # stop one past the limit so an oversized archive is never held in memory
+                room = MAX_BATCH_IMAGES - len(inputs) + 1
+                try:
+                    inputs += await loop.run_in_executor(None, lambda f=file, n=name, k=room: list(itertools.islice(
+                        iter_archive(f.file, n, MAX_ARCHIVE_MEMBER_BYTES, MAX_ARCHIVE_BYTES), k)))
+                except ValueError as e:
+                    raise HTTPException(status_code=413, detail=str(e))
+        elif (file.content_type or '').split('/')[0] == 'image':
+            with stage(STAGE_SECONDS, 'read'):
+                inputs.append((name, await file.read()))
+        else:
+            raise HTTPException(status_code=400, detail=f'{name}: parts must be images or .zip/.tar archives')
+        if len(inputs) > MAX_BATCH_IMAGES:
+            raise HTTPException(status_code=413, detail=f'at most {MAX_BATCH_IMAGES} images per batch')
+    return inputs
+
 
-    suffix = os.path.splitext(file.filename)[1]
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp.flush()
-        tmp_path = tmp.name
+async def _detect_item(index: int, name: str, data: bytes, conf: float, reduce: int, spec: ModelSpec,
+                       limit: asyncio.Semaphore) -> dict:
+    async with limit:
+        try:
+            (h, w), dets, _ = await _detect_bytes(data, conf, reduce, spec)
+        except HTTPException as e:
+            return {'index': index, 'name': name, 'error': e.detail}
+    boxes = dets.copy()
+    boxes[:, :4] *= reduce
+    return {'index': index, 'name': name, 'width': w * reduce, 'height': h * reduce,
+            'boxes': [[round(v, 2) for v in row[:4]] + [round(row[4], 4), int(row[5])] for row in boxes.tolist()]}
 
-    results = model.predict(source=tmp_path, conf=conf, save=False)
-    r = results[0]
-    annotated_img = r.plot()
-    annotated_bgr = cv2.cvtColor(annotated_img, cv2.COLOR_RGB2BGR)
-    _, img_bytes = cv2.imencode('.jpg', annotated_bgr)
 
+@app.post('/detect/batch')
+async def detect_batch(files: List[UploadFile] = File(...), conf: float = 0.25, reduce: int = 1,
+                       model: Optional[str] = None, stream: bool = False):
+    """Detect objects in many images: several `files` parts and/or .zip/.tar(.gz) archives.
+
+    Images are fed to the batch scheduler together, so they share forward passes.
+    Every result is {index, name, width, height, boxes} with one [x1, y1, x2, y2,
+    conf, cls] row per box (or {index, name, error} for an undecodable image).
+    With `stream=true` results are sent as NDJSON lines in completion order as soon
+    as each is ready; otherwise one JSON object with all results in input order.
+    """
+    _check_reduce(reduce)
+    spec = _resolve_model(model)
+    headers = {'X-Model-Version': f'{spec.name}@{spec.version}'}
+    # a batch counts as one admitted request; the slot is held until the last result is sent
+    admitted = contextlib.AsyncExitStack()
+    await admitted.enter_async_context(pool.slot())
     try:
-        os.remove(tmp_path)
-    except Exception:
-        pass
+        inputs = await _batch_inputs(files)
+    except BaseException:
+        await admitted.aclose()
+        raise
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.ensure_future(_detect_item(i, name, data, conf, reduce, spec, limit))
+             for i, (name, data) in enumerate(inputs)]
+
+    if not stream:
+        async with admitted:
+            try:
+                results = await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+        return JSONResponse({'results': results}, headers=headers)
+
+    async def lines():
+        async with admitted:
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield json.dumps(await next_done) + '\n'
+            finally:
+                # client went away: drop the work that hasn't started yet
+                for task in tasks:
+                    task.cancel()
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson', headers=headers)
+
+
+async def _track_frame(tracker: Tracker, index: int, t: float, img: np.ndarray, conf: float, spec: ModelSpec,
+                       dropped: int) -> dict:
+    with stage(STAGE_SECONDS, 'infer'):
+        dets = await scheduler.submit(img, conf, spec)
+    tracked, new, ended = tracker.update(dets, t, index)
+    return frame_event(index, t, tracked, new, ended, dropped)
+
+
+def _check_stream_source(source: str) -> str:
+    if source.lower().startswith(STREAM_SCHEMES):
+        if not STREAM_URLS:
+            raise HTTPException(status_code=400, detail='stream URLs are disabled on this server')
+        return source
+    path = os.path.abspath(source)
+    if os.path.commonpath([path, STREAM_ROOT]) != STREAM_ROOT:
+        raise HTTPException(status_code=400, detail='source must be inside the stream root')
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f'source not found: {source}')
+    return path
+
+
+@app.get('/detect/stream/events')
+async def detect_stream_events(source: str, conf: float = 0.25, model: Optional[str] = None,
+                               realtime: bool = True):
+    """Server-sent events with the tracked detections of a video file or stream.
 
-    return StreamingResponse(iter([img_bytes.tobytes()]), media_type='image/jpeg')
+    Every processed frame is one `data:` event {frame, time, detections (each with
+    a `track` id), new, ended, dropped}; a final `end` event lists the tracks still
+    open. With `realtime` (the default) frames are decoded at the source's pace and
+    dropped when inference falls behind; `realtime=false` processes every frame of
+    a file as fast as possible.
+    """
+    spec = _resolve_model(model)
+    source = _check_stream_source(source)
+    headers = {'X-Model-Version': f'{spec.name}@{spec.version}', 'Cache-Control': 'no-cache'}
+    loop = asyncio.get_running_loop()
+    admitted = contextlib.AsyncExitStack()
+    await admitted.enter_async_context(pool.slot())
+    try:
+        reader = await loop.run_in_executor(None, FrameReader, source, realtime)
+    except ValueError as e:
+        await admitted.aclose()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        tracker = Tracker()
+        processed = 0
+        async with admitted:
+            try:
+                while True:
+                    item = await loop.run_in_executor(None, reader.read)
+                    if item is None:
+                        break
+                    t0 = time.perf_counter()
+                    event = await _track_frame(tracker, *item, conf, spec, reader.dropped)
+                    reader.report(time.perf_counter() - t0)
+                    processed += 1
+                    yield f'data: {json.dumps(event)}\n\n'
+                end = {'end': True, 'ended': tracker.flush(), 'processed': processed, 'dropped': reader.dropped}
+                yield f'event: end\ndata: {json.dumps(end)}\n\n'
+            finally:
+                await loop.run_in_executor(None, reader.close)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers=headers)
+
+
+@app.websocket('/detect/stream')
+async def detect_stream(websocket: WebSocket, conf: float = 0.25, model: Optional[str] = None):
+    """Tracked detections for frames pushed over a WebSocket.
+
+    The client sends every frame as a binary message (an encoded image) and gets
+    one JSON message per processed frame, as from /detect/stream/events. When frames
+    arrive faster than inference runs, only the newest waiting frame is processed
+    and `dropped` counts the skipped ones. Sending the text message "end" returns
+    the final {end, ended, processed, dropped} message and closes the socket.
+    """
+    try:
+        spec = registry.spec(model)
+    except KeyError as e:
+        await websocket.close(code=1008, reason=str(e.args[0]))
+        return
+    await websocket.accept()
+    start = time.monotonic()
+    latest = None
+    received = dropped = processed = 0
+    closing = None  # 'end' or 'disconnect'
+    wake = asyncio.Event()
+
+    async def receive():
+        nonlocal latest, received, dropped, closing
+        try:
+            while closing is None:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    closing = 'disconnect'
+                elif message.get('bytes') is not None:
+                    if latest is not None:
+                        dropped += 1  # newest frame wins
+                    latest = (received, time.monotonic() - start, message['bytes'])
+                    received += 1
+                elif message.get('text') == 'end':
+                    closing = 'end'
+                wake.set()
+        finally:
+            closing = closing or 'disconnect'
+            wake.set()
+
+    receiver = asyncio.ensure_future(receive())
+    tracker = Tracker()
+    try:
+        async with pool.slot():
+            while True:
+                await wake.wait()
+                wake.clear()
+                if closing == 'disconnect':
+                    break
+                if latest is None:
+                    if closing is None:
+                        continue
+                    break
+                (index, t, data), latest = latest, None
+                img = await pool.run(decode_image, data, 1)
+                if img is None:
+                    await websocket.send_json({'frame': index, 'error': 'could not decode image'})
+                else:
+                    await websocket.send_json(await _track_frame(tracker, index, t, img, conf, spec, dropped))
+                    processed += 1
+                wake.set()  # a frame may have arrived meanwhile
+            if closing == 'end':
+                await websocket.send_json({'end': True, 'ended': tracker.flush(), 'processed': processed,
+                                           'dropped': dropped})
+                await websocket.close()
+    except Overloaded:
+        await websocket.close(code=1013, reason='server overloaded')
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
@@ -1,69 +1,344 @@
-import base64
-from typing import Optional
+import asyncio
+import contextlib
+import itertools
+import json
+import mimetypes
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 import httpx
+import numpy as np
+
+try:
+    from . import formats
+except ImportError:
+    import formats
+
+# responses worth retrying: the server is overloaded (429) or its queue is full (503)
+RETRY_STATUS = (429, 503)
+
+_MAGIC = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+
+
+def guess_mime(filename: str = "", head: bytes = b"") -> str:
+    """MIME type from the first bytes of the file, falling back to its extension."""
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if filename.lower().endswith((".tar", ".tgz", ".gz")):
+        return "application/x-tar"
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def _file_part(file_path: Optional[str], file_bytes: Optional[bytes], filename: str,
+               stack: contextlib.ExitStack) -> tuple:
+    """(name, content, mime) for a multipart field; files are streamed, not read into memory."""
+    if file_path is None and file_bytes is None:
+        raise ValueError("Provide file_path or file_bytes")
+    if file_path:
+        f = stack.enter_context(open(file_path, "rb"))
+        head = f.read(16)
+        f.seek(0)
+        return os.path.basename(file_path), f, guess_mime(file_path, head)
+    return filename, file_bytes, guess_mime(filename, file_bytes[:16])
+
+
+def _retry_delay(resp: httpx.Response, attempt: int, backoff: float) -> float:
+    """Seconds to wait before retry number `attempt` (0-based): Retry-After if given, else exponential with jitter."""
+    try:
+        return float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return backoff * (2 ** attempt) * (0.5 + random.random())
 
 
 class PatternDetectClient:
-    """Simple synchronous client for the Truck Inspection API."""
+    """Simple synchronous client for the Truck Inspection API.
+
+    Requests answered with 429/503 are retried up to `retries` times, honouring
+    Retry-After. `detect_many()` runs detections in parallel on a thread pool
+    sharing this client's connection pool.
+    """
 
-    def __init__(self, base_url: str = "http://localhost:8000", timeout: float = 30.0):
+    def __init__(self, base_url: str = "http://localhost:8000", timeout: float = 30.0, retries: int = 3,
+                 backoff: float = 0.5, max_connections: int = 16):
         self.base = base_url.rstrip("/")
-        self.client = httpx.Client(timeout=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.Client(timeout=timeout, limits=httpx.Limits(max_connections=max_connections,
+                                                                        max_keepalive_connections=max_connections))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     def health(self) -> dict:
         resp = self.client.get(f"{self.base}/health")
         resp.raise_for_status()
         return resp.json()
 
+    def update_model(self, name: str, weights: str, backend: str = "auto") -> dict:
+        """POST /models/{name} — load `weights` (a path on the server) and publish them as model `name`."""
+        resp = self.client.post(f"{self.base}/models/{name}", json={"weights": weights, "backend": backend})
+        resp.raise_for_status()
+        return resp.json()
+
+    def _post(self, path: str, file_path: Optional[str], file_bytes: Optional[bytes], filename: str,
+              params: dict) -> httpx.Response:
+        return self._post_files(path, lambda stack: {"file": _file_part(file_path, file_bytes, filename, stack)},
+                                params)
+
+    def _post_files(self, path: str, make_files: Callable[[contextlib.ExitStack], Any],
+                    params: dict) -> httpx.Response:
+        """POST the multipart `make_files(stack)`, retrying 429/503 answers."""
+        for attempt in range(self.retries + 1):
+            # re-open the files on every attempt: a streamed upload can't be rewound
+            with contextlib.ExitStack() as stack:
+                resp = self.client.post(f"{self.base}{path}", files=make_files(stack), params=params)
+            if resp.status_code not in RETRY_STATUS or attempt == self.retries:
+                break
+            time.sleep(_retry_delay(resp, attempt, self.backoff))
+        resp.raise_for_status()
+        return resp
+
     def detect(self, file_path: Optional[str] = None, file_bytes: Optional[bytes] = None, filename: str = "image.jpg", conf: float = 0.25, annotated: bool = True) -> dict:
         """POST /detect — returns JSON with detections and optionally base64 annotated image."""
-        if file_path is None and file_bytes is None:
-            raise ValueError("Provide file_path or file_bytes")
-
-        files = None
-        if file_path:
-            with open(file_path, "rb") as f:
-                files = {"file": (file_path.split("/")[-1], f, "image/jpeg")}
-                params = {"conf": conf, "annotated": str(annotated).lower()}
-                resp = self.client.post(f"{self.base}/detect", files=files, params=params)
-        else:
-            files = {"file": (filename, file_bytes, "image/jpeg")}
-            params = {"conf": conf, "annotated": str(annotated).lower()}
-            resp = self.client.post(f"{self.base}/detect", files=files, params=params)
+        params = {"conf": conf, "annotated": str(annotated).lower()}
+        return self._post("/detect", file_path, file_bytes, filename, params).json()
 
-        resp.raise_for_status()
-        return resp.json()
+    def detect_many(self, file_paths: Iterable[str], workers: int = 8, **kwargs) -> Iterator[Tuple[str, Union[dict, Exception]]]:
+        """Run detect() for every path on `workers` threads; yields (path, result or exception) as they finish.
+
+        At most 2 * `workers` requests are queued at once; paths are pulled lazily as they complete.
+        """
+        paths = iter(file_paths)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for p in itertools.islice(paths, 2 * workers):
+                futures[pool.submit(self.detect, file_path=p, **kwargs)] = p
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    path = futures.pop(fut)
+                    for p in itertools.islice(paths, 1):
+                        futures[pool.submit(self.detect, file_path=p, **kwargs)] = p
+                    exc = fut.exception()
+                    yield path, exc if exc is not None else fut.result()
+
+    def detect_boxes(self, file_path: Optional[str] = None, file_bytes: Optional[bytes] = None,
+                     filename: str = "image.jpg", conf: float = 0.25, annotated: bool = False, fmt: str = "boxes",
+                     model: Optional[str] = None) -> Tuple[np.ndarray, Optional[bytes]]:
+        """POST /detect in a compact format; returns ((N, 6) float32 boxes, annotated JPEG bytes or None).
+
+        `fmt` is one of 'boxes' (raw float32 array, no image), 'msgpack',
+        'multipart' or 'json' (see src/formats.py).
+        """
+        params = {"conf": conf, "annotated": str(annotated).lower(), "format": fmt}
+        if model:
+            params["model"] = model
+        resp = self._post("/detect", file_path, file_bytes, filename, params)
+        return formats.decode(resp.headers["content-type"], resp.content)
 
     def detect_and_save_annotated(self, out_path: str, **kwargs) -> dict:
-        """Call detect() and save the returned annotated image (if present) to out_path."""
-        data = self.detect(**kwargs)
-        b64 = data.get("annotated_image_base64")
-        if b64:
-            img = base64.b64decode(b64)
+        """Detect and save the annotated image to out_path; returns {'detections': [...]}.
+
+        The image is fetched as a raw multipart part rather than base64 JSON, and is
+        only written to `out_path`: unlike detect(), the result has no
+        'annotated_image_base64' key.
+        """
+        kwargs.pop("annotated", None)
+        boxes, img = self.detect_boxes(annotated=True, fmt="multipart", **kwargs)
+        if img:
             with open(out_path, "wb") as f:
                 f.write(img)
-        return data
+        return {"detections": formats.detections_json(boxes)}
 
     def detect_image_bytes(self, file_path: Optional[str] = None, file_bytes: Optional[bytes] = None, filename: str = "image.jpg", conf: float = 0.25) -> bytes:
         """POST /detect/image — returns raw JPEG bytes (annotated)."""
-        if file_path is None and file_bytes is None:
-            raise ValueError("Provide file_path or file_bytes")
+        return self._post("/detect/image", file_path, file_bytes, filename, {"conf": conf}).content
 
-        if file_path:
-            with open(file_path, "rb") as f:
-                files = {"file": (file_path.split("/")[-1], f, "image/jpeg")}
-                resp = self.client.post(f"{self.base}/detect/image", files=files, params={"conf": conf})
-        else:
-            files = {"file": (filename, file_bytes, "image/jpeg")}
-            resp = self.client.post(f"{self.base}/detect/image", files=files, params={"conf": conf})
+    def detect_batch(self, files: Sequence[Union[str, Tuple[str, bytes]]], conf: float = 0.25,
+                     model: Optional[str] = None, stream: bool = False) -> Union[List[dict], Iterator[dict]]:
+        """POST /detect/batch — detections for many images in one request.
 
-        resp.raise_for_status()
-        return resp.content
+        `files` are paths or (filename, bytes) pairs; .zip / .tar(.gz) archives of
+        images are expanded by the server. Returns the results in input order, or
+        with `stream=True` an iterator yielding each result as soon as the server
+        has it (completion order; use the `index` key to match inputs).
+        """
+        params = {"conf": conf, "stream": str(stream).lower()}
+        if model:
+            params["model"] = model
+        files = list(files)  # every retry uploads them again
+        if not stream:
+            return self._post_files("/detect/batch", lambda stack: self._batch_parts(files, stack),
+                                    params).json()["results"]
+        return self._stream_batch(files, params)
+
+    def _stream_batch(self, files, params) -> Iterator[dict]:
+        # 429/503 arrive before any result line, so a retry never repeats results already yielded
+        for attempt in range(self.retries + 1):
+            with contextlib.ExitStack() as stack:
+                parts = self._batch_parts(files, stack)
+                with self.client.stream("POST", f"{self.base}/detect/batch", files=parts, params=params) as resp:
+                    if resp.status_code in RETRY_STATUS and attempt < self.retries:
+                        delay = _retry_delay(resp, attempt, self.backoff)
+                    else:
+                        resp.raise_for_status()
+                        for line in resp.iter_lines():
+                            if line:
+                                yield json.loads(line)
+                        return
+            time.sleep(delay)
+
+    @staticmethod
+    def _batch_parts(files, stack: contextlib.ExitStack) -> list:
+        parts = []
+        for item in files:
+            if isinstance(item, str):
+                parts.append(("files", _file_part(item, None, "", stack)))
+            else:
+                parts.append(("files", _file_part(None, item[1], item[0], stack)))
+        return parts
 
     def close(self):
         self.client.close()
 
 
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx[http2])
+        return True
+    except ImportError:
+        return False
+
+
+class AsyncPatternDetectClient:
+    """Asyncio client for pushing many images at the API.
+
+    One `httpx.AsyncClient` with a bounded, keep-alive connection pool (HTTP/2
+    when the `h2` package is installed and the server or proxy speaks it) is
+    shared by all calls. Uploads are streamed from disk, and 429/503 answers
+    are retried with backoff, honouring Retry-After.
+
+        async with AsyncPatternDetectClient("http://localhost:8000") as client:
+            async for path, result in client.detect_many(paths, concurrency=16, annotated=False):
+                ...
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8000", timeout: float = 30.0, retries: int = 3,
+                 backoff: float = 0.5, max_connections: int = 16, http2: Optional[bool] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            timeout=timeout, transport=transport,
+            http2=_http2_available() if http2 is None else http2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def health(self) -> dict:
+        resp = await self.client.get(f"{self.base}/health")
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _post(self, path: str, file_path: Optional[str], file_bytes: Optional[bytes], filename: str,
+                    params: dict) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            with contextlib.ExitStack() as stack:
+                files = {"file": _file_part(file_path, file_bytes, filename, stack)}
+                resp = await self.client.post(f"{self.base}{path}", files=files, params=params)
+            if resp.status_code not in RETRY_STATUS or attempt == self.retries:
+                break
+            await asyncio.sleep(_retry_delay(resp, attempt, self.backoff))
+        resp.raise_for_status()
+        return resp
+
+    async def detect(self, file_path: Optional[str] = None, file_bytes: Optional[bytes] = None,
+                     filename: str = "image.jpg", conf: float = 0.25, annotated: bool = True,
+                     model: Optional[str] = None) -> dict:
+        """POST /detect — same response as PatternDetectClient.detect()."""
+        params = {"conf": conf, "annotated": str(annotated).lower()}
+        if model:
+            params["model"] = model
+        return (await self._post("/detect", file_path, file_bytes, filename, params)).json()
+
+    async def detect_boxes(self, file_path: Optional[str] = None, file_bytes: Optional[bytes] = None,
+                           filename: str = "image.jpg", conf: float = 0.25, annotated: bool = False,
+                           fmt: str = "boxes", model: Optional[str] = None) -> Tuple[np.ndarray, Optional[bytes]]:
+        """Same as PatternDetectClient.detect_boxes()."""
+        params = {"conf": conf, "annotated": str(annotated).lower(), "format": fmt}
+        if model:
+            params["model"] = model
+        resp = await self._post("/detect", file_path, file_bytes, filename, params)
+        return formats.decode(resp.headers["content-type"], resp.content)
+
+    async def detect_image_bytes(self, file_path: Optional[str] = None, file_bytes: Optional[bytes] = None,
+                                 filename: str = "image.jpg", conf: float = 0.25) -> bytes:
+        return (await self._post("/detect/image", file_path, file_bytes, filename, {"conf": conf})).content
+
+    async def detect_many(self, file_paths: Iterable[str], concurrency: int = 8,
+                          **kwargs) -> AsyncIterator[Tuple[str, Union[dict, Exception]]]:
+        """Detect every path with at most `concurrency` requests in flight.
+
+        Yields (path, result or exception) in completion order. Paths are pulled
+        lazily, so `file_paths` can be a generator over millions of files.
+        """
+        paths = iter(file_paths)
+        done: asyncio.Queue = asyncio.Queue(maxsize=2 * concurrency)
+        finished = object()
+
+        async def worker():
+            try:
+                for path in paths:
+                    try:
+                        result = await self.detect(file_path=path, **kwargs)
+                    except (httpx.HTTPError, OSError) as e:
+                        result = e
+                    await done.put((path, result))
+            except Exception as e:  # e.g. the paths generator failed: surface it in the consumer
+                await done.put(e)
+                return
+            await done.put(finished)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        running = len(workers)
+        try:
+            while running:
+                item = await done.get()
+                if item is finished:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
 # Convenience: context manager support
 class _ClientCtx:
     def __init__(self, base_url: str = "http://localhost:8000"):
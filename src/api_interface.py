@@ -1,8 +1,8 @@
 import streamlit as st
 from api_client import PatternDetectClient
+from formats import detections_json
 import io
 from PIL import Image
-import base64
 
 st.set_page_config(page_title="API Interface — Truck PoC", layout="centered")
 st.title("Truck Inspection — REST API Interface")
@@ -14,7 +14,7 @@ client = PatternDetectClient(base_url.rstrip("/"))
 with st.form("detect_form"):
     uploaded = st.file_uploader("Upload image", type=["jpg", "jpeg", "png"]) 
     conf = st.slider("Confidence threshold", min_value=0.0, max_value=1.0, value=0.25, step=0.01)
-    endpoint = st.radio("Endpoint", options=["/detect (JSON + base64)", "/detect/image (raw JPEG)"])
+    endpoint = st.radio("Endpoint", options=["/detect (JSON + raw JPEG, multipart)", "/detect/image (raw JPEG)"])
     submit = st.form_submit_button("Run")
 
 if submit:
@@ -30,12 +30,11 @@ if submit:
                 st.error(f"API error: {e}")
         else:
             try:
-                data = client.detect(file_bytes=img_bytes, filename=uploaded.name, conf=conf, annotated=True)
+                boxes, img = client.detect_boxes(file_bytes=img_bytes, filename=uploaded.name, conf=conf,
+                                                 annotated=True, fmt="multipart")
                 st.subheader("Detections (JSON)")
-                st.json(data.get("detections", []))
-                b64 = data.get("annotated_image_base64")
-                if b64:
-                    img = base64.b64decode(b64)
+                st.json(detections_json(boxes))
+                if img:
                     st.image(img, caption="Annotated image (from API)")
             except Exception as e:
                 st.error(f"API error: {e}")
@@ -0,0 +1,334 @@
+"""Augmentation: composable image + box transforms, applied lazily or written as shards.
+
+Transforms work on a BGR image and an (N, 5) array of cls, x1, y1, x2, y2 boxes in
+pixels. Each transform updates the whole label array at once. A pipeline is built
+from a spec string:
+
+    hflip[=p]  vflip[=p]  scale[=lo:hi]  crop[=min_fraction:min_visibility]  color[=hue:saturation:value]
+
+e.g. "hflip,scale=0.75:1.25,crop=0.6,color". There are three ways to use one:
+
+- `AugmentedDataset` produces augmented samples on demand (deterministic per index
+  and seed). `stream()` produces them on a process pool, so nothing is written to disk.
+- `augment_dataset()` / the CLI writes `copies` augmented versions of every image
+  as YOLO shards (<out>/images/shard-0000, <out>/labels/shard-0000), one shard per
+  worker job, as lossless PNG by default:
+      python src/augment.py --images data/dataset/images/train --labels data/dataset/labels/train --out data/dataset/aug --transforms hflip,scale,color --copies 2
+- `Compose.to_ultralytics()` maps a pipeline onto Ultralytics' own on-the-fly
+  augmentation settings (`python src/train.py --augment hflip,scale,color`). This
+  augments every epoch during training without materialising anything; `crop` has
+  no Ultralytics equivalent and is rejected there.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Pool
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    from .sources import batched, is_image, list_sources
+    from .utils import ensure_dir, write_text_atomic
+except ImportError:
+    from sources import batched, is_image, list_sources
+    from utils import ensure_dir, write_text_atomic
+
+NO_BOXES = np.zeros((0, 5), dtype=np.float32)
+
+
+# --- labels ------------------------------------------------------------------------
+
+def load_labels(path: str) -> np.ndarray:
+    """(N, 5) cls, cx, cy, w, h (normalised) from a YOLO label file; empty if it's missing."""
+    if not os.path.exists(path):
+        return NO_BOXES.copy()
+    with open(path) as f:
+        rows = [line.split()[:5] for line in f if len(line.split()) >= 5]
+    return np.asarray(rows, dtype=np.float32).reshape(-1, 5)
+
+
+def yolo_to_xyxy(labels: np.ndarray, w: int, h: int) -> np.ndarray:
+    cls, cx, cy, bw, bh = labels.T
+    return np.stack([cls, (cx - bw / 2) * w, (cy - bh / 2) * h, (cx + bw / 2) * w, (cy + bh / 2) * h], 1)
+
+
+def xyxy_to_yolo(boxes: np.ndarray, w: int, h: int) -> np.ndarray:
+    cls, x1, y1, x2, y2 = boxes.T
+    return np.stack([cls, (x1 + x2) / 2 / w, (y1 + y2) / 2 / h, (x2 - x1) / w, (y2 - y1) / h], 1)
+
+
+def format_labels(labels: np.ndarray) -> str:
+    return '\n'.join(f"{int(c)} {cx:.6f} {cy:.6f} {bw:.6f} {bh:.6f}" for c, cx, cy, bw, bh in labels.tolist())
+
+
+def hflip_labels(labels: np.ndarray) -> np.ndarray:
+    """Mirror normalised YOLO labels horizontally (cx -> 1 - cx)."""
+    out = labels.copy()
+    out[:, 1] = 1.0 - out[:, 1]
+    return out
+
+
+def crop_boxes(boxes: np.ndarray, x0: int, y0: int, w: int, h: int, min_visibility: float = 0.3) -> np.ndarray:
+    """Boxes in the coordinates of the crop (x0, y0, w, h), clipped to it.
+
+    Boxes keeping less than `min_visibility` of their area are dropped.
+    """
+    shifted = boxes[:, 1:5] - np.array([x0, y0, x0, y0], dtype=boxes.dtype)
+    clipped = np.clip(shifted, 0, [w, h, w, h])
+    area = (shifted[:, 2] - shifted[:, 0]) * (shifted[:, 3] - shifted[:, 1])
+    visible = (clipped[:, 2] - clipped[:, 0]) * (clipped[:, 3] - clipped[:, 1])
+    keep = (visible > 0) & (visible >= min_visibility * area)
+    return np.concatenate([boxes[keep, :1], clipped[keep]], 1)
+
+
+# --- transforms --------------------------------------------------------------------
+
+class Transform:
+    """Applied with probability `p`; subclasses implement apply(img, boxes, rng)."""
+    p = 1.0
+
+    def __call__(self, img: np.ndarray, boxes: np.ndarray, rng: np.random.Generator):
+        if self.p >= 1.0 or rng.random() < self.p:
+            return self.apply(img, boxes, rng)
+        return img, boxes
+
+    def apply(self, img, boxes, rng):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{k}={v}' for k, v in vars(self).items())})"
+
+
+class HFlip(Transform):
+    def __init__(self, p: float = 0.5):
+        self.p = p
+
+    def apply(self, img, boxes, rng):
+        w = img.shape[1]
+        boxes = boxes.copy()
+        boxes[:, [1, 3]] = w - boxes[:, [3, 1]]
+        return cv2.flip(img, 1), boxes
+
+
+class VFlip(Transform):
+    def __init__(self, p: float = 0.5):
+        self.p = p
+
+    def apply(self, img, boxes, rng):
+        h = img.shape[0]
+        boxes = boxes.copy()
+        boxes[:, [2, 4]] = h - boxes[:, [4, 2]]
+        return cv2.flip(img, 0), boxes
+
+
+class RandomScale(Transform):
+    def __init__(self, lo: float = 0.75, hi: float = 1.25):
+        self.lo, self.hi = lo, hi
+
+    def apply(self, img, boxes, rng):
+        s = rng.uniform(self.lo, self.hi)
+        h, w = img.shape[:2]
+        nw, nh = max(1, round(w * s)), max(1, round(h * s))
+        img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_AREA if s < 1 else cv2.INTER_LINEAR)
+        boxes = boxes.copy()
+        boxes[:, 1:5] *= np.array([nw / w, nh / h, nw / w, nh / h], dtype=boxes.dtype)
+        return img, boxes
+
+
+class RandomCrop(Transform):
+    def __init__(self, min_fraction: float = 0.6, min_visibility: float = 0.3, p: float = 0.5):
+        self.min_fraction, self.min_visibility, self.p = min_fraction, min_visibility, p
+
+    def apply(self, img, boxes, rng):
+        h, w = img.shape[:2]
+        f = rng.uniform(self.min_fraction, 1.0)
+        ch, cw = max(1, int(h * f)), max(1, int(w * f))
+        y0, x0 = int(rng.integers(0, h - ch + 1)), int(rng.integers(0, w - cw + 1))
+        # a view: the crop itself copies nothing
+        return img[y0:y0 + ch, x0:x0 + cw], crop_boxes(boxes, x0, y0, cw, ch, self.min_visibility)
+
+
+class ColorJitter(Transform):
+    """Random hue / saturation / value gains, applied through lookup tables (boxes unchanged)."""
+
+    def __init__(self, hue: float = 0.015, saturation: float = 0.7, value: float = 0.4):
+        self.hue, self.saturation, self.value = hue, saturation, value
+
+    def apply(self, img, boxes, rng):
+        gains = rng.uniform(-1, 1, 3) * [self.hue, self.saturation, self.value] + 1
+        hue, sat, val = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+        x = np.arange(256, dtype=np.float32)
+        lut_hue = ((x * gains[0]) % 180).astype(np.uint8)
+        lut_sat = np.clip(x * gains[1], 0, 255).astype(np.uint8)
+        lut_val = np.clip(x * gains[2], 0, 255).astype(np.uint8)
+        hsv = cv2.merge((cv2.LUT(hue, lut_hue), cv2.LUT(sat, lut_sat), cv2.LUT(val, lut_val)))
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR), boxes
+
+
+TRANSFORMS = {'hflip': HFlip, 'vflip': VFlip, 'scale': RandomScale, 'crop': RandomCrop, 'color': ColorJitter}
+
+
+class Compose:
+    def __init__(self, transforms: Sequence[Transform]):
+        self.transforms = list(transforms)
+
+    def __call__(self, img: np.ndarray, boxes: np.ndarray, rng: np.random.Generator):
+        for t in self.transforms:
+            img, boxes = t(img, boxes, rng)
+        return np.ascontiguousarray(img), boxes
+
+    def __repr__(self):
+        return f"Compose({self.transforms})"
+
+    def to_ultralytics(self) -> dict:
+        """The matching Ultralytics training hyperparameters (transforms not in the pipeline are switched off).
+
+        Raises ValueError for transforms Ultralytics has no equivalent for: its `translate`
+        shifts the image rather than cropping it, so `crop` only works offline.
+        """
+        hyp = {'fliplr': 0.0, 'flipud': 0.0, 'scale': 0.0, 'translate': 0.0, 'hsv_h': 0.0, 'hsv_s': 0.0,
+               'hsv_v': 0.0}
+        for t in self.transforms:
+            if isinstance(t, HFlip):
+                hyp['fliplr'] = t.p
+            elif isinstance(t, VFlip):
+                hyp['flipud'] = t.p
+            elif isinstance(t, RandomScale):
+                hyp['scale'] = max(1 - t.lo, t.hi - 1)
+            elif isinstance(t, RandomCrop):
+                raise ValueError("crop is not expressible as Ultralytics hyperparameters; "
+                                 "write augmented copies with src/augment.py instead")
+            elif isinstance(t, ColorJitter):
+                hyp.update(hsv_h=t.hue, hsv_s=t.saturation, hsv_v=t.value)
+        return hyp
+
+
+def parse_pipeline(spec: str) -> Compose:
+    """Build a Compose from e.g. "hflip,scale=0.75:1.25,crop=0.6,color" (see the module docstring)."""
+    transforms = []
+    for item in filter(None, (s.strip() for s in spec.split(','))):
+        name, _, args = item.partition('=')
+        if name not in TRANSFORMS:
+            raise ValueError(f"unknown transform {name!r}; expected one of {sorted(TRANSFORMS)}")
+        transforms.append(TRANSFORMS[name](*(float(a) for a in args.split(':') if a)))
+    return Compose(transforms)
+
+
+# --- datasets ----------------------------------------------------------------------
+
+def _label_for(image_path: str, images_dir: str, labels_dir: str) -> str:
+    rel = os.path.relpath(image_path, images_dir)
+    return os.path.join(labels_dir, os.path.splitext(rel)[0] + '.txt')
+
+
+def augment_sample(pipeline: Compose, image_path: str, label_path: str,
+                   rng: np.random.Generator) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """(augmented image, normalised YOLO labels) for one image, or None if it can't be read."""
+    img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    img, boxes = pipeline(img, yolo_to_xyxy(load_labels(label_path), w, h), rng)
+    return img, xyxy_to_yolo(boxes, img.shape[1], img.shape[0]).astype(np.float32)
+
+
+class AugmentedDataset:
+    """`copies` augmented versions of every image of `images_dir`, produced on demand.
+
+    Sample i is always the same for a given `seed` (copy i % copies of image i // copies),
+    so epochs and workers are reproducible. Items are (image, labels) with labels as
+    normalised (N, 5) cls, cx, cy, w, h; unreadable images give None.
+    """
+
+    def __init__(self, images_dir: str, labels_dir: str, pipeline: Compose, copies: int = 1, seed: int = 0):
+        self.images = [p for p in list_sources(images_dir, recursive=True) if is_image(p)]
+        self.labels = [_label_for(p, images_dir, labels_dir) for p in self.images]
+        self.pipeline = pipeline
+        self.copies = copies
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.images) * self.copies
+
+    def __getitem__(self, i: int):
+        k = i // self.copies
+        rng = np.random.default_rng([self.seed, i])
+        return augment_sample(self.pipeline, self.images[k], self.labels[k], rng)
+
+    def stream(self, workers: Optional[int] = None, chunksize: int = 8) -> Iterator:
+        """Yield every sample in order, augmented on a pool of `workers` processes."""
+        with Pool(workers, initializer=_set_dataset, initargs=(self,)) as pool:
+            yield from pool.imap(_dataset_item, range(len(self)), chunksize)
+
+
+_dataset: Optional[AugmentedDataset] = None
+
+
+def _set_dataset(dataset):
+    # sent to each worker once, instead of pickling the dataset with every task
+    global _dataset
+    _dataset = dataset
+
+
+def _dataset_item(i):
+    return _dataset[i]
+
+
+def _write_shard(dataset: AugmentedDataset, shard: int, indices: List[int], out_dir: str, ext: str,
+                 quality: int) -> int:
+    image_dir = os.path.join(out_dir, 'images', f'shard-{shard:04d}')
+    label_dir = os.path.join(out_dir, 'labels', f'shard-{shard:04d}')
+    ensure_dir(image_dir)
+    ensure_dir(label_dir)
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if ext in ('.jpg', '.jpeg') else []
+    written = 0
+    for i in indices:
+        sample = dataset[i]
+        if sample is None:
+            continue
+        img, labels = sample
+        k = i // dataset.copies
+        name = f"{k:06d}_{os.path.splitext(os.path.basename(dataset.images[k]))[0]}_{i % dataset.copies}"
+        cv2.imwrite(os.path.join(image_dir, name + ext), img, params)
+        write_text_atomic(os.path.join(label_dir, name + '.txt'), format_labels(labels))
+        written += 1
+    return written
+
+
+def augment_dataset(images_dir: str, labels_dir: str, out_dir: str, pipeline: Compose, copies: int = 1,
+                    seed: int = 0, workers: Optional[int] = None, shard_size: int = 500, ext: str = '.png',
+                    quality: int = 95) -> int:
+    """Write `copies` augmented versions of every image as YOLO shards under `out_dir`; returns the count."""
+    dataset = AugmentedDataset(images_dir, labels_dir, pipeline, copies, seed)
+    shards = list(batched(range(len(dataset)), shard_size))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_write_shard, dataset, s, indices, out_dir, ext, quality)
+                   for s, indices in enumerate(shards)]
+        return sum(f.result() for f in futures)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write augmented copies of a YOLO dataset as shards')
+    parser.add_argument('--images', required=True)
+    parser.add_argument('--labels', required=True)
+    parser.add_argument('--out', required=True, help='output root (images/ and labels/ shards)')
+    parser.add_argument('--transforms', default='hflip,scale,crop,color', help='pipeline spec, see module doc')
+    parser.add_argument('--copies', type=int, default=1, help='augmented versions per image')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: all CPUs)')
+    parser.add_argument('--shard-size', type=int, default=500, help='images per shard / worker job')
+    parser.add_argument('--format', default='png', choices=['png', 'jpg'], help='png is lossless')
+    parser.add_argument('--quality', type=int, default=95, help='JPEG quality')
+    args = parser.parse_args(argv)
+
+    pipeline = parse_pipeline(args.transforms)
+    n = augment_dataset(args.images, args.labels, args.out, pipeline, args.copies, args.seed, args.workers,
+                        args.shard_size, '.' + args.format, args.quality)
+    print(f"Wrote {n} augmented images ({pipeline}) to {os.path.join(args.out, 'images')}; "
+          f"add that folder to the train list in dataset.yaml")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,41 @@
 """Simple augmentation: horizontal flip images and adjust YOLO-format labels (cx -> 1 - cx)
 Usage:
-  python src/augment_flip.py --src data/dataset/images/train --labels data/dataset/labels/train --out images_aug
-This will create augmented images and labels under the same folder named with suffix `_flip`.
+  python src/augment_flip.py --src data/dataset/images/train --labels data/dataset/labels/train
+This will create augmented images and labels under the same folder named with suffix `_flip`
+(<src>_flip/<name>_flip.jpg and <labels>_flip/<name>_flip.txt). For other transforms, or
+sharded output, use `src/augment.py`; `src/train.py --augment hflip` flips on the fly
+without writing copies.
 """
 import argparse
-import cv2
-import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import cv2
+import numpy as np
+
+from augment import format_labels, hflip_labels, load_labels
+
 
 def flip_yolo_label_line(line):
     parts = line.strip().split()
     if len(parts) < 5:
         return line
-    cls = parts[0]
-    cx = float(parts[1])
-    cy = float(parts[2])
-    w = parts[3]
-    h = parts[4]
-    cx_flipped = 1.0 - cx
-    return f"{cls} {cx_flipped:.6f} {cy:.6f} {w} {h}"
+    return format_labels(hflip_labels(np.asarray([parts[:5]], dtype=np.float32)))
 
 
-def main(images_dir, labels_dir):
+def _flip_one(img_path: Path, labels_dir: Path, out_images_dir: Path, out_labels_dir: Path) -> bool:
+    img = cv2.imread(str(img_path))
+    if img is None:
+        return False
+    cv2.imwrite(str(out_images_dir / (img_path.stem + '_flip' + img_path.suffix)), cv2.flip(img, 1))
+    label_path = labels_dir / (img_path.stem + '.txt')
+    if label_path.exists():
+        (out_labels_dir / (img_path.stem + '_flip.txt')).write_text(
+            format_labels(hflip_labels(load_labels(str(label_path)))))
+    return True
+
+
+def main(images_dir, labels_dir, workers=None):
     images_dir = Path(images_dir)
     labels_dir = Path(labels_dir)
     out_images_dir = images_dir.parent / (images_dir.name + '_flip')
@@ -30,27 +43,18 @@ def main(images_dir, labels_dir):
     out_images_dir.mkdir(parents=True, exist_ok=True)
     out_labels_dir.mkdir(parents=True, exist_ok=True)
 
-    for img_path in images_dir.glob('*.jpg'):
-        img = cv2.imread(str(img_path))
-        if img is None:
-            continue
-        flipped = cv2.flip(img, 1)
-        out_img_name = img_path.stem + '_flip' + img_path.suffix
-        cv2.imwrite(str(out_images_dir / out_img_name), flipped)
-
-        label_path = labels_dir / (img_path.stem + '.txt')
-        out_label_path = out_labels_dir / (img_path.stem + '_flip.txt')
-        if label_path.exists():
-            lines = label_path.read_text().strip().splitlines()
-            flipped_lines = [flip_yolo_label_line(l) for l in lines if l.strip()]
-            out_label_path.write_text('\n'.join(flipped_lines))
-
-    print(f"Augmented images written to {out_images_dir}; labels to {out_labels_dir}")
+    paths = sorted(images_dir.glob('*.jpg'))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        n = sum(pool.map(_flip_one, paths, [labels_dir] * len(paths), [out_images_dir] * len(paths),
+                         [out_labels_dir] * len(paths), chunksize=32))
+    print(f"{n} augmented images written to {out_images_dir}; labels to {out_labels_dir}")
+    return n
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--src', required=True, help='images folder')
     parser.add_argument('--labels', required=True, help='labels folder')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: all CPUs)')
     args = parser.parse_args()
-    main(args.src, args.labels)
+    main(args.src, args.labels, args.workers)
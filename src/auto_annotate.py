@@ -1,47 +1,130 @@
 """Auto-annotate images using pretrained YOLO and write YOLO-format label files.
 Usage:
     python src/auto_annotate.py --images data/dataset/images/train --labels data/dataset/labels/train
+
+Images (.jpg, .jpeg, .png, .bmp, .webp, .tif) are found in nested folders too and
+their labels mirror the folder structure. Decoding runs on background threads while
+the model predicts in batches, and every label file is written atomically.
+
+Re-runs are incremental: an image is skipped when its label is newer than the image
+and was written by the same model (weights hash) and settings, as recorded in
+<labels>/.auto_annotate.json. --force re-annotates everything. By default every box
+gets class 0 (one-class fine-tuning PoC); --keep-classes keeps the model's class ids.
+
+--images may be a packed dataset (see src/packed.py): images are decoded straight
+from its memory-mapped shards and labels are written to --labels as usual.
 """
 import argparse
+import hashlib
+import json
 import os
-from ultralytics import YOLO
-from pathlib import Path
+import time
+
+import numpy as np
+
+from engine import BACKENDS, DEFAULT_BACKEND, DEFAULT_MODEL
+from packed import PackedDataset, is_pack
+from registry import file_sha256, get_engine
+from sources import batched, is_image, iter_frames, list_sources
+from utils import write_text_atomic
+
+STATE_FILE = '.auto_annotate.json'
+
+
+def yolo_lines(dets: np.ndarray, img_w: int, img_h: int, keep_classes: bool = False) -> str:
+    """YOLO label text (cls cx cy w h, normalised) for (N, 6) detections."""
+    if not len(dets):
+        return ''
+    x1, y1, x2, y2 = dets[:, :4].T.astype(np.float64)
+    cls = dets[:, 5].astype(int) if keep_classes else np.zeros(len(dets), dtype=int)
+    rows = zip(cls.tolist(), ((x1 + x2) / 2 / img_w).tolist(), ((y1 + y2) / 2 / img_h).tolist(),
+               ((x2 - x1) / img_w).tolist(), ((y2 - y1) / img_h).tolist())
+    return '\n'.join(f"{c} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}" for c, cx, cy, w, h in rows)
+
+
+def label_path(image_path: str, images_dir: str, labels_dir: str) -> str:
+    rel = os.path.relpath(image_path, images_dir)
+    return os.path.join(labels_dir, os.path.splitext(rel)[0] + '.txt')
 
 
-def xyxy_to_yolo(xyxy, img_w, img_h):
-    x1, y1, x2, y2 = xyxy
-    cx = (x1 + x2) / 2.0 / img_w
-    cy = (y1 + y2) / 2.0 / img_h
-    w = (x2 - x1) / img_w
-    h = (y2 - y1) / img_h
-    return cx, cy, w, h
+def settings_key(model_path: str, conf: float, keep_classes: bool, backend: str) -> str:
+    """Identifies the labels a model + settings produce; a change means every label is stale."""
+    model_id = file_sha256(model_path) if os.path.exists(model_path) else model_path
+    return hashlib.sha256(json.dumps([model_id, conf, keep_classes, backend]).encode()).hexdigest()[:16]
 
 
-def main(images_dir, labels_dir, conf=0.25, model_path='yolov8n.pt'):
-    model = YOLO(model_path)
+def _load_state(labels_dir: str) -> dict:
+    try:
+        with open(os.path.join(labels_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_current(image: str, label: str, labels_dir: str, key: str, state: dict, mtime=os.path.getmtime) -> bool:
+    if state.get(os.path.relpath(label, labels_dir)) != key:
+        return False
+    try:
+        return os.path.getmtime(label) >= mtime(image)
+    except OSError:
+        return False
+
+
+def main(images_dir, labels_dir, conf=0.25, model_path=DEFAULT_MODEL, backend=DEFAULT_BACKEND, batch_size=16,
+         workers=4, keep_classes=False, force=False, log_every=10.0):
+    engine = get_engine(model_path, backend)
     os.makedirs(labels_dir, exist_ok=True)
 
-    images = list(Path(images_dir).glob('*.jpg')) + list(Path(images_dir).glob('*.png'))
+    if is_pack(images_dir):
+        # images inside a pack all date from when it was written
+        pack = PackedDataset(images_dir)
+        images, read, mtime = pack.paths, pack.decode, lambda _: pack.mtime
+    else:
+        images = [p for p in list_sources(images_dir, recursive=True) if is_image(p)]
+        read, mtime = None, os.path.getmtime
     if not images:
         print('No images found in', images_dir)
-        return
-
-    for img_path in images:
-        print('Annotating', img_path.name)
-        res = model.predict(source=str(img_path), conf=conf, save=False)
-        r = res[0]
-        img = r.orig_img
-        h, w = img.shape[:2]
-        label_path = Path(labels_dir) / (img_path.stem + '.txt')
-        lines = []
-        for box in r.boxes:
-            # Map all detections to a single class (0) for quick fine-tuning PoC
-            cls = 0
-            xyxy = box.xyxy[0].tolist()
-            cx, cy, bw, bh = xyxy_to_yolo(xyxy, w, h)
-            lines.append(f"{cls} {cx:.6f} {cy:.6f} {bw:.6f} {bh:.6f}")
-        label_path.write_text('\n'.join(lines))
-    print('Done')
+        return {'annotated': 0, 'skipped': 0, 'unreadable': 0, 'seconds': 0.0}
+
+    key = settings_key(model_path, conf, keep_classes, backend)
+    # state: label path relative to labels_dir -> settings key that wrote it
+    state = {} if force else _load_state(labels_dir)
+    labels = {img: label_path(img, images_dir, labels_dir) for img in images}
+    todo = [img for img in images if not _is_current(img, labels[img], labels_dir, key, state, mtime)]
+    skipped = len(images) - len(todo)
+    if skipped:
+        print(f'Skipping {skipped} images with up-to-date labels')
+
+    def save_state():
+        write_text_atomic(os.path.join(labels_dir, STATE_FILE), json.dumps(state))
+
+    annotated = unreadable = 0
+    t0 = last_log = time.perf_counter()
+    try:
+        for batch in batched(iter_frames(todo, workers=workers, prefetch=2 * batch_size, read=read), batch_size):
+            readable = [(path, img) for path, img in batch if img is not None]
+            results = engine.predict([img for _, img in readable], conf=conf) if readable else []
+            for (path, img), dets in zip(readable, results):
+                h, w = img.shape[:2]
+                write_text_atomic(labels[path], yolo_lines(dets, w, h, keep_classes))
+                state[os.path.relpath(labels[path], labels_dir)] = key
+            for path, img in batch:
+                if img is None:
+                    print('Skipping unreadable image', path)
+            annotated += len(readable)
+            unreadable += len(batch) - len(readable)
+
+            now = time.perf_counter()
+            if now - last_log >= log_every:
+                print(f'{annotated}/{len(todo)} images, {annotated / (now - t0):.1f} images/sec')
+                save_state()
+                last_log = now
+    finally:
+        save_state()
+
+    elapsed = time.perf_counter() - t0
+    print(f'Done: annotated {annotated}, skipped {skipped}, unreadable {unreadable} in {elapsed:.1f}s')
+    return {'annotated': annotated, 'skipped': skipped, 'unreadable': unreadable, 'seconds': elapsed}
 
 
 if __name__ == '__main__':
@@ -49,5 +132,12 @@ if __name__ == '__main__':
     parser.add_argument('--images', required=True)
     parser.add_argument('--labels', required=True)
     parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL, help='.pt or .onnx weights')
+    parser.add_argument('--backend', type=str, default=DEFAULT_BACKEND, choices=BACKENDS)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4, help='decode threads')
+    parser.add_argument('--keep-classes', action='store_true', help="keep the model's class ids instead of 0")
+    parser.add_argument('--force', action='store_true', help='re-annotate images with up-to-date labels too')
     args = parser.parse_args()
-    main(args.images, args.labels, args.conf)
+    main(args.images, args.labels, args.conf, args.model, args.backend, args.batch_size, args.workers,
+         args.keep_classes, args.force)
@@ -0,0 +1,158 @@
+"""Dynamic micro-batching for model inference.
+
+Requests submit one image each; a single background task collects up to
+`max_batch_size` images (or whatever arrived within `max_wait_ms` of the first
+one), runs them through one batched predict call per model in an executor and
+hands each caller its own result. Up to `max_concurrent` predict calls run at
+once, and the next batch is collected while earlier ones are still running.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Set
+
+
+class QueueFullError(RuntimeError):
+    """Raised by `BatchScheduler.submit` when the pending queue is at capacity."""
+
+
+@dataclass
+class _Item:
+    image: Any
+    conf: float
+    model: Any
+    future: asyncio.Future = field(repr=False)
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+class BatchScheduler:
+    """Collects single-image requests into batches for `predict_fn`.
+
+    `predict_fn(images, confs, model)` receives a list of images, the matching list
+    of per-request confidence thresholds and the `model` they were submitted for
+    (images for different models are never mixed in one call), and must return one
+    result per image in the same order. It is called in `executor` (the loop's default executor if None)
+    so the event loop keeps serving other requests while a batch runs; size
+    `max_concurrent` to the executor's workers so each of them can be busy.
+
+    `on_batch(size, predict_seconds, queue_waits)`, if given, is called after every
+    predict call with the batch size, its duration and how long each image waited.
+    """
+
+    def __init__(self, predict_fn: Callable[[List[Any], List[float], Any], List[Any]], max_batch_size: int = 8,
+                 max_wait_ms: float = 10.0, max_queue: int = 64, executor=None,
+                 on_batch: Optional[Callable[[int, float, List[float]], None]] = None, max_concurrent: int = 1):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be >= 1')
+        if max_concurrent < 1:
+            raise ValueError('max_concurrent must be >= 1')
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.executor = executor
+        self.on_batch = on_batch
+        self.max_concurrent = max_concurrent
+        self._inflight: Set[asyncio.Task] = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        """Start the batching task on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self.running and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for task in list(self._inflight):
+            task.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+        # fail anything still waiting so callers don't hang
+        while self._queue is not None and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if not item.future.done():
+                item.future.set_exception(RuntimeError('batch scheduler stopped'))
+
+    async def submit(self, image, conf: float = 0.25, model=None):
+        """Queue one image for `model` and wait for its result."""
+        # (re)start lazily, e.g. when used outside the app lifespan or from a new loop
+        self.start()
+        item = _Item(image, conf, model, asyncio.get_running_loop().create_future())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            raise QueueFullError(f'inference queue is full ({self.max_queue} pending)')
+        return await item.future
+
+    async def _collect(self) -> List[_Item]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # take whatever is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_concurrent)
+        while True:
+            batch = await self._collect()
+            # callers that gave up (e.g. client disconnected) don't need inference
+            batch = [item for item in batch if not item.future.done()]
+            groups = {}
+            for item in batch:
+                groups.setdefault(item.model, []).append(item)
+            for model, group in groups.items():
+                # wait for a free worker, then go back to collecting while this group runs
+                await slots.acquire()
+                task = loop.create_task(self._run_group(loop, model, group))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+                task.add_done_callback(lambda _: slots.release())
+
+    async def _run_group(self, loop, model, group: List[_Item]):
+        t0 = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.predict_fn, [item.image for item in group], [item.conf for item in group], model)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                e = RuntimeError('batch scheduler stopped')
+            for item in group:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        if self.on_batch is not None:
+            self.on_batch(len(group), time.perf_counter() - t0, [t0 - item.queued_at for item in group])
+        for item, result in zip(group, results):
+            if not item.future.done():
+                item.future.set_result(result)
@@ -0,0 +1,310 @@
+"""Dataset manifest and validator.
+
+`init` writes a dataset.yaml whose split paths are relative to the yaml itself (no
+`path:` key, so Ultralytics resolves them against the yaml's folder), which makes
+the dataset folder portable between machines:
+
+    python src/dataset.py init --root data/dataset --names object
+
+`check` scans every image/label pair of the yaml's splits on a thread pool and reports:
+
+    errors    images that don't decode, malformed label lines (field count, class id
+              outside 0..nc-1, coordinates outside 0..1, empty boxes), orphan labels
+              without an image, and identical images (by content hash) in two splits
+    warnings  images without a label file, and duplicate images within one split
+
+The results go to <root>/manifest.json: per image its relative path, size, mtime,
+content hash, width/height and label checks. Later runs only re-read files whose
+size or mtime changed, so re-validating a large set costs little more than a
+directory walk. Splits that point at packed datasets (src/packed.py) are skipped.
+
+    python src/dataset.py check --data data/dataset/dataset.yaml --workers 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    from .packed import is_pack
+    from .pred_cache import content_hash
+    from .sources import is_image
+    from .utils import decode_image, write_text_atomic
+except ImportError:
+    from packed import is_pack
+    from pred_cache import content_hash
+    from sources import is_image
+    from utils import decode_image, write_text_atomic
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+SPLITS = ('train', 'val', 'test')
+# box edges may stick out of the image by this much (rounding in labelling tools)
+EDGE_TOLERANCE = 1e-3
+IMAGE_FIELDS = ('hash', 'width', 'height', 'error')
+LABEL_FIELDS = ('boxes', 'problems')
+
+
+def labels_dir_for(images_dir: str) -> str:
+    """The label folder Ultralytics pairs with `images_dir`: the last /images/ becomes /labels/."""
+    head, sep, tail = images_dir.replace('\\', '/').rpartition('/images')
+    if not sep or (tail and not tail.startswith('/')):
+        raise ValueError(f'{images_dir} has no "images" folder component to map to "labels"')
+    return head + '/labels' + tail
+
+
+def read_data_yaml(data_yaml: str) -> Tuple[str, Dict[str, List[str]], List[str]]:
+    """(dataset root, {split: [absolute image dirs]}, class names) of an Ultralytics dataset yaml."""
+    import yaml
+    with open(data_yaml) as f:
+        cfg = yaml.safe_load(f)
+    root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(data_yaml)), cfg.get('path') or ''))
+    splits = {}
+    for split in SPLITS:
+        value = cfg.get(split)
+        if value:
+            splits[split] = [os.path.normpath(os.path.join(root, p)) for p in ([value] if isinstance(value, str)
+                                                                               else value)]
+    names = cfg.get('names') or [f'class_{i}' for i in range(int(cfg.get('nc', 1)))]
+    if isinstance(names, dict):
+        names = [names[k] for k in sorted(names)]
+    return root, splits, list(names)
+
+
+def write_data_yaml(root: str, names: List[str], train: Optional[List[str]] = None,
+                    val: Optional[List[str]] = None, test: Optional[List[str]] = None) -> str:
+    """Write <root>/dataset.yaml with split paths relative to `root`; returns its path.
+
+    Splits default to images/train, images/val and images/test, where they exist.
+    """
+    import yaml
+    cfg = {}
+    for split, dirs in (('train', train), ('val', val), ('test', test)):
+        dirs = dirs or ([f'images/{split}'] if os.path.isdir(os.path.join(root, 'images', split)) else [])
+        dirs = [os.path.relpath(os.path.join(root, d), root).replace(os.sep, '/') for d in dirs]
+        if dirs:
+            cfg[split] = dirs[0] if len(dirs) == 1 else dirs
+    cfg['nc'] = len(names)
+    cfg['names'] = list(names)
+    out = os.path.join(root, 'dataset.yaml')
+    header = ('# Split paths are relative to this file; regenerate with:\n'
+              '#   python src/dataset.py init --root <this folder>\n')
+    write_text_atomic(out, header + yaml.safe_dump(cfg, sort_keys=False, default_flow_style=None))
+    return out
+
+
+def check_label(text: str, nc: int) -> Tuple[int, List[str]]:
+    """(box count, problems) of a YOLO label file's `text` for a dataset with `nc` classes."""
+    problems = []
+    boxes = 0
+    seen = set()
+    for n, line in enumerate(text.splitlines(), 1):
+        fields = line.split()
+        if not fields:
+            continue
+        if len(fields) != 5:
+            problems.append(f'line {n}: expected 5 fields, got {len(fields)}')
+            continue
+        try:
+            cls = float(fields[0])
+            cx, cy, w, h = (float(v) for v in fields[1:])
+        except ValueError:
+            problems.append(f'line {n}: not a number')
+            continue
+        if cls != int(cls) or not 0 <= cls < nc:
+            problems.append(f'line {n}: class {fields[0]} outside 0..{nc - 1}')
+        if not (w > 0 and h > 0):
+            problems.append(f'line {n}: empty box')
+        elif (min(cx - w / 2, cy - h / 2) < -EDGE_TOLERANCE or max(cx + w / 2, cy + h / 2) > 1 + EDGE_TOLERANCE):
+            problems.append(f'line {n}: box outside the image (coordinates must be normalised to 0..1)')
+        if tuple(fields) in seen:
+            problems.append(f'line {n}: duplicate box')
+        seen.add(tuple(fields))
+        boxes += 1
+    return boxes, problems
+
+
+def _walk(top: str, prefix: str = '') -> Iterator[Tuple[str, str, os.stat_result]]:
+    """(path, posix path relative to `top`, stat) of every file under `top`."""
+    try:
+        entries = list(os.scandir(top))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir():
+            yield from _walk(entry.path, prefix + entry.name + '/')
+        elif entry.is_file():
+            yield entry.path, prefix + entry.name, entry.stat()
+
+
+def _stamp(st: Optional[os.stat_result]) -> Optional[List[int]]:
+    return [st.st_size, st.st_mtime_ns] if st is not None else None
+
+
+def _check_image(path: str) -> dict:
+    with open(path, 'rb') as f:
+        data = f.read()
+    img = decode_image(data)
+    if img is None:
+        return {'hash': content_hash(data), 'width': 0, 'height': 0, 'error': 'cannot decode image'}
+    return {'hash': content_hash(data), 'width': img.shape[1], 'height': img.shape[0], 'error': None}
+
+
+def _check_label_file(path: Optional[str], nc: int) -> dict:
+    if path is None:
+        return {'boxes': 0, 'problems': []}
+    with open(path, errors='replace') as f:
+        boxes, problems = check_label(f.read(), nc)
+    return {'boxes': boxes, 'problems': problems}
+
+
+def scan(data_yaml: str, workers: int = 8, manifest_path: Optional[str] = None, rehash: bool = False) -> dict:
+    """Validate every split of `data_yaml` and update the manifest; returns a report dict.
+
+    The report has 'images', 'labels', 'boxes', 'rechecked' (files read this run),
+    'errors' and 'warnings' (lists of "path: message"), 'duplicates' (lists of
+    relative paths with identical content) and 'seconds'.
+    """
+    t0 = time.perf_counter()
+    root, splits, names = read_data_yaml(data_yaml)
+    nc = len(names)
+    manifest_path = manifest_path or os.path.join(root, MANIFEST_NAME)
+    old = {} if rehash else _load_manifest(manifest_path, nc)
+    rel = lambda p: os.path.relpath(p, root).replace(os.sep, '/')  # noqa: E731
+
+    errors, warnings = [], []
+    entries: Dict[str, dict] = {}
+    jobs = []  # (image key, image path, label path, manifest entry of the last run)
+    for split, dirs in splits.items():
+        for images_dir in dirs:
+            if is_pack(images_dir):
+                print(f'Skipping packed split {split}: {images_dir}')
+                continue
+            if not os.path.isdir(images_dir):
+                errors.append(f'{rel(images_dir)}: {split} image folder not found')
+                continue
+            labels_dir = labels_dir_for(images_dir)
+            # relative names are built while walking: os.path.relpath per file would dominate re-scans
+            images_rel, labels_rel = rel(images_dir) + '/', rel(labels_dir) + '/'
+            labels = {name[:-4]: (path, st) for path, name, st in _walk(labels_dir) if name.endswith('.txt')}
+            for path, name, st in _walk(images_dir):
+                if not is_image(name):
+                    continue
+                key = images_rel + name
+                if key in entries:
+                    continue  # folder listed twice
+                stem = os.path.splitext(name)[0]
+                label_path, label_st = labels.pop(stem, (None, None))
+                entries[key] = {'split': split, 'size': st.st_size, 'mtime': st.st_mtime_ns,
+                                'label': labels_rel + stem + '.txt' if label_path else None,
+                                'label_stamp': _stamp(label_st)}
+                jobs.append((key, path, label_path, old.get(key)))
+            errors += [f'{labels_rel}{stem}.txt: orphan label without an image' for stem in labels]
+
+    def check(job):
+        key, path, label_path, cached = job
+        entry = entries[key]
+        if cached and [cached['size'], cached['mtime']] == [entry['size'], entry['mtime']]:
+            entry.update({k: cached[k] for k in IMAGE_FIELDS})
+        else:
+            entry.update(_check_image(path))
+        if cached and cached['label_stamp'] == entry['label_stamp']:
+            entry.update({k: cached[k] for k in LABEL_FIELDS})
+        else:
+            entry.update(_check_label_file(label_path, nc))
+
+    stale = [job for job in jobs if not _is_fresh(job[3], entries[job[0]])]
+    for job in jobs:
+        if _is_fresh(job[3], entries[job[0]]):
+            check(job)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(check, stale))
+
+    by_hash = defaultdict(list)
+    for key, e in sorted(entries.items()):
+        if e['error']:
+            errors.append(f"{key}: {e['error']}")
+        errors += [f'{e["label"]}: {p}' for p in e['problems']]
+        if e['label'] is None:
+            warnings.append(f'{key}: no label file')
+        if not e['error']:
+            by_hash[e['hash']].append(key)
+    duplicates = [keys for keys in by_hash.values() if len(keys) > 1]
+    for keys in duplicates:
+        if len({entries[k]['split'] for k in keys}) > 1:
+            errors.append(f'{keys[0]}: identical images in different splits: {", ".join(keys)}')
+        else:
+            warnings.append(f'{keys[0]}: duplicate images: {", ".join(keys)}')
+
+    write_text_atomic(manifest_path, json.dumps({'version': MANIFEST_VERSION, 'nc': nc, 'files': entries}))
+    return {'images': len(entries), 'labels': sum(e['label'] is not None for e in entries.values()),
+            'boxes': sum(e['boxes'] for e in entries.values()), 'rechecked': len(stale), 'errors': errors,
+            'warnings': warnings, 'duplicates': duplicates, 'seconds': time.perf_counter() - t0}
+
+
+def _is_fresh(cached: Optional[dict], entry: dict) -> bool:
+    return (cached is not None and cached['size'] == entry['size'] and cached['mtime'] == entry['mtime']
+            and cached['label_stamp'] == entry['label_stamp'])
+
+
+def _load_manifest(path: str, nc: int) -> dict:
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # label checks depend on the class count
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('nc') != nc:
+        return {}
+    fields = ('size', 'mtime', 'label_stamp') + IMAGE_FIELDS + LABEL_FIELDS
+    return {k: e for k, e in manifest.get('files', {}).items() if all(f in e for f in fields)}
+
+
+def print_report(report: dict, limit: int = 20):
+    for kind in ('errors', 'warnings'):
+        items = report[kind]
+        if items:
+            print(f'{len(items)} {kind}:')
+            for line in items[:limit]:
+                print('  ' + line)
+            if len(items) > limit:
+                print(f'  ... and {len(items) - limit} more')
+    print(f"{report['images']} images, {report['labels']} labels, {report['boxes']} boxes; "
+          f"re-checked {report['rechecked']} in {report['seconds']:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write portable dataset yamls and validate datasets')
+    sub = parser.add_subparsers(dest='command', required=True)
+    i = sub.add_parser('init', help='write <root>/dataset.yaml with relative paths')
+    i.add_argument('--root', required=True, help='dataset folder containing images/ and labels/')
+    i.add_argument('--names', default=None,
+                   help='comma-separated class names (default: those of an existing dataset.yaml, else "object")')
+    i.add_argument('--train', default=None, help='comma-separated image folders, relative to --root')
+    i.add_argument('--val', default=None)
+    i.add_argument('--test', default=None)
+    c = sub.add_parser('check', help='validate image/label pairs and update the manifest')
+    c.add_argument('--data', required=True, help='dataset yaml')
+    c.add_argument('--workers', type=int, default=8)
+    c.add_argument('--manifest', default=None, help=f'default: <dataset root>/{MANIFEST_NAME}')
+    c.add_argument('--rehash', action='store_true', help='ignore the manifest and re-read every file')
+    c.add_argument('--show', type=int, default=20, help='problems to print per kind')
+    args = parser.parse_args(argv)
+
+    if args.command == 'init':
+        split = lambda v: v.split(',') if v else None  # noqa: E731
+        existing = os.path.join(args.root, 'dataset.yaml')
+        names = split(args.names) or (read_data_yaml(existing)[2] if os.path.exists(existing) else ['object'])
+        print('Wrote', write_data_yaml(args.root, names, split(args.train), split(args.val), split(args.test)))
+        return 0
+    report = scan(args.data, args.workers, args.manifest, args.rehash)
+    print_report(report, args.show)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
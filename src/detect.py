@@ -1,34 +1,229 @@
+"""Run YOLO detection on one image, or in bulk over folders, globs, image lists and videos.
+
+Single image (writes one annotated image):
+    python src/detect.py --source data/sample1.jpg --output outputs/detect_out.jpg
+
+Bulk mode (streams detections to JSONL or CSV, optionally saves annotated images,
+and resumes from its checkpoint after a crash with --resume):
+    python src/detect.py --source "data/**/*.jpg" --detections outputs/detections.jsonl --save-dir outputs/annotated --resume
+
+Either mode can run tiled for high-resolution images (small objects), e.g. --tile 640 --tile-overlap 0.2.
+"""
 import argparse
+import csv
+import hashlib
+import json
 import os
+import time
 import cv2
-from ultralytics import YOLO
+import numpy as np
 
+from engine import BACKENDS, DEFAULT_BACKEND, DEFAULT_MODEL
+from registry import get_engine
+from sources import batched, is_image, iter_frames, list_sources
+from tiling import MERGE_METHODS, tiled
 from utils import ensure_dir, save_image
 
+NO_DETECTIONS = np.zeros((0, 6), dtype=np.float32)
+
 
-def run_detection(source: str, out_path: str, conf: float = 0.25):
-    model = YOLO('yolov8n.pt')  # downloads the small pre-trained model if missing
-    results = model.predict(source=source, conf=conf, save=False)
+def _first_image(source: str) -> str:
+    images = [p for p in list_sources(source) if is_image(p)]
+    if not images:
+        raise ValueError(f"No images found in {source}")
+    return images[0]
 
-    # results is a list (one element per image)
-    r = results[0]
 
-    # r.plot() returns an annotated image (RGB numpy array)
-    annotated = r.plot()
+def run_detection(source: str, out_path: str, conf: float = 0.25, model: str = DEFAULT_MODEL,
+                  backend: str = DEFAULT_BACKEND, tiling: dict = None):
+    engine = get_engine(model, backend)  # cached per process; downloads the small pre-trained model if missing
+    engine = tiled(engine, **(tiling or {}))
 
-    # ultralytics plot returns RGB; convert to BGR for OpenCV saving
-    annotated_bgr = cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR)
+    image_path = _first_image(source)
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    dets = engine.predict([img], conf=conf)[0]
+
+    # engine.plot returns an annotated BGR copy, ready for OpenCV saving
+    annotated_bgr = engine.plot(img, dets)
 
     ensure_dir(os.path.dirname(out_path) or '.')
     save_image(out_path, annotated_bgr)
-    print(f"Saved annotated image to {out_path}")
+    print(f"Saved annotated image to {out_path} ({len(dets)} detections)")
+
+
+class DetectionWriter:
+    """Appends detections to a .jsonl (one line per image) or .csv (one row per box) file."""
+
+    CSV_FIELDS = ['source', 'x1', 'y1', 'x2', 'y2', 'conf', 'cls']
+
+    def __init__(self, path: str, offset: int = 0):
+        self.path = path
+        self.csv = path.lower().endswith('.csv')
+        ensure_dir(os.path.dirname(path) or '.')
+        if offset and os.path.exists(path):
+            # resume: drop anything written after the last checkpoint
+            self.f = open(path, 'r+', newline='')
+            self.f.truncate(offset)
+            self.f.seek(offset)
+        else:
+            self.f = open(path, 'w', newline='')
+        self.writer = csv.writer(self.f) if self.csv else None
+        if self.csv and self.f.tell() == 0:
+            self.writer.writerow(self.CSV_FIELDS)
+
+    def write(self, source_id: str, shape, dets):
+        if self.csv:
+            for x1, y1, x2, y2, c, cls in dets.tolist():
+                self.writer.writerow([source_id, round(x1, 2), round(y1, 2), round(x2, 2), round(y2, 2),
+                                      round(c, 4), int(cls)])
+            return
+        row = {'source': source_id, 'width': shape[1] if shape else None, 'height': shape[0] if shape else None,
+               'detections': [{'xyxy': [round(x, 2) for x in d[:4]], 'conf': round(d[4], 4), 'cls': int(d[5])}
+                              for d in dets.tolist()]}
+        if shape is None:
+            row['error'] = 'unreadable'
+        self.f.write(json.dumps(row) + '\n')
+
+    def flush(self) -> int:
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+
+def _fingerprint(paths: list, vid_stride: int) -> str:
+    """Identifies the exact list of inputs (and video stride) a checkpoint counts items of."""
+    return hashlib.sha256(json.dumps([paths, vid_stride]).encode()).hexdigest()[:16]
+
+
+def _load_checkpoint(path: str, source: str, fingerprint: str) -> dict:
+    if os.path.exists(path):
+        with open(path) as f:
+            ckpt = json.load(f)
+        if ckpt.get('source') == source:
+            # resuming skips items by position, which is only right for the same inputs
+            if ckpt.get('fingerprint') != fingerprint:
+                raise ValueError(f"Cannot resume from {path}: the files in {source} changed since it was written; "
+                                 f"run without --resume to start over")
+            return ckpt
+        print(f"Ignoring checkpoint {path}: it was written for source {ckpt.get('source')!r}")
+    return {'source': source, 'fingerprint': fingerprint, 'done': 0, 'offset': 0}
+
+
+def _save_checkpoint(path: str, ckpt: dict):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(ckpt, f)
+    os.replace(tmp, path)
+
+
+def _source_root(source: str, paths: list) -> str:
+    """Folder that annotated output names are relative to."""
+    if os.path.isdir(source):
+        return source
+    return os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else '.'
+
+
+def _annotated_name(source_id: str, root: str) -> str:
+    """Output name keeping the path below `root`, so a/x.jpg and b/x.jpg don't collide."""
+    path, _, frame = source_id.partition('#')
+    stem = os.path.splitext(os.path.relpath(os.path.abspath(path), os.path.abspath(root)))[0]
+    return f"{stem}_{int(frame):06d}.jpg" if frame else f"{stem}.jpg"
+
+
+def run_bulk(source: str, detections_path: str, save_dir: str = None, conf: float = 0.25, model: str = DEFAULT_MODEL,
+             backend: str = DEFAULT_BACKEND, batch_size: int = 8, workers: int = 4, recursive: bool = False,
+             vid_stride: int = 1, resume: bool = False, log_every: float = 10.0, tiling: dict = None):
+    """Stream every image / video frame in `source` through the model in batches of `batch_size`.
+
+    Decoding runs on `workers` threads ahead of inference. After each batch the
+    detections file is flushed and a checkpoint (<detections>.ckpt) records how many
+    items are done and the file offset, so `resume` continues exactly where a
+    crashed run stopped; it refuses to resume if the list of inputs changed. Annotated
+    images keep their path below the source folder. `tiling` holds TiledPredictor options (tile, overlap, ...) to
+    predict on overlapping tiles of every image.
+    """
+    engine = tiled(get_engine(model, backend), **(tiling or {}))
+    paths = list_sources(source, recursive=recursive)
+    fingerprint = _fingerprint(paths, vid_stride)
+    ckpt_path = detections_path + '.ckpt'
+    ckpt = (_load_checkpoint(ckpt_path, source, fingerprint) if resume
+            else {'source': source, 'fingerprint': fingerprint, 'done': 0, 'offset': 0})
+    if ckpt['done']:
+        print(f"Resuming after {ckpt['done']} items")
+    if save_dir:
+        ensure_dir(save_dir)
+        root = _source_root(source, paths)
+
+    writer = DetectionWriter(detections_path, ckpt['offset'])
+    frames = iter_frames(paths, workers=workers, prefetch=2 * batch_size, vid_stride=vid_stride, skip=ckpt['done'])
+    processed = 0
+    t0 = last_log = time.perf_counter()
+    try:
+        for batch in batched(frames, batch_size):
+            readable = [(sid, img) for sid, img in batch if img is not None]
+            results = dict(zip((sid for sid, _ in readable),
+                               engine.predict([img for _, img in readable], conf=conf) if readable else []))
+            for sid, img in batch:
+                if img is None:
+                    print(f"Skipping unreadable image {sid}")
+                    writer.write(sid, None, NO_DETECTIONS)
+                    continue
+                writer.write(sid, img.shape, results[sid])
+                if save_dir:
+                    save_image(os.path.join(save_dir, _annotated_name(sid, root)), engine.plot(img, results[sid]))
+
+            processed += len(batch)
+            ckpt['done'] += len(batch)
+            ckpt['offset'] = writer.flush()
+            _save_checkpoint(ckpt_path, ckpt)
+
+            now = time.perf_counter()
+            if now - last_log >= log_every:
+                print(f"{ckpt['done']} items, {processed / (now - t0):.1f} images/sec")
+                last_log = now
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - t0
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {processed} items in {elapsed:.1f}s ({rate:.1f} images/sec); detections in {detections_path}")
+    return {'processed': processed, 'seconds': elapsed, 'images_per_sec': rate}
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--source', type=str, required=True, help='Image or folder of images')
-    parser.add_argument('--output', type=str, required=False, default='outputs/detect_out.jpg')
+    parser.add_argument('--source', type=str, required=True,
+                        help='Image, folder, glob, .txt list of paths or video file')
+    parser.add_argument('--output', type=str, required=False, default='outputs/detect_out.jpg',
+                        help='annotated image (single-image mode)')
     parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL, help='.pt or .onnx weights')
+    parser.add_argument('--backend', type=str, default=DEFAULT_BACKEND, choices=BACKENDS)
+    bulk = parser.add_argument_group('bulk mode (enabled by --detections)')
+    bulk.add_argument('--detections', type=str, default=None, help='write detections to this .jsonl or .csv file')
+    bulk.add_argument('--save-dir', type=str, default=None, help='also save annotated images here')
+    bulk.add_argument('--batch-size', type=int, default=8)
+    bulk.add_argument('--workers', type=int, default=4, help='decode threads')
+    bulk.add_argument('--recursive', action='store_true', help='include sub-folders')
+    bulk.add_argument('--vid-stride', type=int, default=1, help='process every n-th video frame')
+    bulk.add_argument('--resume', action='store_true', help='continue from the checkpoint of a previous run')
+    tiles = parser.add_argument_group('tiled inference (enabled by --tile)')
+    tiles.add_argument('--tile', type=int, default=0, help='tile size in pixels (0 = whole image only)')
+    tiles.add_argument('--tile-overlap', type=float, default=0.2, help='overlap between neighbouring tiles')
+    tiles.add_argument('--tile-batch', type=int, default=8, help='tiles per forward pass')
+    tiles.add_argument('--tile-merge', default='nms', choices=MERGE_METHODS, help='merge boxes across tiles')
+    tiles.add_argument('--no-full-frame', action='store_true', help='skip the whole-image pass')
     args = parser.parse_args()
 
-    run_detection(args.source, args.output, args.conf)
+    tiling = {'tile': args.tile, 'overlap': args.tile_overlap, 'batch_size': args.tile_batch,
+              'merge': args.tile_merge, 'full_frame': not args.no_full_frame} if args.tile else None
+    if args.detections:
+        run_bulk(args.source, args.detections, args.save_dir, args.conf, args.model, args.backend,
+                 args.batch_size, args.workers, args.recursive, args.vid_stride, args.resume, tiling=tiling)
+    else:
+        run_detection(args.source, args.output, args.conf, args.model, args.backend, tiling)
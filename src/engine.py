@@ -0,0 +1,207 @@
+"""Detector engines: one interface over the PyTorch (Ultralytics) and ONNX Runtime backends.
+
+Every entry point loads its model through `load_engine()`, which picks the backend
+from the `backend` argument or the PATTERNDETECT_BACKEND environment variable
+('auto' selects by file extension: .onnx -> ONNX Runtime, anything else -> PyTorch).
+
+Engines take BGR numpy images and return one (N, 6) float32 array per image with
+columns x1, y1, x2, y2, conf, cls in original image pixels.
+
+Export trained weights to ONNX:
+    python src/engine.py export --weights "runs/detect/*/weights/best.pt"
+"""
+import argparse
+import ast
+import glob
+import os
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+try:
+    from .utils import draw_detections
+except ImportError:
+    from utils import draw_detections
+
+# `python src/runs.py promote` copies the chosen run's weights here; when the file exists it
+# becomes the default model (the API serves it) unless PATTERNDETECT_MODEL says otherwise
+PROMOTED_MODEL = os.environ.get('PATTERNDETECT_PROMOTED_MODEL', os.path.join('models', 'promoted.pt'))
+DEFAULT_MODEL = os.environ.get('PATTERNDETECT_MODEL') or (PROMOTED_MODEL if os.path.isfile(PROMOTED_MODEL)
+                                                          else 'yolov8n.pt')
+DEFAULT_BACKEND = os.environ.get('PATTERNDETECT_BACKEND', 'auto')
+BACKENDS = ('auto', 'torch', 'onnx')
+
+
+class DetectorEngine:
+    """Common interface for detector backends."""
+
+    backend = ''
+
+    def __init__(self, weights: str, imgsz: int = 640):
+        self.weights = weights
+        self.imgsz = imgsz
+        self.names: Dict[int, str] = {}
+
+    def predict(self, images: List[np.ndarray], conf: float = 0.25, iou: float = 0.7) -> List[np.ndarray]:
+        raise NotImplementedError
+
+    def plot(self, image: np.ndarray, dets: np.ndarray) -> np.ndarray:
+        """Return a BGR copy of `image` with `dets` drawn on it."""
+        return draw_detections(image, dets, self.names)
+
+
+class TorchEngine(DetectorEngine):
+    """Ultralytics YOLO running on PyTorch."""
+
+    backend = 'torch'
+
+    def __init__(self, weights: str, imgsz: int = 640, device: Optional[str] = None):
+        super().__init__(weights, imgsz)
+        from ultralytics import YOLO
+        self.model = YOLO(weights)  # downloads the pre-trained model if missing
+        self.device = device
+        self.names = dict(self.model.names)
+
+    def predict(self, images, conf=0.25, iou=0.7):
+        results = self.model.predict(source=list(images), conf=conf, iou=iou, imgsz=self.imgsz, device=self.device,
+                                     save=False, verbose=False)
+        return [r.boxes.data.cpu().numpy().astype(np.float32) for r in results]
+
+    def plot(self, image, dets):
+        import torch
+        from ultralytics.engine.results import Results
+        r = Results(orig_img=image, path='', names=self.names, boxes=torch.as_tensor(dets))
+        return r.plot()  # BGR
+
+
+def letterbox(img: np.ndarray, new_shape: int = 640, stride: int = 32, auto: bool = True):
+    """Resize keeping aspect ratio and pad to `new_shape` (same rules as Ultralytics' LetterBox).
+
+    With `auto` the padding is only up to the next multiple of `stride`. Returns the
+    padded image, the scale ratio and the (left, top) padding.
+    """
+    h, w = img.shape[:2]
+    r = min(new_shape / h, new_shape / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    dw, dh = new_shape - new_w, new_shape - new_h
+    if auto:
+        dw, dh = dw % stride, dh % stride
+    dw, dh = dw / 2, dh / 2
+    if (w, h) != (new_w, new_h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return img, r, (left, top)
+
+
+class OnnxEngine(DetectorEngine):
+    """YOLO exported to ONNX, run with ONNX Runtime (no PyTorch needed at inference time).
+
+    `providers` defaults to PATTERNDETECT_ORT_PROVIDERS (comma separated) or the CPU
+    provider; use e.g. 'OpenVINOExecutionProvider,CPUExecutionProvider' with the
+    onnxruntime-openvino build to run on OpenVINO.
+    """
+
+    backend = 'onnx'
+
+    def __init__(self, weights: str, imgsz: int = 640, providers: Optional[List[str]] = None,
+                 threads: Optional[int] = None, max_det: int = 300):
+        super().__init__(weights, imgsz)
+        import onnxruntime as ort
+        if providers is None:
+            providers = os.environ.get('PATTERNDETECT_ORT_PROVIDERS', 'CPUExecutionProvider').split(',')
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(weights, sess_options=opts, providers=providers)
+        self.input = self.session.get_inputs()[0]
+        self.max_det = max_det
+        meta = self.session.get_modelmeta().custom_metadata_map
+        if 'names' in meta:
+            self.names = ast.literal_eval(meta['names'])
+        self.stride = int(meta.get('stride', 32))
+        # a static export only accepts its own input size and batch of 1
+        h, w = self.input.shape[2:4]
+        self.dynamic = not (isinstance(h, int) and isinstance(w, int))
+        if not self.dynamic:
+            self.imgsz = int(h)
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        if self.dynamic or batch.shape[0] == 1:
+            return self.session.run(None, {self.input.name: batch})[0]
+        return np.concatenate([self.session.run(None, {self.input.name: b[None]})[0] for b in batch])
+
+    def predict(self, images, conf=0.25, iou=0.7):
+        images = list(images)
+        if not images:
+            return []
+        # minimal padding only when every image (and so every letterbox) has the same shape
+        auto = self.dynamic and len({im.shape for im in images}) == 1
+        padded, metas = [], []
+        for im in images:
+            lb, r, pad = letterbox(im, self.imgsz, self.stride, auto=auto)
+            padded.append(lb)
+            metas.append((r, pad, im.shape[:2]))
+        batch = np.stack(padded)[..., ::-1].transpose(0, 3, 1, 2)  # BGR->RGB, BHWC->BCHW
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+        out = self._run(batch)
+        return [self._postprocess(pred, conf, iou, *meta) for pred, meta in zip(out, metas)]
+
+    def _postprocess(self, pred, conf, iou, r, pad, shape):
+        pred = pred.T  # (anchors, 4 + nc)
+        scores = pred[:, 4:]
+        cls = scores.argmax(1)
+        confs = scores[np.arange(len(cls)), cls]
+        keep = confs > conf
+        xywh, confs, cls = pred[keep, :4], confs[keep], cls[keep]
+        if len(confs) == 0:
+            return np.zeros((0, 6), dtype=np.float32)
+        # top-left xywh for OpenCV's class-aware NMS
+        tlwh = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, 2:]], axis=1)
+        idx = cv2.dnn.NMSBoxesBatched(tlwh.tolist(), confs.tolist(), cls.tolist(), conf, iou)
+        idx = np.asarray(idx, dtype=int).reshape(-1)
+        idx = idx[np.argsort(-confs[idx], kind='stable')][:self.max_det]
+        boxes = np.concatenate([tlwh[idx, :2], tlwh[idx, :2] + tlwh[idx, 2:]], axis=1)
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad[0]) / r).clip(0, shape[1])
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad[1]) / r).clip(0, shape[0])
+        return np.concatenate([boxes, confs[idx, None], cls[idx, None]], axis=1).astype(np.float32)
+
+
+def load_engine(weights: str = DEFAULT_MODEL, backend: str = DEFAULT_BACKEND, **kwargs) -> DetectorEngine:
+    """Load `weights` with the requested backend ('auto', 'torch' or 'onnx')."""
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got {backend!r}")
+    if backend == 'auto':
+        backend = 'onnx' if weights.lower().endswith('.onnx') else 'torch'
+    if backend == 'onnx':
+        if not weights.lower().endswith('.onnx'):
+            raise ValueError(f"the onnx backend needs .onnx weights, got {weights} (export it first)")
+        return OnnxEngine(weights, **kwargs)
+    return TorchEngine(weights, **kwargs)
+
+
+def export_onnx(weights: str, imgsz: int = 640, dynamic: bool = True, half: bool = False) -> str:
+    """Export PyTorch weights to ONNX next to the .pt file and return the .onnx path."""
+    from ultralytics import YOLO
+    return str(YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=dynamic, half=half, verbose=False))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export', help='convert .pt weights to ONNX')
+    exp.add_argument('--weights', required=True, help='weights file or glob, e.g. "runs/detect/*/weights/best.pt"')
+    exp.add_argument('--imgsz', type=int, default=640)
+    exp.add_argument('--static', action='store_true', help='fixed input shape and batch size of 1')
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(args.weights)) or [args.weights]
+    for path in paths:
+        out = export_onnx(path, imgsz=args.imgsz, dynamic=not args.static)
+        print(f"Exported {path} -> {out}")
+
+
+if __name__ == '__main__':
+    main()
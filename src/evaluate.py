@@ -1,108 +1,353 @@
-"""Evaluate model on validation set: simple TP/FP/FN at IoU>=0.5 and compute precision/recall/F1.
+"""Evaluate model on validation set: precision/recall/F1 at a confidence threshold plus mAP@0.5 and mAP@0.5:0.95.
 Usage:
   python src/evaluate.py --model runs/detect/train2/weights/best.pt --images data/dataset/images/val --labels data/dataset/labels/val --out outputs/eval.csv
+
+Inference runs in batches with images decoded ahead on background threads. Matching
+is vectorised with NumPy: one pairwise IoU matrix per image, predictions matched in
+descending confidence order at every IoU threshold at once, and the precision /
+recall curves for all confidence thresholds come from a single sort over the
+whole validation set. `--curves` writes the per-confidence P/R/F1 curve at IoU 0.5.
+
+Raw predictions are cached under --cache-dir keyed by weights hash, image content
+hash and inference settings, so re-running with other thresholds, or sweeping them
+with --sweep-conf 0.1,0.25,0.5 --sweep-iou 0.5,0.75, doesn't re-run the model.
+
+--images may also be a packed dataset (see src/packed.py); images and ground truth
+are then read straight from its memory-mapped shards and --labels can be omitted.
 """
 import argparse
 import csv
 import os
-from ultralytics import YOLO
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+
 import numpy as np
 
+from engine import BACKENDS, DEFAULT_BACKEND
+from pred_cache import PredictionCache, content_hash
+from packed import PackedDataset, is_pack
+from registry import file_sha256, get_engine
+from sources import batched, is_image, iter_frames, list_sources
+from utils import decode_image
 
-def read_yolo_boxes(txt_path, img_w, img_h):
-    boxes = []
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# predictions are kept down to this confidence so AP covers the whole curve
+BASE_CONF = 0.001
+DEFAULT_CACHE_DIR = 'outputs/pred_cache'
+
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+
+def read_yolo_labels(txt_path, img_w, img_h) -> np.ndarray:
+    """Read a YOLO label file into an (M, 5) array of cls, x1, y1, x2, y2 in pixels."""
     if not os.path.exists(txt_path):
-        return boxes
-    with open(txt_path) as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) < 5:
-                continue
-            cls = int(parts[0])
-            cx, cy, w, h = map(float, parts[1:5])
-            x1 = (cx - w/2) * img_w
-            y1 = (cy - h/2) * img_h
-            x2 = (cx + w/2) * img_w
-            y2 = (cy + h/2) * img_h
-            boxes.append([x1, y1, x2, y2])
-    return boxes
-
-
-def iou(boxA, boxB):
-    xA = max(boxA[0], boxB[0])
-    yA = max(boxA[1], boxB[1])
-    xB = min(boxA[2], boxB[2])
-    yB = min(boxA[3], boxB[3])
-    interArea = max(0, xB - xA) * max(0, yB - yA)
-    if interArea == 0:
+        return np.zeros((0, 5), dtype=np.float32)
+    rows = [line.split()[:5] for line in open(txt_path).read().splitlines() if len(line.split()) >= 5]
+    return yolo_to_pixels(np.asarray(rows, dtype=np.float32).reshape(-1, 5), img_w, img_h)
+
+
+def yolo_to_pixels(labels: np.ndarray, img_w, img_h) -> np.ndarray:
+    """(M, 5) cls, cx, cy, w, h (normalised) -> (M, 5) cls, x1, y1, x2, y2 in pixels."""
+    if not len(labels):
+        return np.zeros((0, 5), dtype=np.float32)
+    cls, cx, cy, w, h = np.asarray(labels, dtype=np.float32).T
+    return np.stack([cls, (cx - w / 2) * img_w, (cy - h / 2) * img_h, (cx + w / 2) * img_w, (cy + h / 2) * img_h], 1)
+
+
+def read_yolo_boxes(txt_path, img_w, img_h):
+    """Ground-truth boxes as a list of [x1, y1, x2, y2] in pixels."""
+    return read_yolo_labels(txt_path, img_w, img_h)[:, 1:].tolist()
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes, as an (N, M) matrix."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    inter = np.clip(rb - lt, 0, None).prod(2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter, dtype=np.float64), where=union > 0)
+
+
+def match_predictions(dets: np.ndarray, gt: np.ndarray, iou_thresholds: np.ndarray = IOU_THRESHOLDS,
+                      agnostic: bool = True) -> np.ndarray:
+    """Mark each prediction TP/FP at every IoU threshold; returns an (N, T) bool array.
+
+    `dets` is (N, 6) x1, y1, x2, y2, conf, cls and `gt` is (M, 5) cls, x1, y1, x2, y2.
+    Predictions claim ground truth in descending confidence order, each taking the
+    highest-IoU box not yet claimed at that threshold. Unless `agnostic`, a prediction
+    only matches ground truth of the same class.
+    """
+    n, t = len(dets), len(iou_thresholds)
+    tp = np.zeros((n, t), dtype=bool)
+    if n == 0 or len(gt) == 0:
+        return tp
+    order = np.argsort(-dets[:, 4], kind='stable')
+    iou = box_iou(dets[order, :4], gt[:, 1:5])
+    if not agnostic:
+        iou[dets[order, 5][:, None] != gt[None, :, 0]] = 0.0
+    claimed = np.zeros((t, len(gt)), dtype=bool)
+    rows = np.arange(t)
+    for i in range(n):
+        candidates = (iou[i][None, :] >= iou_thresholds[:, None]) & ~claimed
+        if not candidates.any():
+            continue
+        best = np.where(candidates, iou[i][None, :], -1.0).argmax(1)
+        hit = candidates[rows, best]
+        tp[order[i], hit] = True
+        claimed[rows[hit], best[hit]] = True
+    return tp
+
+
+def compute_ap(recall: np.ndarray, precision: np.ndarray) -> float:
+    """Area under the precision envelope, sampled at 101 recall points (COCO style)."""
+    if len(recall) == 0:
         return 0.0
-    boxAArea = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
-    boxBArea = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
-    return interArea / float(boxAArea + boxBArea - interArea)
+    mrec = np.concatenate([[0.0], recall, [1.0]])
+    mpre = np.concatenate([[1.0], precision, [0.0]])
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    x = np.linspace(0, 1, 101)
+    return float(_trapezoid(np.interp(x, mrec, mpre), x))
 
 
-def evaluate(model_path, images_dir, labels_dir, out_csv, iou_thr=0.5, conf_thr=0.25):
-    model = YOLO(model_path)
-    images = []
-    for file in os.listdir(images_dir):
-        if file.lower().endswith(('.jpg', '.png', '.jpeg')):
-            images.append(os.path.join(images_dir, file))
+def pr_curves(tp: np.ndarray, conf: np.ndarray, n_gt: int):
+    """Precision/recall (per IoU threshold) at every confidence, sorted high to low."""
+    order = np.argsort(-conf, kind='stable')
+    tpc = np.cumsum(tp[order], 0)
+    fpc = np.cumsum(~tp[order], 0)
+    recall = tpc / max(n_gt, 1)
+    precision = tpc / np.maximum(tpc + fpc, 1)
+    return conf[order], precision, recall
 
-    tp = 0
-    fp = 0
-    fn = 0
 
-    rows = []
-    for img_path in images:
-        res = model.predict(source=img_path, conf=conf_thr, save=False)
-        r = res[0]
-        preds = []
-        for box in r.boxes:
-            xyxy = box.xyxy[0].tolist()
-            conf = float(box.conf[0])
-            preds.append((xyxy, conf))
-
-        import cv2
-        img = cv2.imread(img_path)
-        h, w = img.shape[:2]
-        gt_boxes = read_yolo_boxes(os.path.join(labels_dir, os.path.splitext(os.path.basename(img_path))[0] + '.txt'), w, h)
-
-        matched_gt = set()
-        for pbox, conf in preds:
-            matched = False
-            for i, gt in enumerate(gt_boxes):
-                if i in matched_gt:
-                    continue
-                if iou(pbox, gt) >= iou_thr:
-                    tp += 1
-                    matched = True
-                    matched_gt.add(i)
-                    break
-            if not matched:
-                fp += 1
-        fn += (len(gt_boxes) - len(matched_gt))
-
-        rows.append({'image': os.path.basename(img_path), 'predictions': len(preds), 'gt': len(gt_boxes)})
-
-    precision = tp / (tp + fp) if (tp + fp) > 0 else 0.0
-    recall = tp / (tp + fn) if (tp + fn) > 0 else 0.0
+def evaluate_detections(samples: Iterable[Tuple[np.ndarray, np.ndarray]], iou_thr=0.5, conf_thr=0.25,
+                        agnostic=True) -> dict:
+    """Compute P/R/F1 at (`conf_thr`, `iou_thr`), mAP@0.5 and mAP@0.5:0.95 over (dets, gt) pairs.
+
+    Also returns the per-confidence precision/recall/F1 curve at `iou_thr` under 'curve'.
+    """
+    thresholds = np.unique(np.concatenate([IOU_THRESHOLDS, [iou_thr]]))
+    k50 = int(np.argmin(np.abs(thresholds - 0.5)))
+    k = int(np.argmin(np.abs(thresholds - iou_thr)))
+    grid = [int(np.argmin(np.abs(thresholds - t))) for t in IOU_THRESHOLDS]
+
+    tps, confs, pred_cls, gt_cls = [], [], [], []
+    for dets, gt in samples:
+        tps.append(match_predictions(dets, gt, thresholds, agnostic))
+        confs.append(dets[:, 4])
+        pred_cls.append(dets[:, 5])
+        gt_cls.append(gt[:, 0])
+    tp = np.concatenate(tps) if tps else np.zeros((0, len(thresholds)), dtype=bool)
+    conf = np.concatenate(confs) if confs else np.zeros(0)
+    pred_cls = np.concatenate(pred_cls) if pred_cls else np.zeros(0)
+    gt_cls = np.concatenate(gt_cls) if gt_cls else np.zeros(0)
+
+    # AP per class (a single pseudo-class when matching is class-agnostic), averaged
+    classes = [None] if agnostic else np.unique(gt_cls)
+    aps = []
+    for c in classes:
+        mask = slice(None) if c is None else pred_cls == c
+        n_gt = len(gt_cls) if c is None else int((gt_cls == c).sum())
+        _, precision, recall = pr_curves(tp[mask], conf[mask], n_gt)
+        aps.append([compute_ap(recall[:, j], precision[:, j]) for j in range(len(thresholds))])
+    aps = np.asarray(aps).reshape(len(classes), len(thresholds))
+
+    # operating point at conf_thr / iou_thr, and the full curve at iou_thr
+    keep = conf >= conf_thr
+    tp_k = int(tp[keep, k].sum())
+    fp_k = int(keep.sum()) - tp_k
+    fn_k = len(gt_cls) - tp_k
+    precision = tp_k / (tp_k + fp_k) if (tp_k + fp_k) > 0 else 0.0
+    recall = tp_k / (tp_k + fn_k) if (tp_k + fn_k) > 0 else 0.0
     f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0.0
 
+    curve_conf, curve_p, curve_r = pr_curves(tp[:, [k]], conf, len(gt_cls))
+    curve_p, curve_r = curve_p[:, 0], curve_r[:, 0]
+    curve_f1 = np.divide(2 * curve_p * curve_r, curve_p + curve_r, out=np.zeros_like(curve_p),
+                         where=(curve_p + curve_r) > 0)
+
+    return {'tp': tp_k, 'fp': fp_k, 'fn': fn_k, 'precision': precision, 'recall': recall, 'f1': f1,
+            'map50': float(aps[:, k50].mean()), 'map50_95': float(aps[:, grid].mean()),
+            'curve': {'conf': curve_conf, 'precision': curve_p, 'recall': curve_r, 'f1': curve_f1}}
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def predict_images(engine, image_paths: List[str], conf: float, batch_size: int = 16, workers: int = 4,
+                   cache: Optional[PredictionCache] = None, read: Callable[[str], bytes] = _read_file):
+    """Yield (path, (h, w), dets) for every image, running inference in batches.
+
+    With a `cache`, images are hashed on the decode threads; cached images are
+    neither decoded nor predicted, and new predictions are added to the cache.
+    `read` returns an image's encoded bytes (e.g. `PackedDataset.read` for a pack).
+    """
+    if cache is None:
+        frames = iter_frames(image_paths, workers=workers, prefetch=2 * batch_size,
+                             read=lambda path: decode_image(read(path)))
+        for batch in batched(frames, batch_size):
+            batch = [(path, img) for path, img in batch if img is not None]
+            for (path, img), dets in zip(batch, engine.predict([img for _, img in batch], conf=conf) if batch else []):
+                yield path, img.shape[:2], dets
+        return
+
+    def load(path):
+        data = read(path)
+        key = content_hash(data)
+        hit = cache.get(key)
+        return path, key, hit, None if hit else decode_image(data)
+
+    misses = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        chunks = batched(image_paths, 2 * batch_size)
+        ahead = [pool.submit(load, p) for p in next(chunks, [])]
+        while ahead:
+            # keep the next chunk loading while this one is consumed
+            current, ahead = ahead, [pool.submit(load, p) for p in next(chunks, [])]
+            for fut in current:
+                path, key, hit, img = fut.result()
+                if hit is not None:
+                    yield path, hit[0], hit[1]
+                elif img is not None:
+                    misses.append((path, key, img))
+                if len(misses) >= batch_size:
+                    yield from _predict_misses(engine, misses, conf, cache)
+                    misses = []
+        yield from _predict_misses(engine, misses, conf, cache)
+    cache.flush()
+
+
+def _predict_misses(engine, misses, conf, cache):
+    if not misses:
+        return
+    for (path, key, img), dets in zip(misses, engine.predict([img for _, _, img in misses], conf=conf)):
+        cache.put(key, img.shape, dets)
+        yield path, img.shape[:2], dets
+
+
+def open_cache(engine, model_path, cache_dir, conf) -> Optional[PredictionCache]:
+    """Prediction cache for this model and inference setup, or None if the weights can't be hashed."""
+    if not cache_dir or not os.path.exists(model_path):
+        return None
+    params = {'conf': conf, 'iou': 0.7, 'imgsz': engine.imgsz, 'backend': engine.backend}
+    return PredictionCache(cache_dir, file_sha256(model_path), params)
+
+
+def sweep(samples, confs, ious, agnostic=True) -> List[dict]:
+    """P/R/F1 for every (conf, iou) pair from one set of raw predictions.
+
+    Predictions are matched once, at every IoU in `ious` and with no confidence cut:
+    matching is greedy by confidence, so the predictions above any threshold get the
+    same TP/FP marks as they would if only they were matched.
+    """
+    ious = np.asarray(ious, dtype=float)
+    tps, scores, n_gt = [], [], 0
+    for dets, gt in samples:
+        tps.append(match_predictions(dets, gt, ious, agnostic))
+        scores.append(dets[:, 4])
+        n_gt += len(gt)
+    tp = np.concatenate(tps) if tps else np.zeros((0, len(ious)), dtype=bool)
+    conf = np.concatenate(scores) if scores else np.zeros(0)
+
+    rows = []
+    for j, iou_thr in enumerate(ious.tolist()):
+        for conf_thr in confs:
+            keep = conf >= conf_thr
+            tp_k = int(tp[keep, j].sum())
+            n_pred = int(keep.sum())
+            precision = tp_k / n_pred if n_pred else 0.0
+            recall = tp_k / n_gt if n_gt else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.0
+            rows.append({'conf': conf_thr, 'iou': iou_thr, 'precision': round(precision, 4),
+                         'recall': round(recall, 4), 'f1': round(f1, 4)})
+    return rows
+
+
+def evaluate(model_path, images_dir, labels_dir, out_csv, iou_thr=0.5, conf_thr=0.25, backend=DEFAULT_BACKEND,
+             batch_size=16, agnostic=True, curves_csv=None, cache_dir=DEFAULT_CACHE_DIR, sweep_confs=None,
+             sweep_ious=None, sweep_csv=None):
+    engine = get_engine(model_path, backend)
+    pack = PackedDataset(images_dir) if is_pack(images_dir) else None
+    if pack is not None:
+        images, read = pack.paths, pack.read
+    else:
+        images, read = [p for p in list_sources(images_dir) if is_image(p)], _read_file
+    base_conf = min(conf_thr, BASE_CONF)
+    cache = open_cache(engine, model_path, cache_dir, base_conf)
+
+    rows = []
+    samples = []
+    for img_path, (h, w), dets in predict_images(engine, images, base_conf, batch_size, cache=cache, read=read):
+        if pack is not None and not labels_dir:
+            gt = yolo_to_pixels(pack.labels(pack.position(img_path)), w, h)
+        else:
+            gt = read_yolo_labels(os.path.join(labels_dir, os.path.splitext(os.path.basename(img_path))[0] + '.txt'),
+                                  w, h)
+        samples.append((dets, gt))
+        rows.append({'image': os.path.basename(img_path), 'predictions': int((dets[:, 4] >= conf_thr).sum()),
+                     'gt': len(gt)})
+
+    m = evaluate_detections(samples, iou_thr=iou_thr, conf_thr=conf_thr, agnostic=agnostic)
+
+    os.makedirs(os.path.dirname(out_csv) or '.', exist_ok=True)
     with open(out_csv, 'w', newline='') as f:
         writer = csv.DictWriter(f, fieldnames=['image', 'predictions', 'gt'])
         writer.writeheader()
         for r in rows:
             writer.writerow(r)
-        writer.writerow({'image': 'SUMMARY', 'predictions': f'precision={precision:.3f}', 'gt': f'recall={recall:.3f}, f1={f1:.3f}'})
+        writer.writerow({'image': 'SUMMARY', 'predictions': f"precision={m['precision']:.3f}",
+                         'gt': f"recall={m['recall']:.3f}, f1={m['f1']:.3f}"})
+        writer.writerow({'image': 'MAP', 'predictions': f"mAP50={m['map50']:.3f}",
+                         'gt': f"mAP50-95={m['map50_95']:.3f}"})
+
+    if curves_csv:
+        os.makedirs(os.path.dirname(curves_csv) or '.', exist_ok=True)
+        with open(curves_csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['conf', 'precision', 'recall', 'f1'])
+            c = m['curve']
+            for row in zip(c['conf'], c['precision'], c['recall'], c['f1']):
+                writer.writerow([f'{v:.4f}' for v in row])
+
+    if sweep_csv and (sweep_confs or sweep_ious):
+        os.makedirs(os.path.dirname(sweep_csv) or '.', exist_ok=True)
+        with open(sweep_csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['conf', 'iou', 'precision', 'recall', 'f1'])
+            writer.writeheader()
+            writer.writerows(sweep(samples, sweep_confs or [conf_thr], sweep_ious or [iou_thr], agnostic))
 
-    print(f"Evaluation complete. Precision={precision:.3f}, Recall={recall:.3f}, F1={f1:.3f}. Results saved to {out_csv}")
+    if cache is not None:
+        print(f"Prediction cache {cache.dir}: {cache.hits} hits, {cache.misses} misses")
+    print(f"Evaluation complete. Precision={m['precision']:.3f}, Recall={m['recall']:.3f}, F1={m['f1']:.3f}, "
+          f"mAP50={m['map50']:.3f}, mAP50-95={m['map50_95']:.3f}. Results saved to {out_csv}")
+    return m
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--model', required=True)
-    parser.add_argument('--images', required=True)
-    parser.add_argument('--labels', required=True)
+    parser.add_argument('--images', required=True, help='image folder or packed dataset (src/packed.py)')
+    parser.add_argument('--labels', default=None, help='YOLO labels (default: the labels inside a pack)')
     parser.add_argument('--out', default='outputs/eval.csv')
+    parser.add_argument('--backend', type=str, default=DEFAULT_BACKEND, choices=BACKENDS)
+    parser.add_argument('--iou', type=float, default=0.5, help='IoU threshold for precision/recall/F1')
+    parser.add_argument('--conf', type=float, default=0.25, help='confidence threshold for precision/recall/F1')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--classes', action='store_true', help='match predictions to ground truth of the same class only')
+    parser.add_argument('--curves', default=None, help='write the per-confidence P/R/F1 curve to this CSV')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='prediction cache location')
+    parser.add_argument('--no-cache', action='store_true', help='always run inference')
+    parser.add_argument('--sweep-conf', default=None, help='comma-separated confidence thresholds to sweep')
+    parser.add_argument('--sweep-iou', default=None, help='comma-separated IoU thresholds to sweep')
+    parser.add_argument('--sweep-out', default='outputs/eval_sweep.csv')
     args = parser.parse_args()
-    evaluate(args.model, args.images, args.labels, args.out)
+    if args.labels is None and not is_pack(args.images):
+        parser.error('--labels is required unless --images is a packed dataset')
+    floats = lambda v: [float(x) for x in v.split(',')] if v else None  # noqa: E731
+    evaluate(args.model, args.images, args.labels, args.out, iou_thr=args.iou, conf_thr=args.conf,
+             backend=args.backend, batch_size=args.batch_size, agnostic=not args.classes, curves_csv=args.curves,
+             cache_dir=None if args.no_cache else args.cache_dir, sweep_confs=floats(args.sweep_conf),
+             sweep_ious=floats(args.sweep_iou), sweep_csv=args.sweep_out)
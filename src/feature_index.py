@@ -0,0 +1,191 @@
+"""Precomputed ORB feature index for locating known patterns in images.
+
+ORB keypoints and descriptors of a template library are computed once and saved
+as plain .npy columns. At load time they are memory-mapped, so opening an index
+of hundreds of templates doesn't read or recompute anything. Matching uses a
+FLANN LSH index over all template descriptors at once. A Lowe ratio test is
+applied, then matches are grouped per template and a RANSAC homography per
+template localises it in the image.
+
+Layout:
+    <dir>/meta.json          names, template sizes, ORB settings
+    <dir>/descriptors.npy    (K, 32) uint8, all templates concatenated
+    <dir>/keypoints.npy      (K, 4) float32 x, y, size, angle
+    <dir>/template_ids.npy   (K,) int32 template index of every row
+
+    python src/feature_index.py build --templates "data/templates/*.png" --out outputs/orb_index
+    python src/feature_index.py match --index outputs/orb_index --image data/sample1.jpg --out outputs/orb_locate.jpg
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+try:
+    from .matching import to_gray
+except ImportError:
+    from matching import to_gray
+
+FLANN_INDEX_LSH = 6
+
+
+def _orb(nfeatures: int):
+    return cv2.ORB_create(nfeatures)
+
+
+def _keypoint_rows(kps) -> np.ndarray:
+    return np.array([(k.pt[0], k.pt[1], k.size, k.angle) for k in kps], dtype=np.float32).reshape(-1, 4)
+
+
+def build_index(templates: Dict[str, np.ndarray], out_dir: Optional[str] = None, nfeatures: int = 1000) -> 'FeatureIndex':
+    """Compute ORB features for `templates` ({name: image}); save them to `out_dir` if given."""
+    orb = _orb(nfeatures)
+    descs, kps, ids, shapes = [], [], [], []
+    for i, tpl in enumerate(templates.values()):
+        gray = to_gray(tpl)
+        kp, des = orb.detectAndCompute(gray, None)
+        shapes.append(list(gray.shape[:2]))
+        if des is None:
+            continue
+        descs.append(des)
+        kps.append(_keypoint_rows(kp))
+        ids.append(np.full(len(kp), i, dtype=np.int32))
+    meta = {'names': list(templates), 'shapes': shapes, 'nfeatures': nfeatures}
+    arrays = {
+        'descriptors': np.concatenate(descs) if descs else np.zeros((0, 32), np.uint8),
+        'keypoints': np.concatenate(kps) if kps else np.zeros((0, 4), np.float32),
+        'template_ids': np.concatenate(ids) if ids else np.zeros(0, np.int32),
+    }
+    if out_dir is None:
+        return FeatureIndex(meta, **arrays)
+    os.makedirs(out_dir, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f'{name}.npy'), arr)
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return FeatureIndex.load(out_dir)
+
+
+class FeatureIndex:
+    """ORB descriptors of a template library behind a FLANN LSH matcher."""
+
+    def __init__(self, meta: dict, descriptors: np.ndarray, keypoints: np.ndarray, template_ids: np.ndarray):
+        self.names: List[str] = meta['names']
+        self.shapes = [tuple(s) for s in meta['shapes']]
+        self.nfeatures = meta['nfeatures']
+        self.descriptors = descriptors
+        self.keypoints = keypoints
+        self.template_ids = template_ids
+        self._orb = _orb(self.nfeatures)
+        self._flann = None
+
+    @classmethod
+    def load(cls, path: str) -> 'FeatureIndex':
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+                  for name in ('descriptors', 'keypoints', 'template_ids')}
+        return cls(meta, **arrays)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def flann(self):
+        if self._flann is None:
+            params = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+            self._flann = cv2.FlannBasedMatcher(params, dict(checks=50))
+            self._flann.add([np.ascontiguousarray(self.descriptors)])
+            self._flann.train()
+        return self._flann
+
+    def match(self, img: np.ndarray, ratio: float = 0.75, min_inliers: int = 10,
+              ransac_thresh: float = 5.0) -> List[dict]:
+        """Locate indexed templates in `img`, best (most RANSAC inliers) first.
+
+        Every result has the template name, the number of inliers, the 3x3
+        homography from template to image, the projected template corners and
+        their bounding box, plus the inlier point pairs (`src_pts` in the template,
+        `dst_pts` in the image).
+        """
+        if not len(self.descriptors):
+            return []
+        kps, des = self._orb.detectAndCompute(to_gray(img), None)
+        if des is None or len(kps) < 2:
+            return []
+        by_template: Dict[int, list] = {}
+        for pair in self.flann.knnMatch(des, k=2):
+            # LSH may return fewer than two neighbours
+            if len(pair) == 2 and pair[0].distance < ratio * pair[1].distance:
+                m = pair[0]
+                by_template.setdefault(int(self.template_ids[m.trainIdx]), []).append((m.trainIdx, m.queryIdx))
+
+        results = []
+        for tid, pairs in by_template.items():
+            if len(pairs) < max(min_inliers, 4):
+                continue
+            rows, query = np.array(pairs).T
+            src = np.asarray(self.keypoints[rows, :2], dtype=np.float32)
+            dst = np.float32([kps[q].pt for q in query])
+            H, mask = cv2.findHomography(src, dst, cv2.RANSAC, ransac_thresh)
+            if H is None:
+                continue
+            inliers = mask.ravel().astype(bool)
+            if inliers.sum() < min_inliers:
+                continue
+            h, w = self.shapes[tid]
+            corners = cv2.perspectiveTransform(np.float32([[0, 0], [w, 0], [w, h], [0, h]])[None], H)[0]
+            (x1, y1), (x2, y2) = corners.min(0), corners.max(0)
+            results.append({'template': self.names[tid], 'inliers': int(inliers.sum()), 'homography': H,
+                            'corners': corners, 'xyxy': [float(x1), float(y1), float(x2), float(y2)],
+                            'src_pts': src[inliers], 'dst_pts': dst[inliers]})
+        return sorted(results, key=lambda r: -r['inliers'])
+
+
+def draw_locations(img: np.ndarray, results: List[dict]) -> np.ndarray:
+    out = img.copy()
+    for r in results:
+        cv2.polylines(out, [np.int32(r['corners'])], True, (0, 255, 0), 3, cv2.LINE_AA)
+        x, y = np.int32(r['corners'][0])
+        cv2.putText(out, f"{r['template']} {r['inliers']}", (int(x), max(int(y) - 6, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
+    return out
+
+
+if __name__ == '__main__':
+    from sources import is_image, list_sources
+    from utils import ensure_dir, save_image
+
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    b = sub.add_parser('build', help='compute and save ORB features for a template library')
+    b.add_argument('--templates', nargs='+', required=True, help='template images, folders or globs')
+    b.add_argument('--out', required=True, help='index directory')
+    b.add_argument('--nfeatures', type=int, default=1000)
+    m = sub.add_parser('match', help='locate indexed templates in an image')
+    m.add_argument('--index', required=True)
+    m.add_argument('--image', required=True)
+    m.add_argument('--out', default='outputs/orb_locate.jpg')
+    m.add_argument('--ratio', type=float, default=0.75)
+    m.add_argument('--min-inliers', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        paths = [p for spec in args.templates for p in list_sources(spec) if is_image(p)]
+        templates = {os.path.splitext(os.path.basename(p))[0]: cv2.imread(p, cv2.IMREAD_GRAYSCALE) for p in paths}
+        index = build_index(templates, args.out, args.nfeatures)
+        print(f"Indexed {len(index)} templates ({len(index.descriptors)} descriptors) in {args.out}")
+    else:
+        index = FeatureIndex.load(args.index)
+        img = cv2.imread(args.image)
+        if img is None:
+            raise ValueError(f"Could not read image: {args.image}")
+        found = index.match(img, args.ratio, args.min_inliers)
+        ensure_dir(os.path.dirname(args.out) or '.')
+        save_image(args.out, draw_locations(img, found))
+        for r in found:
+            print(f"{r['template']}: {r['inliers']} inliers at {[round(v) for v in r['xyxy']]}")
+        print(f"Saved {len(found)} locations to {args.out}")
@@ -0,0 +1,119 @@
+"""Response formats for /detect, shared by the API and the client.
+
+    json       application/json: {"detections": [{xyxy, conf, cls}, ...]} plus the
+               annotated JPEG as base64 (the original format)
+    multipart  multipart/mixed: the same JSON without base64, then the raw image part
+    msgpack    application/msgpack: {"boxes": <N*6 float32 bytes>, "n": N, "image": <JPEG bytes>, "image_type"}
+    boxes      application/vnd.patterndetect.boxes: the raw N x 6 little-endian
+               float32 array (x1, y1, x2, y2, conf, cls), detections only
+
+The format is picked with `?format=` or negotiated from the Accept header; JSON
+stays the default. Every binary format avoids base64 and per-box dicts.
+"""
+import base64
+import json
+import os
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # optional: only the msgpack format needs it
+    msgpack = None
+
+JSON = 'application/json'
+MULTIPART = 'multipart/mixed'
+MSGPACK = 'application/msgpack'
+BOXES = 'application/vnd.patterndetect.boxes'
+FORMATS = {'json': JSON, 'multipart': MULTIPART, 'msgpack': MSGPACK, 'boxes': BOXES}
+_BY_MEDIA_TYPE = {**{v: k for k, v in FORMATS.items()}, 'application/x-msgpack': 'msgpack'}
+BOX_DTYPE = np.dtype('<f4')
+
+
+def negotiate(accept: Optional[str], fmt: Optional[str] = None) -> str:
+    """Format name from an explicit `fmt`, else the best supported type in `accept` (default 'json')."""
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {sorted(FORMATS)}")
+        return fmt
+    ranked = []
+    for i, item in enumerate((accept or '').split(',')):
+        media_type, *params = [p.strip() for p in item.split(';')]
+        q = 1.0
+        for p in params:
+            if p.startswith('q='):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type.lower() in _BY_MEDIA_TYPE and q > 0:
+            ranked.append((-q, i, _BY_MEDIA_TYPE[media_type.lower()]))
+    return min(ranked)[2] if ranked else 'json'
+
+
+def detections_json(boxes: np.ndarray) -> list:
+    return [{'xyxy': [round(x, 2) for x in row[:4]], 'conf': row[4], 'cls': int(row[5])} for row in boxes.tolist()]
+
+
+def encode(fmt: str, boxes: np.ndarray, image: Optional[bytes] = None,
+           image_type: str = 'image/jpeg') -> Tuple[bytes, str]:
+    """Serialise (N, 6) `boxes` and an optional annotated image; returns (body, content type)."""
+    if fmt == 'json':
+        body = {'detections': detections_json(boxes)}
+        if image is not None:
+            body['annotated_image_base64'] = base64.b64encode(image).decode('ascii')
+            if image_type != 'image/jpeg':
+                body['annotated_image_type'] = image_type
+        return json.dumps(body).encode(), JSON
+    if fmt == 'boxes':
+        return np.ascontiguousarray(boxes, dtype=BOX_DTYPE).tobytes(), BOXES
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise RuntimeError('msgpack is not installed on the server')
+        raw = np.ascontiguousarray(boxes, dtype=BOX_DTYPE).tobytes()
+        return msgpack.packb({'boxes': raw, 'n': len(boxes), 'image': image, 'image_type': image_type}), MSGPACK
+    if fmt == 'multipart':
+        boundary = os.urandom(12).hex()
+        parts = [(JSON, json.dumps({'detections': detections_json(boxes)}).encode())]
+        if image is not None:
+            parts.append((image_type, image))
+        body = b''.join(b'--%s\r\nContent-Type: %s\r\nContent-Length: %d\r\n\r\n%s\r\n'
+                        % (boundary.encode(), ctype.encode(), len(data), data) for ctype, data in parts)
+        return body + b'--%s--\r\n' % boundary.encode(), f'{MULTIPART}; boundary={boundary}'
+    raise ValueError(f"unknown format {fmt!r}")
+
+
+def decode(content_type: str, body: bytes) -> Tuple[np.ndarray, Optional[bytes]]:
+    """Inverse of `encode()` for any format: returns ((N, 6) float32 boxes, annotated JPEG or None)."""
+    media_type = content_type.split(';')[0].strip().lower()
+    if media_type == BOXES:
+        return np.frombuffer(body, dtype=BOX_DTYPE).reshape(-1, 6), None
+    if media_type in (MSGPACK, 'application/x-msgpack'):
+        if msgpack is None:
+            raise RuntimeError('install msgpack to decode msgpack responses')
+        data = msgpack.unpackb(body)
+        return np.frombuffer(data['boxes'], dtype=BOX_DTYPE).reshape(-1, 6), data.get('image')
+    if media_type == MULTIPART:
+        msg = BytesParser(policy=HTTP).parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        boxes, image = np.zeros((0, 6), BOX_DTYPE), None
+        for part in msg.iter_parts():
+            if part.get_content_type() == JSON:
+                boxes = _boxes_from_json(json.loads(part.get_payload(decode=True)))
+            elif part.get_content_maintype() == 'image':
+                image = part.get_payload(decode=True)
+        return boxes, image
+    if media_type == JSON:
+        data = json.loads(body)
+        image = data.get('annotated_image_base64')
+        if image is not None:
+            image = base64.b64decode(image)
+        return _boxes_from_json(data), image
+    raise ValueError(f"unsupported response type {content_type!r}")
+
+
+def _boxes_from_json(data: dict) -> np.ndarray:
+    rows = [d['xyxy'] + [d['conf'], d['cls']] for d in data.get('detections', [])]
+    return np.asarray(rows, dtype=BOX_DTYPE).reshape(-1, 6)
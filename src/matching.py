@@ -0,0 +1,184 @@
+"""Multi-scale, multi-template matching with a coarse-to-fine pyramid search.
+
+`TemplateMatcher` holds a library of templates and finds every occurrence of any
+of them, over a range of scales, in one image:
+
+1. the image's Gaussian pyramid is built once and shared by all templates;
+2. each (template, scale) pair is first searched on the coarsest pyramid level
+   where the template is still at least `min_size` pixels, which is 4-64x cheaper
+   than the full-resolution search;
+3. local maxima above a slightly lowered threshold are refined at full resolution,
+   inside a small window around each candidate only;
+4. refined hits above `threshold` go through non-maximum suppression.
+
+Matches use the same (N, 6) float32 layout as detections: x1, y1, x2, y2, score,
+template index. `cv2.matchTemplate` already correlates in the frequency domain
+(DFT) once templates are large, so the pyramid is what keeps the cost down.
+"""
+import os
+from typing import Dict, List, Optional, Sequence, Union
+
+import cv2
+import numpy as np
+
+NO_MATCHES = np.zeros((0, 6), dtype=np.float32)
+METHODS = {'ccoeff': cv2.TM_CCOEFF_NORMED, 'ccorr': cv2.TM_CCORR_NORMED, 'sqdiff': cv2.TM_SQDIFF_NORMED}
+
+
+def to_gray(img: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+def scale_range(lo: float = 1.0, hi: float = 1.0, steps: int = 1) -> List[float]:
+    """`steps` scales spaced geometrically between `lo` and `hi`."""
+    return [float(s) for s in np.geomspace(lo, hi, steps)] if steps > 1 and lo != hi else [float(lo)]
+
+
+def local_peaks(res: np.ndarray, min_score: float, radius: int, limit: int) -> np.ndarray:
+    """(x, y) of the `limit` best local maxima of `res` scoring at least `min_score`."""
+    size = 2 * max(radius, 1) + 1
+    dilated = cv2.dilate(res, cv2.getStructuringElement(cv2.MORPH_RECT, (size, size)))
+    ys, xs = np.nonzero((res >= min_score) & (res >= dilated))
+    order = np.argsort(-res[ys, xs])[:limit]
+    return np.stack([xs[order], ys[order]], 1)
+
+
+def nms(matches: np.ndarray, iou: float, agnostic: bool = True) -> np.ndarray:
+    if len(matches) < 2:
+        return matches
+    xywh = np.concatenate([matches[:, :2], matches[:, 2:4] - matches[:, :2]], 1).tolist()
+    scores = matches[:, 4].tolist()
+    if agnostic:
+        keep = cv2.dnn.NMSBoxes(xywh, scores, 0.0, iou)
+    else:
+        keep = cv2.dnn.NMSBoxesBatched(xywh, scores, matches[:, 5].astype(int).tolist(), 0.0, iou)
+    keep = np.asarray(keep, dtype=int).reshape(-1)
+    return matches[keep[np.argsort(-matches[keep, 4])]]
+
+
+class TemplateMatcher:
+    """Finds all templates of a library in an image over a range of scales.
+
+    templates:  {name: image} or a list of image paths (named by file stem)
+    scales:     template scale factors to search
+    threshold:  minimum normalised score of a match
+    nms_iou:    overlap above which the weaker of two matches is dropped
+    agnostic:   suppress overlaps across templates too (one part per location)
+    min_size:   smallest template side searched on a coarse pyramid level
+    max_levels: deepest pyramid level used for the coarse search (0 = full search only)
+    coarse_margin: how far below `threshold` coarse candidates may score
+    max_candidates: coarse candidates refined per (template, scale)
+    """
+
+    def __init__(self, templates: Union[Dict[str, np.ndarray], Sequence[str]], scales: Sequence[float] = (1.0,),
+                 threshold: float = 0.8, nms_iou: float = 0.3, agnostic: bool = True, method: str = 'ccoeff',
+                 min_size: int = 12, max_levels: int = 3, coarse_margin: float = 0.15, max_candidates: int = 64):
+        if not isinstance(templates, dict):
+            templates = {os.path.splitext(os.path.basename(p))[0]: self._read(p) for p in templates}
+        if not templates:
+            raise ValueError('at least one template is required')
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {sorted(METHODS)}")
+        self.names = list(templates)
+        self.templates = [to_gray(t) for t in templates.values()]
+        self.scales = list(scales)
+        self.threshold = threshold
+        self.nms_iou = nms_iou
+        self.agnostic = agnostic
+        self.method = METHODS[method]
+        self.min_size = min_size
+        self.max_levels = max_levels
+        self.coarse_margin = coarse_margin
+        self.max_candidates = max_candidates
+        # resized templates per (template, scale, level), built on first use
+        self._resized: Dict[tuple, np.ndarray] = {}
+
+    @staticmethod
+    def _read(path: str) -> np.ndarray:
+        tpl = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if tpl is None:
+            raise ValueError(f"Could not read template: {path}")
+        return tpl
+
+    def _template(self, index: int, scale: float, level: int) -> Optional[np.ndarray]:
+        key = (index, scale, level)
+        tpl = self._resized.get(key)
+        if tpl is None:
+            base = self.templates[index]
+            f = scale / (1 << level)
+            w, h = round(base.shape[1] * f), round(base.shape[0] * f)
+            if min(w, h) < 1:
+                return None
+            interp = cv2.INTER_AREA if f < 1 else cv2.INTER_LINEAR
+            tpl = self._resized[key] = base if f == 1 else cv2.resize(base, (w, h), interpolation=interp)
+        return tpl
+
+    def _score(self, img: np.ndarray, tpl: np.ndarray) -> np.ndarray:
+        res = cv2.matchTemplate(img, tpl, self.method)
+        # flat regions give NaN / inf under the normalised methods
+        np.nan_to_num(res, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        return 1.0 - res if self.method == cv2.TM_SQDIFF_NORMED else res
+
+    def _level(self, tpl_shape) -> int:
+        level = 0
+        while level < self.max_levels and min(tpl_shape) >> (level + 1) >= self.min_size:
+            level += 1
+        return level
+
+    def _search(self, pyramid: List[np.ndarray], index: int, scale: float) -> List[list]:
+        img = pyramid[0]
+        tpl = self._template(index, scale, 0)
+        if tpl is None or tpl.shape[0] > img.shape[0] or tpl.shape[1] > img.shape[1]:
+            return []
+        th, tw = tpl.shape
+        level = min(self._level(tpl.shape), len(pyramid) - 1)
+        found = []
+        if level == 0:
+            res = self._score(img, tpl)
+            for x, y in local_peaks(res, self.threshold, min(tw, th) // 4, self.max_candidates).tolist():
+                found.append([x, y, x + tw, y + th, res[y, x], index])
+            return found
+
+        coarse_tpl = self._template(index, scale, level)
+        coarse = pyramid[level]
+        if coarse_tpl.shape[0] > coarse.shape[0] or coarse_tpl.shape[1] > coarse.shape[1]:
+            return []
+        res = self._score(coarse, coarse_tpl)
+        f = 1 << level
+        peaks = local_peaks(res, self.threshold - self.coarse_margin, min(coarse_tpl.shape) // 4, self.max_candidates)
+        ih, iw = img.shape
+        for cx, cy in peaks.tolist():
+            # refine in a window of +-f pixels around the up-scaled coarse position
+            x0, y0 = max(cx * f - f, 0), max(cy * f - f, 0)
+            x1, y1 = min(cx * f + f + tw, iw), min(cy * f + f + th, ih)
+            if x1 - x0 < tw or y1 - y0 < th:
+                continue
+            fine = self._score(img[y0:y1, x0:x1], tpl)
+            _, score, _, (dx, dy) = cv2.minMaxLoc(fine)
+            if score >= self.threshold:
+                x, y = x0 + dx, y0 + dy
+                found.append([x, y, x + tw, y + th, score, index])
+        return found
+
+    def pyramid(self, img: np.ndarray) -> List[np.ndarray]:
+        levels = [to_gray(img)]
+        for _ in range(self.max_levels):
+            if min(levels[-1].shape) < 2 * self.min_size:
+                break
+            levels.append(cv2.pyrDown(levels[-1]))
+        return levels
+
+    def match(self, img: np.ndarray) -> np.ndarray:
+        """All matches in `img` (BGR or gray) as an (N, 6) array, best first."""
+        pyramid = self.pyramid(img)
+        found = []
+        for index in range(len(self.templates)):
+            for scale in self.scales:
+                found.extend(self._search(pyramid, index, scale))
+        if not found:
+            return NO_MATCHES.copy()
+        return nms(np.asarray(found, dtype=np.float32), self.nms_iou, self.agnostic)
+
+    def to_dicts(self, matches: np.ndarray) -> List[dict]:
+        return [{'template': self.names[int(m[5])], 'xyxy': [int(v) for v in m[:4]], 'score': round(float(m[4]), 4)}
+                for m in matches]
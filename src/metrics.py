@@ -0,0 +1,171 @@
+"""Minimal Prometheus metrics: counters, gauges and histograms in the text exposition format.
+
+Only what the API needs, with no dependency on prometheus_client. Metrics are
+created on a `MetricsRegistry` and rendered by `registry.render()` for a
+`/metrics` endpoint. Gauges may take a callback that is read at scrape time
+(queue depth, in-flight requests).
+
+`stage(name)` times one pipeline stage: it observes the stage histogram and,
+inside a request that enabled it with `start_timing()`, records the duration
+for the `Server-Timing` response header.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _value(v: float) -> str:
+    return repr(float(v)) if v != float('inf') else '+Inf'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}'] + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=(), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        if self.fn is not None:
+            return [f'{self.name} {_value(self.fn())}']
+        return [f'{self.name}{_labels(self.labelnames, k)} {_value(v)}' for k, v in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def count(self, **labels) -> int:
+        row = self._values.get(self._key(labels))
+        return row[-1] if row else 0
+
+    def samples(self):
+        lines = []
+        for key, row in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                le = _labels(self.labelnames, key, f'le="{_value(bound)}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_value(row[-2])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {row[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), fn=None) -> Counter:
+        return self._add(Counter(name, help, labelnames, fn))
+
+    def gauge(self, name, help, labelnames=(), fn=None) -> Gauge:
+        return self._add(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        return '\n'.join(line for m in self.metrics for line in m.render()) + '\n'
+
+
+# --- per-request stage timing ---------------------------------------------------
+
+_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar('timings', default=None)
+
+
+def start_timing() -> List[Tuple[str, float]]:
+    """Collect (stage, seconds) for the current request; returns the list that fills up."""
+    timings: List[Tuple[str, float]] = []
+    _timings.set(timings)
+    return timings
+
+
+@contextlib.contextmanager
+def stage(histogram: Histogram, name: str):
+    """Time the enclosed block as pipeline stage `name`."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        histogram.observe(elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    """`Server-Timing` header value, e.g. 'decode;dur=4.1, infer;dur=38.2'."""
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings)
@@ -0,0 +1,271 @@
+"""Packed dataset container: many images + YOLO labels in a few memory-mapped files.
+
+Reading thousands of small JPEGs and .txt files is dominated by directory walks and
+file opens on network volumes. `pack()` consolidates a dataset into one folder:
+
+    meta.json          format, version, image count, shard file names
+    paths.json         relative path of every image (the dataset layout, for unpacking)
+    index.npy          per image: shard, offset, size, width, height, label_start, label_count, labeled
+    labels.npy         (M, 5) float32 cls, cx, cy, w, h of all images, back to back
+    images-00000.bin   the original encoded image bytes, back to back (no re-encoding)
+
+`PackedDataset` memory-maps the index, labels and shards, so random access to an
+image's bytes or labels is a zero-copy slice. Image ids are virtual paths inside
+the pack folder (<pack>/<relative path>), so code that derives label names from
+relative paths works unchanged.
+
+Training goes through Ultralytics, whose loader reads files from disk:
+`stage_data_yaml()` unpacks the packed splits of a dataset yaml to a local stage
+folder once (e.g. from a network volume to local disk) and rewrites the yaml.
+
+    python src/packed.py pack --images data/dataset/images/val --labels data/dataset/labels/val --out data/val.pack
+    python src/packed.py unpack --pack data/val.pack --images /tmp/val/images --labels /tmp/val/labels
+    python src/packed.py info --pack data/val.pack
+"""
+import argparse
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .sources import batched, is_image, list_sources
+    from .utils import decode_image, ensure_dir, write_text_atomic
+except ImportError:
+    from sources import batched, is_image, list_sources
+    from utils import decode_image, ensure_dir, write_text_atomic
+
+FORMAT = 'patterndetect-pack'
+VERSION = 1
+INDEX_DTYPE = np.dtype([('shard', '<i4'), ('offset', '<i8'), ('size', '<i8'), ('width', '<i4'), ('height', '<i4'),
+                        ('label_start', '<i8'), ('label_count', '<i4'), ('labeled', 'u1')])
+DEFAULT_SHARD_BYTES = 1 << 30
+
+
+def is_pack(path: str) -> bool:
+    meta = os.path.join(path, 'meta.json')
+    if not os.path.isfile(meta):
+        return False
+    with open(meta) as f:
+        return json.load(f).get('format') == FORMAT
+
+
+def _image_size(data: bytes) -> Tuple[int, int]:
+    """(width, height) from the image header, without decoding the pixels."""
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as im:
+        return im.size
+
+
+def _read_item(image_path: str, label_path: str):
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    try:
+        size = _image_size(data)
+    except Exception:
+        return None
+    labels = None
+    if os.path.exists(label_path):
+        with open(label_path) as f:
+            rows = [line.split()[:5] for line in f if len(line.split()) >= 5]
+        labels = np.asarray(rows, dtype=np.float32).reshape(-1, 5)
+    return data, size, labels
+
+
+def pack(images_dir: str, labels_dir: Optional[str], out: str, shard_bytes: int = DEFAULT_SHARD_BYTES,
+         workers: int = 8) -> int:
+    """Pack every image under `images_dir` (recursively) plus its YOLO label into `out`; returns the count.
+
+    Files are read on `workers` threads. Unreadable images are skipped.
+    """
+    images = [p for p in list_sources(images_dir, recursive=True) if is_image(p)]
+    ensure_dir(out)
+    index, paths, labels, shards = [], [], [], []
+    n_labels = 0
+    shard_file = None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for chunk in batched(images, 4 * workers):
+                rels = [os.path.relpath(p, images_dir) for p in chunk]
+                label_paths = [os.path.join(labels_dir or images_dir, os.path.splitext(r)[0] + '.txt') for r in rels]
+                for path, rel, item in zip(chunk, rels, pool.map(_read_item, chunk, label_paths)):
+                    if item is None:
+                        print(f'Skipping unreadable image {path}')
+                        continue
+                    data, (w, h), lab = item
+                    if shard_file is None or (shard_file.tell() and shard_file.tell() + len(data) > shard_bytes):
+                        if shard_file is not None:
+                            shard_file.close()
+                        shards.append(f'images-{len(shards):05d}.bin')
+                        shard_file = open(os.path.join(out, shards[-1]), 'wb')
+                    count = 0 if lab is None else len(lab)
+                    index.append((len(shards) - 1, shard_file.tell(), len(data), w, h, n_labels, count,
+                                  lab is not None))
+                    shard_file.write(data)
+                    if count:
+                        labels.append(lab)
+                    n_labels += count
+                    paths.append(rel.replace(os.sep, '/'))
+    finally:
+        if shard_file is not None:
+            shard_file.close()
+
+    np.save(os.path.join(out, 'index.npy'), np.array(index, dtype=INDEX_DTYPE))
+    np.save(os.path.join(out, 'labels.npy'), np.concatenate(labels) if labels else np.zeros((0, 5), np.float32))
+    write_text_atomic(os.path.join(out, 'paths.json'), json.dumps(paths))
+    # meta.json last: a pack without it is incomplete and not recognised by is_pack()
+    write_text_atomic(os.path.join(out, 'meta.json'), json.dumps(
+        {'format': FORMAT, 'version': VERSION, 'count': len(paths), 'labels': n_labels, 'shards': shards}))
+    return len(paths)
+
+
+class PackedDataset:
+    """Read-only, memory-mapped view of a pack made by `pack()`."""
+
+    def __init__(self, path: str):
+        if not is_pack(path):
+            raise ValueError(f'{path} is not a packed dataset')
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, 'paths.json')) as f:
+            self.relpaths: List[str] = json.load(f)
+        self.index = np.load(os.path.join(path, 'index.npy'), mmap_mode='r')
+        self.all_labels = np.load(os.path.join(path, 'labels.npy'), mmap_mode='r')
+        self._shards: Dict[int, np.memmap] = {}
+        # virtual paths inside the pack folder: relpath(p, pack) is the original relative path
+        self.paths = [os.path.join(path, *rel.split('/')) for rel in self.relpaths]
+        self._lookup = {p: i for i, p in enumerate(self.paths)}
+        self.mtime = os.path.getmtime(os.path.join(path, 'meta.json'))
+
+    def __len__(self):
+        return len(self.relpaths)
+
+    def position(self, path: str) -> int:
+        """Index of the image with virtual path `path`."""
+        return self._lookup[path]
+
+    def _shard(self, k: int) -> np.memmap:
+        shard = self._shards.get(k)
+        if shard is None:
+            shard = self._shards[k] = np.memmap(os.path.join(self.path, self.meta['shards'][k]), dtype=np.uint8,
+                                                mode='r')
+        return shard
+
+    def image_bytes(self, i: int) -> np.ndarray:
+        """The encoded image, as a uint8 view into the memory-mapped shard."""
+        rec = self.index[i]
+        return self._shard(int(rec['shard']))[int(rec['offset']):int(rec['offset']) + int(rec['size'])]
+
+    def image(self, i: int, reduce: int = 1) -> Optional[np.ndarray]:
+        return decode_image(self.image_bytes(i), reduce)
+
+    def read(self, path: str) -> np.ndarray:
+        """image_bytes() by virtual path."""
+        return self.image_bytes(self._lookup[path])
+
+    def decode(self, path: str) -> Optional[np.ndarray]:
+        """Decoded BGR image by virtual path (a `read` callable for sources.iter_frames)."""
+        return decode_image(self.read(path))
+
+    def labels(self, i: int) -> np.ndarray:
+        """(N, 5) cls, cx, cy, w, h (normalised) of image `i`, a view into the label array."""
+        rec = self.index[i]
+        start = int(rec['label_start'])
+        return self.all_labels[start:start + int(rec['label_count'])]
+
+    def shape(self, i: int) -> Tuple[int, int]:
+        """(height, width) from the index, no decoding."""
+        rec = self.index[i]
+        return int(rec['height']), int(rec['width'])
+
+    def info(self) -> dict:
+        sizes = sum(os.path.getsize(os.path.join(self.path, s)) for s in self.meta['shards'])
+        return {'path': self.path, 'images': len(self), 'labels': int(self.meta['labels']),
+                'shards': len(self.meta['shards']), 'bytes': sizes}
+
+
+def unpack(pack_path: str, images_dir: str, labels_dir: str) -> int:
+    """Write a pack back out as <images_dir>/<relpath> plus <labels_dir>/<relpath>.txt; returns the count."""
+    ds = PackedDataset(pack_path)
+    for i, rel in enumerate(ds.relpaths):
+        image_path = os.path.join(images_dir, *rel.split('/'))
+        ensure_dir(os.path.dirname(image_path))
+        with open(image_path, 'wb') as f:
+            f.write(ds.image_bytes(i))
+        if ds.index[i]['labeled']:
+            label_path = os.path.join(labels_dir, *os.path.splitext(rel)[0].split('/')) + '.txt'
+            lines = '\n'.join(f"{int(c)} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}"
+                              for c, cx, cy, w, h in ds.labels(i).tolist())
+            write_text_atomic(label_path, lines)
+    return len(ds)
+
+
+def stage_data_yaml(data_yaml: str, stage_dir: str) -> str:
+    """Ultralytics dataset yaml with every split that points at a pack unpacked into `stage_dir`.
+
+    Ultralytics' data loader needs image and label files on disk, so packed splits are
+    unpacked once to <stage_dir>/<split>/images|labels (the layout it expects) and
+    reused until the pack changes. Returns `data_yaml` itself if no split is packed.
+    """
+    import shutil
+    import yaml
+    with open(data_yaml) as f:
+        cfg = yaml.safe_load(f)
+    root = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), cfg.get('path') or '')
+    staged = False
+    for split in ('train', 'val', 'test'):
+        src = cfg.get(split)
+        if not isinstance(src, str) or not is_pack(os.path.join(root, src)):
+            continue
+        src = os.path.abspath(os.path.join(root, src))
+        dest = os.path.abspath(os.path.join(stage_dir, split))
+        stamp = json.dumps({'pack': src, 'mtime': os.path.getmtime(os.path.join(src, 'meta.json'))})
+        stamp_path = os.path.join(dest, '.pack_stamp')
+        if not os.path.exists(stamp_path) or open(stamp_path).read() != stamp:
+            shutil.rmtree(dest, ignore_errors=True)
+            n = unpack(src, os.path.join(dest, 'images'), os.path.join(dest, 'labels'))
+            write_text_atomic(stamp_path, stamp)
+            print(f'Staged {n} {split} images from {src} in {dest}')
+        cfg[split] = os.path.join(dest, 'images')
+        staged = True
+    if not staged:
+        return data_yaml
+    cfg['path'] = os.path.abspath(root)
+    out = os.path.join(stage_dir, 'data.yaml')
+    write_text_atomic(out, yaml.safe_dump(cfg, sort_keys=False))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pack a YOLO dataset into memory-mapped shards, or unpack it')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('pack')
+    p.add_argument('--images', required=True)
+    p.add_argument('--labels', default=None, help='YOLO labels (default: next to the images)')
+    p.add_argument('--out', required=True, help='pack folder, e.g. data/val.pack')
+    p.add_argument('--shard-mb', type=int, default=DEFAULT_SHARD_BYTES >> 20)
+    p.add_argument('--workers', type=int, default=8, help='file reading threads')
+    u = sub.add_parser('unpack')
+    u.add_argument('--pack', required=True)
+    u.add_argument('--images', required=True)
+    u.add_argument('--labels', required=True)
+    i = sub.add_parser('info')
+    i.add_argument('--pack', required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        n = pack(args.images, args.labels, args.out, args.shard_mb << 20, args.workers)
+        print(f'Packed {n} images into {args.out}')
+    elif args.command == 'unpack':
+        n = unpack(args.pack, args.images, args.labels)
+        print(f'Unpacked {n} images to {args.images}; labels to {args.labels}')
+    else:
+        print(json.dumps(PackedDataset(args.pack).info(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,60 +3,65 @@ Usage:
   python src/pattern_matching.py --image data/sample1.jpg --template data/template.png --out outputs/pattern_match.jpg --orb_out outputs/orb_matches.jpg
 """
 import argparse
+import os
 import cv2
 import numpy as np
-from utils import ensure_dir, save_image
+from feature_index import FeatureIndex, build_index, draw_locations
+from matching import TemplateMatcher, scale_range
+from utils import draw_detections, ensure_dir, save_image
 
 
-def template_match_demo(image_path, template_path, out_path):
+def template_match_demo(image_path, template_path, out_path, threshold=0.8):
     img = cv2.imread(image_path)
-    tpl = cv2.imread(template_path)
-    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    tpl_gray = cv2.cvtColor(tpl, cv2.COLOR_BGR2GRAY)
+    tpl = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
 
     # ensure template is not larger than image; if so, scale it down
-    ih, iw = img_gray.shape
-    th, tw = tpl_gray.shape
-    if th > ih or tw > iw:
-        scale = min(ih / th * 0.9, iw / tw * 0.9)
-        new_w = max(1, int(tpl_gray.shape[1] * scale))
-        new_h = max(1, int(tpl_gray.shape[0] * scale))
-        tpl_gray = cv2.resize(tpl_gray, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        tpl = cv2.resize(tpl, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    ih, iw = img.shape[:2]
+    th, tw = tpl.shape
+    scale = min(ih / th * 0.9, iw / tw * 0.9, 1.0)
 
-    res = cv2.matchTemplate(img_gray, tpl_gray, cv2.TM_CCOEFF_NORMED)
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-    top_left = max_loc
-    h, w = tpl_gray.shape
-    bottom_right = (top_left[0] + w, top_left[1] + h)
+    # search a range of scales around that; every match above the threshold is kept
+    matcher = TemplateMatcher({'template': tpl}, scales=scale_range(0.75 * scale, 1.25 * scale, 5),
+                              threshold=threshold)
+    matches = matcher.match(img)
+    if not len(matches):
+        # nothing above the threshold: show the single best location as before
+        matcher.threshold = -1.0
+        matches = matcher.match(img)[:1]
 
-    out = img.copy()
-    cv2.rectangle(out, top_left, bottom_right, (0, 255, 0), 3)
+    out = draw_detections(img, matches, dict(enumerate(matcher.names)))
     save_image(out_path, out)
-    print(f"Template match result saved to {out_path}; score={max_val:.3f}")
+    print(f"Template match result saved to {out_path}; matches={len(matches)} best score={matches[0, 4]:.3f}")
+
 
+def orb_match_demo(image_path, template_path, out_path, max_matches=40, index=None):
+    """Locate the template with ORB features; `index` (a FeatureIndex) skips recomputing template features.
 
-def orb_match_demo(image_path, template_path, out_path, max_matches=40):
+    The index must contain the template under its file stem (as `feature_index.py build`
+    names entries); matches of other indexed templates are ignored, since only this
+    template's image is drawn.
+    """
     img = cv2.imread(image_path)
     tpl = cv2.imread(template_path)
-    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    tpl_gray = cv2.cvtColor(tpl, cv2.COLOR_BGR2GRAY)
-
-    orb = cv2.ORB_create(1000)
-    kp1, des1 = orb.detectAndCompute(tpl_gray, None)
-    kp2, des2 = orb.detectAndCompute(img_gray, None)
-
-    if des1 is None or des2 is None:
-        print('No descriptors found for ORB matching')
+    name = os.path.splitext(os.path.basename(template_path))[0]
+    if index is None:
+        index = build_index({name: tpl})
+    elif name not in index.names:
+        print(f'Template {name!r} is not in the ORB index ({len(index)} templates)')
         return
 
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-    matches = bf.match(des1, des2)
-    matches = sorted(matches, key=lambda x: x.distance)[:max_matches]
+    found = [r for r in index.match(img, min_inliers=4) if r['template'] == name]
+    if not found:
+        print('No ORB match found for the template')
+        return
 
-    match_img = cv2.drawMatches(tpl, kp1, img, kp2, matches, None, flags=2)
+    best = found[0]
+    pts = lambda a: [cv2.KeyPoint(float(x), float(y), 1) for x, y in a[:max_matches]]  # noqa: E731
+    n = min(len(best['src_pts']), max_matches)
+    match_img = cv2.drawMatches(tpl, pts(best['src_pts']), draw_locations(img, [best]), pts(best['dst_pts']),
+                                [cv2.DMatch(i, i, 0) for i in range(n)], None, flags=2)
     save_image(out_path, match_img)
-    print(f"ORB matching result saved to {out_path}; matches={len(matches)}")
+    print(f"ORB matching result saved to {out_path}; inliers={best['inliers']}")
 
 
 if __name__ == '__main__':
@@ -65,7 +70,9 @@ if __name__ == '__main__':
     parser.add_argument('--template', required=True)
     parser.add_argument('--out', default='outputs/pattern_match.jpg')
     parser.add_argument('--orb_out', default='outputs/orb_matches.jpg')
+    parser.add_argument('--orb_index', default=None, help='prebuilt index from feature_index.py build')
     args = parser.parse_args()
 
     template_match_demo(args.image, args.template, args.out)
-    orb_match_demo(args.image, args.template, args.orb_out)
+    orb_match_demo(args.image, args.template, args.orb_out,
+                   index=FeatureIndex.load(args.orb_index) if args.orb_index else None)
@@ -0,0 +1,100 @@
+"""On-disk cache of raw predictions so evaluation sweeps don't re-run inference.
+
+Predictions are stored per (model weights SHA-256, inference params) in their own
+directory, and looked up by the image's content hash, so changed weights, changed
+params or changed images simply miss the cache; nothing needs to be invalidated
+by hand. Each flush appends a compressed columnar shard (`shard-*.npz`):
+
+    image_hash  (n,)    image content hashes
+    shape       (n, 2)  image height, width
+    offsets     (n+1,)  row ranges into the box columns
+    boxes       (k, 4)  float32 x1, y1, x2, y2
+    conf        (k,)    float32
+    cls         (k,)    uint16
+
+Layout:
+    <root>/<model_sha[:12]>-<params_hash>/meta.json
+    <root>/<model_sha[:12]>-<params_hash>/shard-*.npz
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class PredictionCache:
+    """Raw (N, 6) predictions per image content hash for one model + parameter set."""
+
+    def __init__(self, root: str, model_sha: str, params: dict, flush_every: int = 1000):
+        if not model_sha:
+            raise ValueError('a model content hash is required to key the prediction cache')
+        params_key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+        self.dir = os.path.join(root, f'{model_sha[:12]}-{params_key}')
+        self.flush_every = flush_every
+        os.makedirs(self.dir, exist_ok=True)
+        meta_path = os.path.join(self.dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            with open(meta_path, 'w') as f:
+                json.dump({'model_sha256': model_sha, 'params': params}, f, indent=2)
+        self._index: Dict[str, Tuple[Tuple[int, int], np.ndarray]] = {}
+        self._new: Dict[str, Tuple[Tuple[int, int], np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        for shard in sorted(glob.glob(os.path.join(self.dir, 'shard-*.npz'))):
+            self._load_shard(shard)
+
+    def _load_shard(self, path: str):
+        with np.load(path) as z:
+            hashes, shapes, offsets = z['image_hash'], z['shape'], z['offsets']
+            dets = np.concatenate([z['boxes'], z['conf'][:, None], z['cls'][:, None].astype(np.float32)], 1)
+        for i, h in enumerate(hashes.tolist()):
+            self._index[h] = (tuple(shapes[i].tolist()), dets[offsets[i]:offsets[i + 1]])
+
+    def __len__(self):
+        return len(self._index) + len(self._new)
+
+    def get(self, image_hash: str) -> Optional[Tuple[Tuple[int, int], np.ndarray]]:
+        """Return ((h, w), dets) for a cached image, or None."""
+        with self._lock:
+            entry = self._index.get(image_hash) or self._new.get(image_hash)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, image_hash: str, shape, dets: np.ndarray):
+        with self._lock:
+            self._new[image_hash] = (tuple(shape[:2]), np.asarray(dets, dtype=np.float32))
+            pending = len(self._new)
+        if pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write entries added since the last flush as a new shard (atomically)."""
+        with self._lock:
+            new, self._new = self._new, {}
+            self._index.update(new)
+        if not new:
+            return
+        hashes = list(new)
+        dets = [new[h][1] for h in hashes]
+        offsets = np.zeros(len(hashes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(d) for d in dets])
+        stacked = np.concatenate(dets) if offsets[-1] else np.zeros((0, 6), dtype=np.float32)
+        path = os.path.join(self.dir, f'shard-{time.time_ns()}-{os.getpid()}.npz')
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, image_hash=np.asarray(hashes), shape=np.asarray([new[h][0] for h in hashes], np.int32),
+                            offsets=offsets, boxes=stacked[:, :4], conf=stacked[:, 4],
+                            cls=stacked[:, 5].astype(np.uint16))
+        os.replace(tmp, path)
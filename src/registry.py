@@ -0,0 +1,137 @@
+"""Model registry: named model versions, loaded once and cached by path + content hash.
+
+A `ModelSpec` pins a name to a weights file, its SHA-256 and a backend. The
+registry keeps the name -> spec mapping (swapped atomically by `register()`) and a
+small LRU cache of loaded engines keyed by (path, hash, backend), so the same
+weights are never loaded twice and a changed file is picked up as a new version.
+
+CLIs use the module-level `get_engine()`. The API keeps one registry as the
+catalog of names and gives every inference worker its own registry for loading,
+passing the `ModelSpec` along with each job.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .engine import DEFAULT_BACKEND, DEFAULT_MODEL, DetectorEngine, load_engine
+except ImportError:
+    from engine import DEFAULT_BACKEND, DEFAULT_MODEL, DetectorEngine, load_engine
+
+DEFAULT_NAME = 'default'
+
+_hash_cache: Dict[Tuple[str, float, int], str] = {}
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file, cached by (path, mtime, size) so unchanged files aren't re-read."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime, st.st_size)
+    digest = _hash_cache.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = _hash_cache[key] = h.hexdigest()
+    return digest
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    name: str
+    weights: str
+    sha256: str
+    backend: str = DEFAULT_BACKEND
+
+    @property
+    def version(self) -> str:
+        return self.sha256[:12] if self.sha256 else 'unknown'
+
+    @property
+    def cache_key(self) -> Tuple[str, str, str]:
+        return os.path.abspath(self.weights), self.sha256, self.backend
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'weights': self.weights, 'sha256': self.sha256, 'version': self.version,
+                'backend': self.backend}
+
+
+def warm_up(engine: DetectorEngine):
+    """Run one dummy forward pass so the first real request doesn't pay for lazy initialisation."""
+    engine.predict([np.zeros((engine.imgsz, engine.imgsz, 3), dtype=np.uint8)], conf=0.99)
+
+
+class ModelRegistry:
+    """Named model versions plus an LRU cache of loaded engines."""
+
+    def __init__(self, max_cached: int = 4, warmup: bool = True):
+        self.max_cached = max_cached
+        self.warmup = warmup
+        self._specs: Dict[str, ModelSpec] = {}
+        self._engines: 'OrderedDict[tuple, DetectorEngine]' = OrderedDict()
+        self.load_times: Dict[tuple, float] = {}
+        self._lock = threading.RLock()
+
+    def make_spec(self, name: str, weights: str, backend: str = DEFAULT_BACKEND) -> ModelSpec:
+        """Describe `weights` under `name` without publishing it."""
+        # yolov8n.pt & co. are downloaded by ultralytics on first load, so they may not exist yet
+        sha = file_sha256(weights) if os.path.exists(weights) else ''
+        return ModelSpec(name, weights, sha, backend)
+
+    def register(self, name: str, weights: str, backend: str = DEFAULT_BACKEND, load: bool = False) -> ModelSpec:
+        """Point `name` at `weights`; requests already holding the previous spec are unaffected."""
+        spec = self.make_spec(name, weights, backend)
+        if load:
+            self.load(spec)
+        self.publish(spec)
+        return spec
+
+    def publish(self, spec: ModelSpec):
+        with self._lock:
+            # replace the whole mapping so readers always see a consistent snapshot
+            self._specs = {**self._specs, spec.name: spec}
+
+    def spec(self, name: Optional[str] = None) -> ModelSpec:
+        try:
+            return self._specs[name or DEFAULT_NAME]
+        except KeyError:
+            raise KeyError(f"unknown model {name!r}; registered: {sorted(self._specs)}") from None
+
+    def specs(self) -> List[ModelSpec]:
+        return list(self._specs.values())
+
+    def load(self, spec: ModelSpec) -> DetectorEngine:
+        """Return the engine for `spec`, loading (and warming up) it on first use."""
+        key = spec.cache_key
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                return engine
+            t0 = time.perf_counter()
+            engine = load_engine(spec.weights, spec.backend)
+            if self.warmup:
+                warm_up(engine)
+            self.load_times[key] = time.perf_counter() - t0
+            self._engines[key] = engine
+            while len(self._engines) > self.max_cached:
+                self._engines.popitem(last=False)
+            return engine
+
+    def get(self, name: Optional[str] = None) -> DetectorEngine:
+        return self.load(self.spec(name))
+
+
+registry = ModelRegistry(warmup=False)
+
+
+def get_engine(weights: str = DEFAULT_MODEL, backend: str = DEFAULT_BACKEND) -> DetectorEngine:
+    """Load `weights` once per process (re-loading only if the file contents change)."""
+    return registry.load(registry.make_spec(weights, weights, backend))
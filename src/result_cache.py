@@ -0,0 +1,223 @@
+"""Result cache for the API: identical uploads skip decode, inference and encoding.
+
+Entries are keyed by the image's content hash plus everything that changes the
+result (model version, conf, reduce, and for annotated images the render
+options). Two tiers:
+
+- an in-process LRU with entry-count, byte-size and TTL limits, and
+- an optional shared SQLite file (e.g. on /dev/shm) so that several uvicorn
+  worker processes on one host reuse each other's results.
+
+`get_or_compute()` also coalesces concurrent identical requests: while one
+computation for a key is running, other callers for that key await its result
+instead of starting their own.
+"""
+import asyncio
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+def _size(value) -> int:
+    if isinstance(value, tuple):
+        return sum(_size(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 64
+
+
+class MemoryBackend:
+    """LRU of (expiry, value) with entry-count and byte-size limits."""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 256 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any, int]]' = OrderedDict()
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl: float):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (time.monotonic() + ttl, value, size)
+            self.bytes += size
+            while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        _, _, size = self._data.pop(key)
+        self.bytes -= size
+
+
+class SQLiteBackend:
+    """Cache shared by the processes of one host, stored in a single SQLite file.
+
+    Values are NumPy arrays, bytes or tuples of arrays. Least recently used entries are evicted
+    past `max_entries` / `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, max_bytes: int = 1 << 30):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._conn() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, '
+                       'expires REAL, atime REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS cache_atime ON cache (atime)')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+        return conn
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if isinstance(value, tuple):
+            buf = io.BytesIO()
+            np.savez(buf, *value)
+            return b'T' + buf.getvalue()
+        if isinstance(value, np.ndarray):
+            buf = io.BytesIO()
+            np.save(buf, value, allow_pickle=False)
+            return b'A' + buf.getvalue()
+        return b'B' + bytes(value)
+
+    @staticmethod
+    def _decode(blob: bytes):
+        if blob[:1] == b'T':
+            with np.load(io.BytesIO(blob[1:]), allow_pickle=False) as z:
+                return tuple(z[f'arr_{i}'] for i in range(len(z.files)))
+        if blob[:1] == b'A':
+            return np.load(io.BytesIO(blob[1:]), allow_pickle=False)
+        return blob[1:]
+
+    def get(self, key):
+        now = time.time()
+        with self._conn() as db:
+            row = db.execute('SELECT value, expires FROM cache WHERE key = ?', (repr(key),)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                db.execute('DELETE FROM cache WHERE key = ?', (repr(key),))
+                return None
+            db.execute('UPDATE cache SET atime = ? WHERE key = ?', (now, repr(key)))
+        return self._decode(row[0])
+
+    def set(self, key, value, ttl: float):
+        blob = self._encode(value)
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        with self._conn() as db:
+            db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+                       (repr(key), blob, len(blob), now + ttl, now))
+            count, total = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+            if count > self.max_entries or total > self.max_bytes:
+                db.execute('DELETE FROM cache WHERE expires < ?', (now,))
+                # evict the overflow plus 10% so a full cache doesn't evict on every insert
+                excess = max(count - self.max_entries, 0) + max(count // 10, 1)
+                db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY atime LIMIT ?)', (excess,))
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class ResultCache:
+    """In-process LRU in front of an optional shared backend, with request coalescing and hit/miss counts."""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 256 << 20, ttl: float = 300.0,
+                 shared: Optional[SQLiteBackend] = None):
+        self.ttl = ttl
+        self.memory = MemoryBackend(max_entries, max_bytes)
+        self.shared = shared
+        self.enabled = max_entries > 0 and ttl > 0
+        self.stats: Dict[str, int] = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'coalesced': 0}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def _get(self, key):
+        value = self.memory.get(key)
+        if value is not None or self.shared is None:
+            return value
+        value = await asyncio.get_running_loop().run_in_executor(None, self.shared.get, key)
+        if value is not None:
+            self.stats['shared_hits'] += 1
+            self.memory.set(key, value, self.ttl)
+        return value
+
+    async def _set(self, key, value):
+        self.memory.set(key, value, self.ttl)
+        if self.shared is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.shared.set, key, value, self.ttl)
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]):
+        """Cached value for `key`, or the result of `compute()` (stored for next time)."""
+        if not self.enabled:
+            return await compute()
+        value = await self._get(key)
+        if value is not None:
+            self.stats['hits'] += 1
+            return value
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            try:
+                # shield: one waiter giving up must not cancel the shared computation
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if pending.cancelled():  # the request computing it went away: compute it ourselves
+                    return await self.get_or_compute(key, compute)
+                raise
+        self.stats['misses'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved: no warning when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        await self._set(key, value)
+        return value
+
+    def info(self) -> dict:
+        lookups = self.stats['hits'] + self.stats['misses'] + self.stats['coalesced']
+        return {**self.stats, 'entries': len(self.memory), 'bytes': self.memory.bytes,
+                'hit_rate': (self.stats['hits'] + self.stats['coalesced']) / lookups if lookups else 0.0,
+                'shared': self.shared.path if self.shared is not None else None}
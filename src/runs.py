@@ -0,0 +1,352 @@
+"""Index of training runs (runs/detect/*, sweep trials, ...) in a local SQLite database.
+
+`scan` walks --root for run folders (folders holding an Ultralytics args.yaml). For
+each one it stores the training arguments, every epoch of results.csv, the metrics
+of the best epoch (by Ultralytics' fitness, 0.1 mAP50 + 0.9 mAP50-95) and the
+SHA-256 of its weights. Runs whose args.yaml, results.csv and weights are unchanged
+since the last scan are skipped. With --bench, the inference latency of weights
+not yet benchmarked on this host is measured too.
+
+    python src/runs.py scan --bench
+    python src/runs.py list --sort map50_95
+    python src/runs.py compare train2 train_short2
+    python src/runs.py promote --best --api http://localhost:8000
+
+`promote` copies a run's weights (atomically) to the promoted model path that
+src/engine.py uses as the default model, so the API serves them from its next
+start. With --api, the running API also loads them as its 'default' model at once
+(POST /models/default). Runs are named by their path under --root (detect/train2)
+or, when unambiguous, by the last part (train2). The same operations are
+available from Python through `RunIndex`.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    from .engine import BACKENDS, PROMOTED_MODEL
+    from .registry import file_sha256
+    from .utils import ensure_dir
+except ImportError:
+    from engine import BACKENDS, PROMOTED_MODEL
+    from registry import file_sha256
+    from utils import ensure_dir
+
+DEFAULT_ROOT = 'runs'
+DEFAULT_DB = os.path.join('runs', 'index.sqlite')
+# results.csv columns -> runs table columns
+METRICS = {'metrics/precision(B)': 'precision', 'metrics/recall(B)': 'recall', 'metrics/mAP50(B)': 'map50',
+           'metrics/mAP50-95(B)': 'map50_95'}
+SORT_KEYS = ('fitness', 'map50_95', 'map50', 'precision', 'recall', 'ms_per_image', 'updated')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run TEXT PRIMARY KEY, dir TEXT, signature TEXT, model TEXT, data TEXT, epochs INTEGER, imgsz INTEGER,
+    epochs_run INTEGER, best_epoch INTEGER, fitness REAL, precision REAL, recall REAL, map50 REAL, map50_95 REAL,
+    train_seconds REAL, weights TEXT, weights_sha256 TEXT, weights_bytes INTEGER, args TEXT, updated REAL);
+CREATE TABLE IF NOT EXISTS epochs (run TEXT, epoch INTEGER, metrics TEXT, PRIMARY KEY (run, epoch));
+CREATE TABLE IF NOT EXISTS benchmarks (
+    weights_sha256 TEXT, host TEXT, backend TEXT, imgsz INTEGER, ms_per_image REAL, p95_ms REAL, measured REAL,
+    PRIMARY KEY (weights_sha256, host, backend, imgsz));
+CREATE TABLE IF NOT EXISTS promotions (run TEXT, weights_sha256 TEXT, target TEXT, promoted REAL);
+'''
+
+
+def fitness(row: dict) -> float:
+    """Ultralytics' model selection score for an epoch of results.csv."""
+    return 0.1 * row.get('metrics/mAP50(B)', 0.0) + 0.9 * row.get('metrics/mAP50-95(B)', 0.0)
+
+
+def read_results(path: str) -> List[dict]:
+    """Epochs of a results.csv as dicts of floats (column names stripped; [] if missing)."""
+    try:
+        with open(path, newline='') as f:
+            return [{k.strip(): float(v) for k, v in row.items() if k and v not in (None, '')}
+                    for row in csv.DictReader(f)]
+    except (OSError, ValueError):
+        return []
+
+
+def find_runs(root: str) -> List[str]:
+    """Run folders under `root`: folders with an args.yaml (their sub-folders are not searched)."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if 'args.yaml' in filenames:
+            found.append(dirpath)
+            dirnames[:] = []
+        else:
+            dirnames.sort()
+    return sorted(found)
+
+
+def _weights(run_dir: str) -> Optional[str]:
+    for name in ('best.pt', 'last.pt'):
+        path = os.path.join(run_dir, 'weights', name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _signature(run_dir: str) -> str:
+    """Changes whenever args.yaml, results.csv or the weights change."""
+    parts = []
+    for path in (os.path.join(run_dir, 'args.yaml'), os.path.join(run_dir, 'results.csv'), _weights(run_dir)):
+        st = os.stat(path) if path and os.path.exists(path) else None
+        parts.append([path and os.path.basename(path), st.st_size, st.st_mtime_ns] if st else None)
+    return json.dumps(parts)
+
+
+def benchmark(weights: str, backend: str = 'torch', imgsz: int = 640, iterations: int = 20) -> Dict[str, float]:
+    """Median and p95 single-image latency (ms) of `weights` on this machine."""
+    try:
+        from .engine import load_engine
+        from .registry import warm_up
+    except ImportError:
+        from engine import load_engine
+        from registry import warm_up
+    engine = load_engine(weights, backend, imgsz=imgsz)
+    warm_up(engine)
+    img = np.random.default_rng(0).integers(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)
+    times = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        engine.predict([img], conf=0.25)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return {'ms_per_image': float(np.median(times)), 'p95_ms': float(np.percentile(times, 95))}
+
+
+class RunIndex:
+    """SQLite index of the runs under `root`."""
+
+    def __init__(self, db: str = DEFAULT_DB, root: str = DEFAULT_ROOT):
+        self.root = root
+        ensure_dir(os.path.dirname(db) or '.')
+        self.db = sqlite3.connect(db)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def scan(self, bench: bool = False, backend: str = 'torch', iterations: int = 20) -> dict:
+        """Index new and changed runs, drop vanished ones; returns counts of each."""
+        import yaml
+        known = {r['run']: r['signature'] for r in self.db.execute('SELECT run, signature FROM runs')}
+        seen, updated = set(), 0
+        for run_dir in find_runs(self.root):
+            run = os.path.relpath(run_dir, self.root).replace(os.sep, '/')
+            seen.add(run)
+            signature = _signature(run_dir)
+            if known.get(run) == signature:
+                continue
+            with open(os.path.join(run_dir, 'args.yaml')) as f:
+                args = yaml.safe_load(f) or {}
+            results = read_results(os.path.join(run_dir, 'results.csv'))
+            best = max(results, key=fitness) if results else {}
+            weights = _weights(run_dir)
+            with self.db:
+                self.db.execute('DELETE FROM epochs WHERE run = ?', (run,))
+                self.db.executemany('INSERT INTO epochs VALUES (?, ?, ?)',
+                                    [(run, int(r.get('epoch', i + 1)), json.dumps(r)) for i, r in enumerate(results)])
+                self.db.execute(
+                    'INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (run, os.path.abspath(run_dir), signature, str(args.get('model')), str(args.get('data')),
+                     args.get('epochs'), args.get('imgsz'), len(results), int(best['epoch']) if 'epoch' in best else None,
+                     fitness(best) if best else None, *(best.get(k) for k in METRICS),
+                     results[-1].get('time') if results else None, weights and os.path.abspath(weights),
+                     weights and file_sha256(weights), weights and os.path.getsize(weights),
+                     json.dumps(args, default=str), time.time()))
+            updated += 1
+        gone = set(known) - seen
+        with self.db:
+            self.db.executemany('DELETE FROM runs WHERE run = ?', [(r,) for r in gone])
+            self.db.executemany('DELETE FROM epochs WHERE run = ?', [(r,) for r in gone])
+        benched = self.bench(backend=backend, iterations=iterations) if bench else 0
+        return {'runs': len(seen), 'updated': updated, 'removed': len(gone), 'benchmarked': benched}
+
+    def bench(self, runs: Optional[List[str]] = None, backend: str = 'torch', iterations: int = 20,
+              force: bool = False) -> int:
+        """Benchmark the weights of `runs` (default: all) not yet measured on this host; returns how many ran."""
+        host = platform.node()
+        rows = [self.get(r) for r in runs] if runs else self.db.execute('SELECT * FROM runs').fetchall()
+        done = 0
+        for row in rows:
+            if not row['weights'] or not os.path.isfile(row['weights']):
+                continue
+            imgsz = int(row['imgsz'] or 640)
+            key = (row['weights_sha256'], host, backend, imgsz)
+            if not force and self.db.execute('SELECT 1 FROM benchmarks WHERE weights_sha256 = ? AND host = ? AND '
+                                             'backend = ? AND imgsz = ?', key).fetchone():
+                continue
+            result = benchmark(row['weights'], backend, imgsz, iterations)
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO benchmarks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (*key, result['ms_per_image'], result['p95_ms'], time.time()))
+            done += 1
+        return done
+
+    def _query(self, where: str = '', params=()) -> List[dict]:
+        # the latest benchmark on this host, whatever the backend
+        sql = ('SELECT r.*, b.ms_per_image, b.p95_ms, b.backend AS bench_backend FROM runs r LEFT JOIN benchmarks b '
+               'ON b.rowid = (SELECT rowid FROM benchmarks WHERE weights_sha256 = r.weights_sha256 AND host = ? '
+               'ORDER BY measured DESC LIMIT 1) ' + where)
+        return [dict(r) for r in self.db.execute(sql, (platform.node(), *params))]
+
+    def resolve(self, name: str) -> str:
+        """Full run id for `name`: an exact id, or the one run whose id ends with /<name>."""
+        ids = [r['run'] for r in self.db.execute('SELECT run FROM runs')]
+        if name in ids:
+            return name
+        matches = [i for i in ids if i.endswith('/' + name)]
+        if len(matches) != 1:
+            raise KeyError(f"no run named {name!r}" if not matches else f"{name!r} is ambiguous: {matches}")
+        return matches[0]
+
+    def get(self, name: str) -> dict:
+        return self._query('WHERE r.run = ?', (self.resolve(name),))[0]
+
+    def list(self, sort: str = 'fitness', limit: Optional[int] = None, trained_only: bool = False) -> List[dict]:
+        """Runs ordered by `sort` (best first; fastest first for ms_per_image), runs without it last."""
+        if sort not in SORT_KEYS:
+            raise ValueError(f'sort must be one of {SORT_KEYS}')
+        order = 'ASC' if sort == 'ms_per_image' else 'DESC'
+        where = 'WHERE r.epochs_run > 0 ' if trained_only else ''
+        rows = self._query(where + f'ORDER BY {sort} IS NULL, {sort} {order}, r.run')
+        return rows[:limit] if limit else rows
+
+    def epochs(self, name: str) -> List[dict]:
+        return [json.loads(r['metrics']) for r in
+                self.db.execute('SELECT metrics FROM epochs WHERE run = ? ORDER BY epoch', (self.resolve(name),))]
+
+    def compare(self, names: List[str]) -> dict:
+        """Rows of `names` plus the training arguments whose values differ between them."""
+        rows = [self.get(n) for n in names]
+        args = [json.loads(r['args']) for r in rows]
+        keys = sorted(set().union(*args))
+        differences = {k: [a.get(k) for a in args] for k in keys if len({json.dumps(a.get(k)) for a in args}) > 1}
+        return {'runs': rows, 'differences': differences}
+
+    def best(self, sort: str = 'fitness') -> dict:
+        rows = [r for r in self.list(sort, trained_only=True) if r['weights'] and os.path.isfile(r['weights'])]
+        if not rows:
+            raise LookupError('no indexed run has weights; train or scan first')
+        return rows[0]
+
+    def promote(self, name: Optional[str] = None, target: str = PROMOTED_MODEL, client=None, model_name='default',
+                sort: str = 'fitness') -> dict:
+        """Copy a run's weights (the best one by `sort` if `name` is None) to `target`.
+
+        With `client` (an api_client.PatternDetectClient), the API loads them as
+        `model_name` right away; `target` must then be a path the server can read.
+        """
+        row = self.get(name) if name else self.best(sort)
+        if not row['weights'] or not os.path.isfile(row['weights']):
+            raise FileNotFoundError(f"run {row['run']} has no weights")
+        ensure_dir(os.path.dirname(target) or '.')
+        tmp = f'{target}.{os.getpid()}.tmp'
+        shutil.copyfile(row['weights'], tmp)
+        if file_sha256(tmp) != row['weights_sha256']:
+            os.remove(tmp)
+            raise RuntimeError(f"{row['weights']} changed since it was indexed; scan again")
+        os.replace(tmp, target)  # the API never sees half a file
+        with self.db:
+            self.db.execute('INSERT INTO promotions VALUES (?, ?, ?, ?)',
+                            (row['run'], row['weights_sha256'], os.path.abspath(target), time.time()))
+        result = {'run': row['run'], 'weights': row['weights'], 'sha256': row['weights_sha256'], 'target': target}
+        if client is not None:
+            result['api'] = client.update_model(model_name, target)
+        return result
+
+    def promotions(self) -> List[dict]:
+        return [dict(r) for r in self.db.execute('SELECT * FROM promotions ORDER BY promoted DESC')]
+
+
+def _fmt(value, digits=3):
+    if value is None:
+        return '-'
+    return f'{value:.{digits}f}' if isinstance(value, float) else str(value)
+
+
+def print_runs(rows: List[dict]):
+    print(f"{'run':<24} {'model':<14} {'imgsz':>5} {'ep':>4} {'P':>6} {'R':>6} {'mAP50':>6} {'mAP50-95':>8} "
+          f"{'ms/img':>7}  sha256")
+    for r in rows:
+        print(f"{r['run']:<24} {os.path.basename(r['model'] or '-'):<14} {_fmt(r['imgsz']):>5} "
+              f"{_fmt(r['epochs_run']):>4} {_fmt(r['precision']):>6} {_fmt(r['recall']):>6} {_fmt(r['map50']):>6} "
+              f"{_fmt(r['map50_95']):>8} {_fmt(r['ms_per_image'], 1):>7}  {(r['weights_sha256'] or '-')[:12]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='folder holding the runs')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    sub = parser.add_subparsers(dest='command', required=True)
+    s = sub.add_parser('scan', help='index new and changed runs')
+    s.add_argument('--bench', action='store_true', help='also benchmark weights not yet measured on this host')
+    s.add_argument('--backend', default='torch', choices=BACKENDS)
+    s.add_argument('--iterations', type=int, default=20)
+    b = sub.add_parser('bench', help='benchmark the weights of some or all runs')
+    b.add_argument('runs', nargs='*')
+    b.add_argument('--backend', default='torch', choices=BACKENDS)
+    b.add_argument('--iterations', type=int, default=20)
+    b.add_argument('--force', action='store_true', help='measure again even if already benchmarked')
+    ls = sub.add_parser('list', help='runs, best first')
+    ls.add_argument('--sort', default='fitness', choices=SORT_KEYS)
+    ls.add_argument('--limit', type=int, default=None)
+    c = sub.add_parser('compare', help='metrics and differing arguments of some runs')
+    c.add_argument('runs', nargs='+')
+    p = sub.add_parser('promote', help="make a run's weights the served model")
+    p.add_argument('run', nargs='?', help='run to promote (default: the best, see --sort)')
+    p.add_argument('--best', action='store_true', help='promote the best run')
+    p.add_argument('--sort', default='fitness', choices=SORT_KEYS)
+    p.add_argument('--target', default=PROMOTED_MODEL)
+    p.add_argument('--api', default=None, help='also hot-swap the model of the API at this URL')
+    args = parser.parse_args(argv)
+
+    with RunIndex(args.db, args.root) as index:
+        if args.command == 'scan':
+            stats = index.scan(args.bench, args.backend, args.iterations)
+            print(f"{stats['runs']} runs: {stats['updated']} indexed, {stats['removed']} removed, "
+                  f"{stats['benchmarked']} benchmarked ({args.db})")
+        elif args.command == 'bench':
+            print(f'{index.bench(args.runs or None, args.backend, args.iterations, args.force)} benchmarked')
+            print_runs(index.list())
+        elif args.command == 'list':
+            print_runs(index.list(args.sort, args.limit))
+        elif args.command == 'compare':
+            result = index.compare(args.runs)
+            print_runs(result['runs'])
+            for key, values in result['differences'].items():
+                print(f'  {key}: ' + ' | '.join(str(v) for v in values))
+        else:
+            if args.run and args.best:
+                parser.error('give a run or --best, not both')
+            client = None
+            if args.api:
+                from api_client import PatternDetectClient
+                client = PatternDetectClient(args.api)
+            try:
+                result = index.promote(args.run, args.target, client, sort=args.sort)
+            finally:
+                if client is not None:
+                    client.close()
+            print(f"Promoted {result['run']} ({result['sha256'][:12]}) to {result['target']}"
+                  + (f"; API now serves version {result['api'].get('version')}" if 'api' in result else ''))
+
+
+if __name__ == '__main__':
+    main()
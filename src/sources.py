@@ -0,0 +1,186 @@
+"""Input sources for bulk processing: folders, globs, image-list files and videos.
+
+`list_sources()` expands a source spec into an ordered list of image/video paths,
+`iter_frames()` streams decoded (id, BGR image) pairs with a bounded number of
+images decoded ahead on a thread pool, `iter_archive()` reads the images of a
+.zip / .tar(.gz) file, and `batched()` groups any iterable.
+Memory stays bounded by the prefetch window whatever the size of the input.
+"""
+import glob
+import itertools
+import os
+import queue
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+VIDEO_EXTS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.webm')
+LIST_EXTS = ('.txt', '.lst')
+ARCHIVE_EXTS = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+
+def is_image(path: str) -> bool:
+    return path.lower().endswith(IMAGE_EXTS)
+
+
+def is_video(path: str) -> bool:
+    return path.lower().endswith(VIDEO_EXTS)
+
+
+def is_archive(path: str) -> bool:
+    return path.lower().endswith(ARCHIVE_EXTS)
+
+
+def list_sources(source: str, recursive: bool = False) -> List[str]:
+    """Expand `source` into a sorted list of image and video paths.
+
+    `source` may be a single image or video, a folder (with `recursive` also its
+    sub-folders), a glob pattern such as "data/**/*.jpg", or a .txt file listing
+    one path per line (relative paths are resolved against the list's folder).
+    """
+    if os.path.isdir(source):
+        pattern = os.path.join(source, '**', '*') if recursive else os.path.join(source, '*')
+        paths = glob.glob(pattern, recursive=recursive)
+    elif glob.has_magic(source):
+        paths = glob.glob(source, recursive=True)
+    elif source.lower().endswith(LIST_EXTS):
+        base = os.path.dirname(source)
+        with open(source) as f:
+            lines = [line.strip() for line in f]
+        # keep the list's order: it is the order the caller asked for
+        return [p if os.path.isabs(p) else os.path.join(base, p) for p in lines if p and not p.startswith('#')]
+    elif os.path.exists(source):
+        return [source]
+    else:
+        raise FileNotFoundError(source)
+    return sorted(p for p in paths if os.path.isfile(p) and (is_image(p) or is_video(p)))
+
+
+def _read_image(path: str) -> Optional[np.ndarray]:
+    return cv2.imread(path, cv2.IMREAD_COLOR)
+
+
+def _video_frames(path: str, stride: int = 1) -> Iterator[Tuple[str, np.ndarray]]:
+    cap = cv2.VideoCapture(path)
+    try:
+        index = 0
+        while True:
+            # grab() skips decoding of frames we don't keep
+            if not cap.grab():
+                break
+            if index % stride == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    yield f'{path}#{index}', frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def iter_frames(paths: Iterable[str], workers: int = 4, prefetch: int = 16, vid_stride: int = 1,
+                skip: int = 0, read: Optional[Callable[[str], Optional[np.ndarray]]] = None
+                ) -> Iterator[Tuple[str, Optional[np.ndarray]]]:
+    """Yield (id, image) for every image and every `vid_stride`-th video frame, in order.
+
+    A background thread walks the inputs (decoding video frames itself) and hands
+    images to `workers` decoding threads, staying at most `prefetch` items ahead of
+    the consumer, so decoding overlaps with whatever the consumer does (inference).
+    Unreadable images are yielded with `None`. The first `skip` items are skipped
+    (images without being decoded), which is how checkpointed runs resume.
+    `read` decodes an image id (default: cv2.imread; `PackedDataset.decode` for a pack).
+    """
+    read = read or _read_image
+
+    def items():
+        for path in paths:
+            if is_video(path):
+                yield from ((fid, None, frame) for fid, frame in _video_frames(path, vid_stride))
+            else:
+                yield path, path, None
+
+    ahead = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                ahead.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce(pool):
+        try:
+            for item_id, path, frame in itertools.islice(items(), skip, None):
+                fut = pool.submit(read, path) if path is not None else None
+                if not put((item_id, fut, frame)):
+                    return
+            put(done)
+        except BaseException as e:  # surface errors (e.g. a missing list entry) in the consumer
+            put(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        producer = threading.Thread(target=produce, args=(pool,), daemon=True)
+        producer.start()
+        try:
+            while True:
+                entry = ahead.get()
+                if entry is done:
+                    return
+                if isinstance(entry, BaseException):
+                    raise entry
+                item_id, fut, frame = entry
+                yield item_id, fut.result() if fut is not None else frame
+        finally:
+            stop.set()
+            producer.join()
+
+
+def iter_archive(fileobj: BinaryIO, name: str, max_member_bytes: Optional[int] = None,
+                 max_total_bytes: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+    """Yield (member name, bytes) for every image in a .zip or .tar(.gz) archive, in archive order.
+
+    Tar archives are read as a stream, one member at a time; zip needs a seekable file.
+    Members are size-checked from their headers before being read: a member larger than
+    `max_member_bytes`, or one that takes the total past `max_total_bytes`, raises ValueError.
+    """
+    total = 0
+
+    def check(member: str, size: int) -> None:
+        nonlocal total
+        total += size
+        if max_member_bytes is not None and size > max_member_bytes:
+            raise ValueError(f'{member}: {size} bytes, at most {max_member_bytes} per archive member')
+        if max_total_bytes is not None and total > max_total_bytes:
+            raise ValueError(f'{name}: more than {max_total_bytes} bytes of images')
+
+    if name.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and is_image(info.filename):
+                    check(info.filename, info.file_size)
+                    yield info.filename, zf.read(info)
+        return
+    with tarfile.open(fileobj=fileobj, mode='r|*') as tf:
+        for member in tf:
+            if member.isfile() and is_image(member.name):
+                check(member.name, member.size)
+                yield member.name, tf.extractfile(member).read()
+
+
+def batched(iterable: Iterable, n: int) -> Iterator[list]:
+    """Split `iterable` into lists of at most `n` items."""
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, n))
+        if not batch:
+            return
+        yield batch
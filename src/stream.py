@@ -0,0 +1,350 @@
+"""Video / live-stream inference with adaptive frame dropping and object tracking.
+
+`FrameReader` decodes a video file, an RTSP/HTTP URL or a camera index on a
+background thread. In real-time mode (the default for live sources, optional for
+files, which are then played at their native frame rate) the consumer always gets
+the newest frame: frames that arrive while inference is busy are dropped, and once
+the reader knows how long a frame takes to process (`report()`), it skips
+decoding the frames that would be dropped anyway. Offline mode processes every
+`stride`-th frame at full speed.
+
+`Tracker` links detections across frames (IoU matching against a constant-velocity
+prediction, per class), so every object gets a track id and is reported once when
+it is confirmed and once, with its best detection, when it leaves the view.
+
+    python src/stream.py --source lane3.mp4 --out outputs/tracks.jsonl --realtime
+    python src/stream.py --source rtsp://camera/lane3 --out outputs/tracks.jsonl --save outputs/lane3.mp4
+"""
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    from .formats import detections_json
+except ImportError:
+    from formats import detections_json
+
+NO_TRACKS = np.zeros((0, 7), dtype=np.float32)
+DEFAULT_FPS = 30.0
+
+
+class FrameReader:
+    """Decode frames of `source` on a background thread; iterate to get (index, seconds, BGR frame).
+
+    `source` is a video path, a stream URL (rtsp://, http://) or a camera index
+    ("0"). `realtime` defaults to True for live sources and False for files.
+    `dropped` counts frames that were read but never handed to the consumer.
+    """
+
+    def __init__(self, source: str, realtime: Optional[bool] = None, stride: int = 1, queue_size: int = 8):
+        self.source = source
+        self.live = not os.path.isfile(str(source))
+        self.realtime = self.live if realtime is None else realtime
+        self.cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+        if not self.cap.isOpened():
+            raise ValueError(f"could not open video source {source!r}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if 0 < fps < 1000 else DEFAULT_FPS
+        self.min_stride = self.stride = max(1, stride)
+        self.queue_size = queue_size
+        self.read_frames = 0
+        self.dropped = 0
+        self._seconds_per_frame = None
+        self._frames = collections.deque()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._done = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        start = time.perf_counter()
+        index = -1
+        try:
+            while not self._stop.is_set():
+                if self.realtime and not self.live:
+                    # play files at their own frame rate, like a camera would deliver them
+                    delay = start + (index + 1) / self.fps - time.perf_counter()
+                    if delay > 0 and self._stop.wait(delay):
+                        break
+                # grab() skips the colour conversion and copy of frames we don't keep
+                if not self.cap.grab():
+                    break
+                index += 1
+                self.read_frames += 1
+                if index % self.stride:
+                    self.dropped += 1
+                    continue
+                ok, frame = self.cap.retrieve()
+                if not ok:
+                    continue
+                t = time.perf_counter() - start if self.live else index / self.fps
+                self._put((index, t, frame))
+        except Exception as e:  # surfaced to the consumer
+            self._error = e
+        finally:
+            self.cap.release()
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def _put(self, item):
+        with self._cond:
+            if self.realtime:
+                # newest frame wins: whatever the consumer hasn't picked up yet is dropped
+                self.dropped += len(self._frames)
+                self._frames.clear()
+            else:
+                while len(self._frames) >= self.queue_size and not self._stop.is_set():
+                    self._cond.wait(0.1)
+            self._frames.append(item)
+            self._cond.notify_all()
+
+    def read(self, timeout: Optional[float] = None) -> Optional[Tuple[int, float, np.ndarray]]:
+        """Next (index, seconds, frame), or None at the end of the source (or after `timeout`)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frames or self._done, timeout):
+                return None
+            if self._frames:
+                item = self._frames.popleft()
+                self._cond.notify_all()
+                return item
+        if self._error is not None:
+            raise self._error
+        return None
+
+    def __iter__(self) -> Iterator[Tuple[int, float, np.ndarray]]:
+        while True:
+            item = self.read()
+            if item is None:
+                return
+            yield item
+
+    def report(self, seconds: float):
+        """Feed back how long the last frame took to process.
+
+        In real-time mode the reader then only decodes every n-th frame, n being the
+        number of frames that arrive while one is processed (at most one second's worth,
+        so a single slow frame can't stall the stream).
+        """
+        spf = self._seconds_per_frame
+        self._seconds_per_frame = seconds if spf is None else 0.8 * spf + 0.2 * seconds
+        if self.realtime:
+            n = min(int(self._seconds_per_frame * self.fps), int(self.fps))
+            self.stride = max(self.min_stride, n)
+
+    def close(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    inter = np.clip(rb - lt, 0, None).prod(2)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter, dtype=np.float64), where=union > 0)
+
+
+@dataclass
+class Track:
+    id: int
+    cls: int
+    box: np.ndarray
+    conf: float
+    t: float
+    frame: int
+    best_box: np.ndarray = None
+    best_conf: float = 0.0
+    first_t: float = 0.0
+    first_frame: int = 0
+    hits: int = 1
+    velocity: np.ndarray = field(default_factory=lambda: np.zeros(4, dtype=np.float32))
+
+    def __post_init__(self):
+        self.best_box, self.best_conf = self.box, self.conf
+        self.first_t, self.first_frame = self.t, self.frame
+
+    def predict(self, t: float) -> np.ndarray:
+        return self.box + self.velocity * (t - self.t)
+
+    def update(self, det: np.ndarray, t: float, frame: int):
+        box = det[:4].astype(np.float32)
+        dt = t - self.t
+        if dt > 0:
+            v = (box - self.box) / dt
+            self.velocity = v if self.hits == 1 else 0.5 * self.velocity + 0.5 * v
+        self.box, self.conf, self.t, self.frame = box, float(det[4]), t, frame
+        self.hits += 1
+        if self.conf > self.best_conf:
+            self.best_box, self.best_conf = box, self.conf
+
+    def to_dict(self) -> dict:
+        return {'track': self.id, 'cls': self.cls, 'conf': round(self.best_conf, 4),
+                'xyxy': [round(x, 2) for x in self.best_box.tolist()], 'first_frame': self.first_frame,
+                'last_frame': self.frame, 'start': round(self.first_t, 3), 'end': round(self.t, 3),
+                'hits': self.hits}
+
+
+class Tracker:
+    """IoU tracker: each (N, 6) detection array updates the tracks of the same class.
+
+    A track is confirmed after `min_hits` matched detections and ends once it has
+    gone unmatched for `max_age` seconds (seconds rather than frames, so that it
+    behaves the same whatever the frame drop rate).
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_age: float = 1.0, min_hits: int = 3):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.tracks: List[Track] = []
+        self._next_id = 1
+
+    def update(self, dets: np.ndarray, t: float, frame: int = 0) -> Tuple[np.ndarray, List[dict], List[dict]]:
+        """Match `dets` taken at `t` seconds; returns (dets + track id column, tracks confirmed now, tracks ended).
+
+        Detections of tracks that are not confirmed yet get track id -1.
+        """
+        ids = np.full(len(dets), -1, dtype=np.float32)
+        matched = np.zeros(len(dets), dtype=bool)
+        confirmed = []
+        if self.tracks and len(dets):
+            iou = _iou(np.stack([tr.predict(t) for tr in self.tracks]), dets[:, :4])
+            iou[np.array([tr.cls for tr in self.tracks])[:, None] != dets[None, :, 5].astype(int)] = 0.0
+            # greedy assignment in descending IoU order
+            rows, cols = np.nonzero(iou >= self.iou_threshold)
+            used = set()
+            for k in np.argsort(-iou[rows, cols], kind='stable'):
+                r, c = rows[k], cols[k]
+                if r in used or matched[c]:
+                    continue
+                used.add(r)
+                matched[c] = True
+                tr = self.tracks[r]
+                tr.update(dets[c], t, frame)
+                if tr.hits == self.min_hits:
+                    confirmed.append(tr.to_dict())
+                if tr.hits >= self.min_hits:
+                    ids[c] = tr.id
+        for c in np.flatnonzero(~matched):
+            tr = Track(self._next_id, int(dets[c, 5]), dets[c, :4].astype(np.float32), float(dets[c, 4]), t, frame)
+            self._next_id += 1
+            self.tracks.append(tr)
+            if self.min_hits <= 1:
+                confirmed.append(tr.to_dict())
+                ids[c] = tr.id
+
+        ended, alive = [], []
+        for tr in self.tracks:
+            (alive if t - tr.t <= self.max_age else ended).append(tr)
+        self.tracks = alive
+        tracked = np.concatenate([dets[:, :6].astype(np.float32), ids[:, None]], 1) if len(dets) else NO_TRACKS
+        return tracked, confirmed, [tr.to_dict() for tr in ended if tr.hits >= self.min_hits]
+
+    def flush(self) -> List[dict]:
+        """End every remaining track (end of the stream); returns the confirmed ones."""
+        ended = [tr.to_dict() for tr in self.tracks if tr.hits >= self.min_hits]
+        self.tracks = []
+        return ended
+
+
+def frame_event(index: int, t: float, tracked: np.ndarray, new: List[dict], ended: List[dict],
+                dropped: int) -> dict:
+    """JSON-ready summary of one processed frame."""
+    detections = detections_json(tracked[:, :6])
+    for d, track_id in zip(detections, tracked[:, 6].tolist()):
+        d['track'] = int(track_id)
+    return {'frame': index, 'time': round(t, 3), 'detections': detections, 'new': new, 'ended': ended,
+            'dropped': dropped}
+
+
+def track_stream(engine, reader: FrameReader, conf: float = 0.25,
+                 tracker: Optional[Tracker] = None) -> Iterator[Tuple[Optional[np.ndarray], dict]]:
+    """Run `engine` on the frames of `reader`; yields (frame, frame_event) and finally (None, end event)."""
+    tracker = tracker or Tracker()
+    processed = 0
+    for index, t, frame in reader:
+        t0 = time.perf_counter()
+        dets = engine.predict([frame], conf=conf)[0]
+        tracked, new, ended = tracker.update(dets, t, index)
+        reader.report(time.perf_counter() - t0)
+        processed += 1
+        yield frame, frame_event(index, t, tracked, new, ended, reader.dropped)
+    yield None, {'end': True, 'ended': tracker.flush(), 'processed': processed, 'dropped': reader.dropped}
+
+
+def main(argv=None):
+    from engine import BACKENDS, DEFAULT_BACKEND, DEFAULT_MODEL
+    from registry import get_engine, warm_up
+    from utils import draw_detections, ensure_dir
+
+    parser = argparse.ArgumentParser(description='Tracked detection on a video file or live stream')
+    parser.add_argument('--source', required=True, help='video file, rtsp:// or http:// URL, or camera index')
+    parser.add_argument('--out', default='outputs/tracks.jsonl', help='one JSON line per track')
+    parser.add_argument('--events', default=None, help='also write one JSON line per processed frame')
+    parser.add_argument('--save', default=None, help='write the annotated frames to this video file')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='.pt or .onnx weights')
+    parser.add_argument('--backend', default=DEFAULT_BACKEND, choices=BACKENDS)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--realtime', action=argparse.BooleanOptionalAction, default=None,
+                        help='drop frames to keep up with the source (default: on for live sources only)')
+    parser.add_argument('--vid-stride', type=int, default=1, help='process at most every n-th frame')
+    parser.add_argument('--iou', type=float, default=0.3, help='tracker IoU threshold')
+    parser.add_argument('--max-age', type=float, default=1.0, help='seconds before an unseen track ends')
+    parser.add_argument('--min-hits', type=int, default=3, help='detections before a track is reported')
+    args = parser.parse_args(argv)
+
+    engine = get_engine(args.model, args.backend)
+    warm_up(engine)  # before the clock starts: a slow first frame would make a live source drop frames
+    ensure_dir(os.path.dirname(args.out) or '.')
+    writer = None
+    events = open(args.events, 'w') if args.events else None
+    t0 = time.perf_counter()
+    with FrameReader(args.source, args.realtime, args.vid_stride) as reader, open(args.out, 'w') as out:
+        tracker = Tracker(args.iou, args.max_age, args.min_hits)
+        for frame, event in track_stream(engine, reader, args.conf, tracker):
+            for track in event['ended']:
+                out.write(json.dumps(track) + '\n')
+            if events is not None:
+                events.write(json.dumps(event) + '\n')
+            if frame is not None and args.save:
+                if writer is None:
+                    ensure_dir(os.path.dirname(args.save) or '.')
+                    fps = reader.fps / (1 if reader.realtime else reader.stride)
+                    writer = cv2.VideoWriter(args.save, cv2.VideoWriter_fourcc(*'mp4v'), fps,
+                                             (frame.shape[1], frame.shape[0]))
+                writer.write(draw_detections(frame, np.array([[d['xyxy'] + [d['conf'], d['cls']]
+                                                              for d in event['detections']]]).reshape(-1, 6),
+                                             engine.names, inplace=True))
+    if writer is not None:
+        writer.release()
+    if events is not None:
+        events.close()
+    elapsed = time.perf_counter() - t0
+    fps = event['processed'] / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {event['processed']} frames in {elapsed:.1f}s ({fps:.1f} fps), dropped {event['dropped']}; "
+          f"tracks in {args.out}")
+
+
+if __name__ == '__main__':
+    main()
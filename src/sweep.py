@@ -0,0 +1,295 @@
+"""Hyperparameter sweeps over train.py: many runs, pinned to CPU cores, losers stopped early.
+
+The search space covers epochs, imgsz, model and augment (a src/augment.py spec).
+Give it with repeated --param KEY=V1|V2 (values are separated by "|" because
+augment specs contain commas; "null" means unset) or as a yaml mapping of lists
+with --space. --search grid runs every combination; --search random runs
+--trials combinations drawn at random from the grid.
+
+    python src/sweep.py --data data/dataset/dataset.yaml --param epochs=10 --param imgsz=320|480|640 \
+        --param model=yolov8n.pt|yolov8s.pt --param "augment=null|hflip,color" --cores-per-run 4
+
+Every trial is a train.py subprocess. It gets its own set of --cores-per-run cores
+(sched_setaffinity where the OS has it, plus OMP/MKL thread counts), and as many
+trials run at once as there are free core sets. The runner polls each trial's
+results.csv and applies the median stopping rule: after --grace epochs, a trial
+is stopped if its best metric so far is below the median of the other trials'
+best at the same epoch. Runs go to <out>/trial-NNN. <out>/leaderboard.csv ranks
+them by the metric and lists CPU-hours per trial. <out>/sweep.json records the
+state, so re-running the same command resumes an interrupted sweep. Packed
+dataset splits are unpacked once, to <out>/pack_stage, before any trial starts.
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from statistics import median
+from typing import Callable, Dict, List, Optional
+
+try:
+    from .packed import stage_data_yaml
+    from .utils import ensure_dir, write_text_atomic
+except ImportError:
+    from packed import stage_data_yaml
+    from utils import ensure_dir, write_text_atomic
+
+PARAMS = ('epochs', 'imgsz', 'model', 'augment')
+DEFAULT_SPACE = {'epochs': [5], 'imgsz': [640], 'model': ['yolov8n.pt'], 'augment': [None]}
+METRIC = 'metrics/mAP50-95(B)'
+LEADERBOARD_FIELDS = ['rank', 'trial', 'status', 'epochs_run', *PARAMS, 'metric', 'best_epoch', 'map50',
+                      'precision', 'recall', 'cpu_hours', 'weights']
+TRAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'train.py')
+
+
+@dataclass
+class Trial:
+    name: str
+    params: dict
+    status: str = 'pending'  # pending, running, done, stopped, failed
+    cores: List[int] = field(default_factory=list)
+    seconds: float = 0.0
+    curve: List[float] = field(default_factory=list)  # best metric so far, per epoch
+
+    @property
+    def cpu_hours(self) -> float:
+        return self.seconds * max(1, len(self.cores)) / 3600.0
+
+
+def parse_param(text: str):
+    """'imgsz=320|640' -> ('imgsz', [320, 640]); values are parsed as yaml scalars."""
+    import yaml
+    key, sep, values = text.partition('=')
+    if not sep or key not in PARAMS:
+        raise ValueError(f'--param must look like KEY=V1|V2 with KEY one of {PARAMS}, got {text!r}')
+    return key, [yaml.safe_load(v) if v.strip() else None for v in values.split('|')]
+
+
+def expand_space(space: Dict[str, list], search: str = 'grid', trials: Optional[int] = None,
+                 seed: int = 0) -> List[dict]:
+    """Parameter sets to run: the full grid, or `trials` distinct grid points in random order."""
+    space = {**DEFAULT_SPACE, **{k: v if isinstance(v, list) else [v] for k, v in space.items()}}
+    unknown = set(space) - set(PARAMS)
+    if unknown:
+        raise ValueError(f'unknown sweep parameters {sorted(unknown)}; expected {PARAMS}')
+    grid = [dict(zip(PARAMS, values)) for values in itertools.product(*(space[k] for k in PARAMS))]
+    if search == 'grid':
+        return grid
+    if search != 'random':
+        raise ValueError("search must be 'grid' or 'random'")
+    return random.Random(seed).sample(grid, min(trials or len(grid), len(grid)))
+
+
+def read_results(path: str) -> List[dict]:
+    """Rows of an Ultralytics results.csv with stripped column names and float values ([] if absent)."""
+    try:
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    except OSError:
+        return []
+    out = []
+    for row in rows:
+        try:
+            out.append({k.strip(): float(v) for k, v in row.items() if k and v not in (None, '')})
+        except ValueError:
+            break  # a row being written
+    return out
+
+
+def best_so_far(rows: List[dict], metric: str = METRIC) -> List[float]:
+    curve, best = [], float('-inf')
+    for row in rows:
+        best = max(best, row.get(metric, float('-inf')))
+        curve.append(best)
+    return curve
+
+
+def should_stop(curve: List[float], peers: List[List[float]], grace: int = 2, min_peers: int = 2) -> bool:
+    """Median stopping rule: stop when, at epoch len(curve) >= grace, the trial's best so far is
+    below the median best of the peers that got at least as far (needs `min_peers` of them)."""
+    n = len(curve)
+    if grace <= 0 or n < grace:
+        return False
+    at_n = [p[n - 1] for p in peers if len(p) >= n]
+    return len(at_n) >= min_peers and curve[-1] < median(at_n)
+
+
+def core_sets(cores_per_run: int, parallel: Optional[int] = None) -> List[List[int]]:
+    """Disjoint sets of `cores_per_run` cores out of those this process may use."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    cores_per_run = max(1, min(cores_per_run, len(cores)))
+    sets = [cores[i:i + cores_per_run] for i in range(0, len(cores) - cores_per_run + 1, cores_per_run)]
+    return sets[:parallel] if parallel else sets
+
+
+def train_command(trial: Trial, data: str, out_dir: str, device: str = 'cpu') -> List[str]:
+    p = trial.params
+    cmd = [sys.executable, TRAIN_SCRIPT, '--data', data, '--epochs', str(p['epochs']), '--imgsz', str(p['imgsz']),
+           '--model', str(p['model']), '--device', device, '--project', os.path.abspath(out_dir),
+           '--name', trial.name, '--exist-ok', '--workers', str(min(8, len(trial.cores))),
+           '--stage-dir', os.path.join(os.path.abspath(out_dir), 'pack_stage')]
+    if p.get('augment'):
+        cmd += ['--augment', str(p['augment'])]
+    return cmd
+
+
+def launch(trial: Trial, cmd: List[str], log) -> subprocess.Popen:
+    """Start `cmd` on the trial's cores, with its thread pools sized to match."""
+    threads = str(len(trial.cores))
+    env = {**os.environ, 'OMP_NUM_THREADS': threads, 'MKL_NUM_THREADS': threads}
+    pin = (lambda: os.sched_setaffinity(0, trial.cores)) if hasattr(os, 'sched_setaffinity') else None
+    return subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env, preexec_fn=pin)
+
+
+def leaderboard(trials: List[Trial], out_dir: str, metric: str = METRIC) -> List[dict]:
+    rows = []
+    for t in trials:
+        results = read_results(os.path.join(out_dir, t.name, 'results.csv'))
+        best = max(results, key=lambda r: r.get(metric, float('-inf'))) if results else {}
+        weights = os.path.join(out_dir, t.name, 'weights', 'best.pt')
+        rows.append({'trial': t.name, 'status': t.status, 'epochs_run': len(results), **t.params,
+                     'metric': round(best[metric], 5) if metric in best else None,
+                     'best_epoch': int(best['epoch']) if 'epoch' in best else None,
+                     'map50': best.get('metrics/mAP50(B)'), 'precision': best.get('metrics/precision(B)'),
+                     'recall': best.get('metrics/recall(B)'), 'cpu_hours': round(t.cpu_hours, 4),
+                     'weights': weights if os.path.exists(weights) else None})
+    rows.sort(key=lambda r: -1.0 if r['metric'] is None else r['metric'], reverse=True)
+    for rank, row in enumerate(rows, 1):
+        row['rank'] = rank
+    return rows
+
+
+def _load_state(path: str, trials: List[Trial]) -> List[Trial]:
+    """`trials` with the progress recorded in `path` (a previous run of the same sweep)."""
+    try:
+        with open(path) as f:
+            saved = {t['name']: t for t in json.load(f)['trials']}
+    except (OSError, ValueError):
+        return trials
+    for t in trials:
+        old = saved.get(t.name)
+        if old is None:
+            continue
+        if old['params'] != t.params:
+            raise ValueError(f'{path} belongs to a different sweep ({t.name} had {old["params"]}); use another --out')
+        if old['status'] in ('done', 'stopped'):
+            t.status, t.cores, t.seconds, t.curve = old['status'], old['cores'], old['seconds'], old['curve']
+    return trials
+
+
+def run_sweep(data: str, param_sets: List[dict], out_dir: str, cores_per_run: int = 2,
+              parallel: Optional[int] = None, grace: int = 2, metric: str = METRIC, device: str = 'cpu',
+              poll: float = 5.0, start: Callable = launch) -> List[dict]:
+    """Run every parameter set as a train.py trial and return the leaderboard rows (best first)."""
+    ensure_dir(out_dir)
+    # unpack packed splits once here, so parallel trials never unpack into the same folder
+    train_data = stage_data_yaml(data, os.path.join(out_dir, 'pack_stage'))
+    state_path = os.path.join(out_dir, 'sweep.json')
+    trials = _load_state(state_path, [Trial(f'trial-{i:03d}', p) for i, p in enumerate(param_sets)])
+    pending = [t for t in trials if t.status not in ('done', 'stopped')]
+    free = core_sets(cores_per_run, parallel)
+    print(f'{len(pending)} trials to run, {len(free)} at a time on {len(free[0])} cores each')
+    running = {}  # trial name -> (trial, process, log file, start time)
+
+    def save():
+        write_text_atomic(state_path, json.dumps({'data': data, 'metric': metric,
+                                                  'trials': [asdict(t) for t in trials]}, indent=1))
+        rows = leaderboard(trials, out_dir, metric)
+        with open(os.path.join(out_dir, 'leaderboard.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=LEADERBOARD_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return rows
+
+    try:
+        while pending or running:
+            while pending and free:
+                trial = pending.pop(0)
+                trial.cores, trial.status, trial.curve = free.pop(0), 'running', []
+                # a resumed trial restarts from scratch; its old results.csv would feed should_stop
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(out_dir, trial.name, 'results.csv'))
+                log = open(os.path.join(out_dir, f'{trial.name}.log'), 'w')
+                running[trial.name] = (trial, start(trial, train_command(trial, train_data, out_dir, device), log), log,
+                                       time.monotonic())
+                print(f'{trial.name} started on cores {trial.cores}: {trial.params}')
+            time.sleep(poll)
+
+            for name, (trial, proc, log, t0) in list(running.items()):
+                trial.seconds = time.monotonic() - t0
+                trial.curve = best_so_far(read_results(os.path.join(out_dir, name, 'results.csv')), metric)
+                code = proc.poll()
+                if code is None:
+                    peers = [t.curve for t in trials if t is not trial and t.curve]
+                    if not should_stop(trial.curve, peers, grace):
+                        continue
+                    proc.terminate()
+                    proc.wait()
+                    trial.status = 'stopped'
+                    print(f'{name} stopped early at epoch {len(trial.curve)}: {trial.curve[-1]:.4f} is below the '
+                          f'median of its peers')
+                else:
+                    trial.status = 'done' if code == 0 else 'failed'
+                    print(f'{name} {trial.status} after {trial.seconds:.0f}s'
+                          + (f' (exit code {code}, see {log.name})' if code else ''))
+                log.close()
+                free.append(trial.cores)
+                del running[name]
+            save()
+    finally:
+        for trial, proc, log, _ in running.values():
+            proc.terminate()
+            proc.wait()
+            log.close()
+            trial.status = 'failed'
+        rows = save()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', required=True, help='dataset yaml')
+    parser.add_argument('--param', action='append', default=[], help='KEY=V1|V2|..., KEY in ' + ', '.join(PARAMS))
+    parser.add_argument('--space', default=None, help='yaml file mapping each KEY to a list of values')
+    parser.add_argument('--search', choices=('grid', 'random'), default='grid')
+    parser.add_argument('--trials', type=int, default=None, help='trials for --search random (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='runs/sweep', help='sweep folder: trial runs, leaderboard, state')
+    parser.add_argument('--cores-per-run', type=int, default=2)
+    parser.add_argument('--parallel', type=int, default=None, help='max trials at once (default: cores / per run)')
+    parser.add_argument('--grace', type=int, default=2, help='epochs before early stopping applies; 0 disables it')
+    parser.add_argument('--metric', default=METRIC, help='results.csv column to maximise')
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--poll', type=float, default=5.0, help='seconds between results.csv checks')
+    args = parser.parse_args(argv)
+
+    space = {}
+    if args.space:
+        import yaml
+        with open(args.space) as f:
+            space.update(yaml.safe_load(f) or {})
+    space.update(parse_param(p) for p in args.param)
+    param_sets = expand_space(space, args.search, args.trials, args.seed)
+    rows = run_sweep(args.data, param_sets, args.out, args.cores_per_run, args.parallel, args.grace, args.metric,
+                     args.device, args.poll)
+
+    print(f"{'rank':>4} {'trial':<10} {'status':<8} {'metric':>8} {'cpu h':>7}  params")
+    for r in rows:
+        metric = f"{r['metric']:.4f}" if r['metric'] is not None else '-'
+        print(f"{r['rank']:>4} {r['trial']:<10} {r['status']:<8} {metric:>8} {r['cpu_hours']:>7.3f}  "
+              + ' '.join(f'{k}={r[k]}' for k in PARAMS))
+    total = sum(r['cpu_hours'] for r in rows)
+    useful = sum(r['status'] == 'done' for r in rows)
+    print(f'{total:.3f} CPU-hours, {useful} finished trials, '
+          f'{sum(r["status"] == "stopped" for r in rows)} stopped early; leaderboard: '
+          f'{os.path.join(args.out, "leaderboard.csv")}')
+
+
+if __name__ == '__main__':
+    main()
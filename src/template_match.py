@@ -1,41 +1,58 @@
+"""Find every occurrence of one or more templates in an image, over a range of scales.
+
+    python src/template_match.py --image data/sample1.jpg --template data/template.png --output outputs/template_out.jpg
+    python src/template_match.py --image truck.jpg --template "templates/*.png" --scales 0.5,1.5,9 --threshold 0.75
+"""
 import argparse
+import json
+import os
+from typing import List
+
 import cv2
 import numpy as np
-from utils import ensure_dir, save_image
 
+from matching import METHODS, TemplateMatcher, scale_range
+from sources import is_image, list_sources
+from utils import draw_detections, ensure_dir, save_image
 
-def template_match(image_path: str, template_path: str, out_path: str, method=cv2.TM_CCOEFF_NORMED):
-    img = cv2.imread(image_path, cv2.IMREAD_COLOR)
-    tpl = cv2.imread(template_path, cv2.IMREAD_COLOR)
 
+def template_match(image_path: str, template_paths, out_path: str, scales=(1.0,), threshold: float = 0.8,
+                   nms_iou: float = 0.3, method: str = 'ccoeff') -> List[dict]:
+    """Draw all matches of `template_paths` (a path, folder, glob or list of paths) and return them."""
+    img = cv2.imread(image_path, cv2.IMREAD_COLOR)
     if img is None:
         raise ValueError(f"Could not read image: {image_path}")
-    if tpl is None:
-        raise ValueError(f"Could not read template: {template_path}")
-
-    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    tpl_gray = cv2.cvtColor(tpl, cv2.COLOR_BGR2GRAY)
-
-    res = cv2.matchTemplate(img_gray, tpl_gray, method)
-    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-
-    top_left = max_loc if method in [cv2.TM_CCOEFF, cv2.TM_CCOEFF_NORMED, cv2.TM_CCORR, cv2.TM_CCORR_NORMED] else min_loc
-    h, w = tpl_gray.shape
-    bottom_right = (top_left[0] + w, top_left[1] + h)
+    if isinstance(template_paths, str):
+        template_paths = [p for p in list_sources(template_paths) if is_image(p)]
 
-    out = img.copy()
-    cv2.rectangle(out, top_left, bottom_right, (0, 255, 0), 3)
+    matcher = TemplateMatcher(template_paths, scales=scales, threshold=threshold, nms_iou=nms_iou, method=method)
+    matches = matcher.match(img)
 
-    ensure_dir(out_path and out_path.rsplit('\\', 1)[0] or '.')
+    out = draw_detections(img, matches, dict(enumerate(matcher.names)))
+    ensure_dir(os.path.dirname(out_path) or '.')
     save_image(out_path, out)
-    print(f"Saved template match output to {out_path}")
+    print(f"Saved template match output to {out_path} ({len(matches)} matches)")
+    return matcher.to_dicts(matches)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--image', type=str, required=True)
-    parser.add_argument('--template', type=str, required=True)
+    parser.add_argument('--template', type=str, nargs='+', required=True,
+                        help='template images, folders or globs')
     parser.add_argument('--output', type=str, default='outputs/template_out.jpg')
+    parser.add_argument('--scales', type=str, default='1,1,1', help='min,max,steps of the template scale search')
+    parser.add_argument('--threshold', type=float, default=0.8, help='minimum normalised match score')
+    parser.add_argument('--nms-iou', type=float, default=0.3)
+    parser.add_argument('--method', choices=sorted(METHODS), default='ccoeff')
+    parser.add_argument('--json', type=str, default=None, help='also write the matches to this JSON file')
     args = parser.parse_args()
 
-    template_match(args.image, args.template, args.output)
+    lo, hi, steps = args.scales.split(',')
+    templates = [p for spec in args.template for p in list_sources(spec) if is_image(p)]
+    found = template_match(args.image, templates, args.output, scale_range(float(lo), float(hi), int(steps)),
+                           args.threshold, args.nms_iou, args.method)
+    if args.json:
+        ensure_dir(os.path.dirname(args.json) or '.')
+        with open(args.json, 'w') as f:
+            json.dump(found, f, indent=2)
@@ -0,0 +1,154 @@
+"""Tiled (sliced) inference for high-resolution images.
+
+At the model's 640-pixel input size, small defects in a 4K frame shrink to a few
+pixels. `TiledPredictor` wraps a detector engine. It cuts every image into
+overlapping `tile` x `tile` slices. The slices are NumPy views, not copies. All
+slices go through the model in batches of `batch_size`, optionally together with
+the whole frame so that objects larger than a tile are still found. The boxes
+are shifted back to image coordinates and merged across tiles:
+
+    nms  keep the most confident box of each overlapping group
+    wbf  weighted box fusion: average the group's boxes weighted by confidence
+
+Overlap is measured as IoU or, the default, as intersection over the smaller
+box ("ios"). IoS also merges a box that a tile edge cut off with the complete
+box from the neighbouring tile.
+"""
+from typing import List, Sequence
+
+import numpy as np
+
+MERGE_METHODS = ('nms', 'wbf')
+MERGE_METRICS = ('iou', 'ios')
+NO_DETECTIONS = np.zeros((0, 6), dtype=np.float32)
+
+
+def tile_grid(height: int, width: int, tile: int = 640, overlap: float = 0.2) -> np.ndarray:
+    """(K, 4) x1, y1, x2, y2 of tiles overlapping by `overlap` (a fraction) that cover the image.
+
+    The last row and column of tiles are aligned to the image edge, so every tile is
+    full size unless the image itself is smaller than a tile.
+    """
+    def starts(size):
+        if size <= tile:
+            return [0]
+        step = max(1, int(tile * (1 - overlap)))
+        return list(range(0, size - tile, step)) + [size - tile]
+
+    grid = [(x, y, min(x + tile, width), min(y + tile, height)) for y in starts(height) for x in starts(width)]
+    return np.asarray(grid, dtype=np.int64)
+
+
+def tile_views(img: np.ndarray, grid: np.ndarray) -> List[np.ndarray]:
+    """Slices of `img` for every tile of `grid`, as views sharing its memory."""
+    return [img[y1:y2, x1:x2] for x1, y1, x2, y2 in grid.tolist()]
+
+
+def _overlap(box: np.ndarray, boxes: np.ndarray, metric: str) -> np.ndarray:
+    lt = np.maximum(box[:2], boxes[:, :2])
+    rb = np.minimum(box[2:4], boxes[:, 2:4])
+    inter = np.clip(rb - lt, 0, None).prod(1)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    denom = np.minimum(area, areas) if metric == 'ios' else area + areas - inter
+    return np.divide(inter, denom, out=np.zeros_like(inter), where=denom > 0)
+
+
+def merge_detections(dets: np.ndarray, method: str = 'nms', threshold: float = 0.5, metric: str = 'ios',
+                     agnostic: bool = False) -> np.ndarray:
+    """Merge (N, 6) detections from overlapping tiles; returns them sorted by confidence.
+
+    Boxes are grouped greedily in descending confidence order: each group is the most
+    confident remaining box plus every remaining box of the same class (any class with
+    `agnostic`) overlapping it by at least `threshold`.
+    """
+    if method not in MERGE_METHODS:
+        raise ValueError(f"method must be one of {MERGE_METHODS}")
+    if len(dets) < 2:
+        return dets
+    dets = dets[np.argsort(-dets[:, 4], kind='stable')]
+    alive = np.ones(len(dets), dtype=bool)
+    merged = []
+    for i in range(len(dets)):
+        if not alive[i]:
+            continue
+        candidates = np.flatnonzero(alive)
+        group = _overlap(dets[i], dets[candidates], metric) >= threshold
+        if not agnostic:
+            group &= dets[candidates, 5] == dets[i, 5]
+        group |= candidates == i
+        members = candidates[group]
+        alive[members] = False
+        if method == 'wbf' and len(members) > 1:
+            weights = dets[members, 4:5]
+            box = (dets[members, :4] * weights).sum(0) / weights.sum()
+            merged.append(np.concatenate([box, dets[i, 4:6]]))
+        else:
+            merged.append(dets[i])
+    return np.asarray(merged, dtype=np.float32).reshape(-1, 6)
+
+
+class TiledPredictor:
+    """Drop-in wrapper around a detector engine that predicts on overlapping tiles.
+
+    tile:        tile side in pixels (images no larger than a tile are predicted whole)
+    overlap:     fraction of a tile shared with its neighbour
+    batch_size:  slices per `engine.predict` call (tiles of several images share batches)
+    full_frame:  also predict the whole image, for objects bigger than a tile
+    merge:       'nms' or 'wbf'; `merge_threshold` and `metric` ('iou' or 'ios') set the grouping
+    """
+
+    def __init__(self, engine, tile: int = 640, overlap: float = 0.2, batch_size: int = 8, full_frame: bool = True,
+                 merge: str = 'nms', merge_threshold: float = 0.5, metric: str = 'ios'):
+        if tile < 32:
+            raise ValueError('tile must be at least 32 pixels')
+        if not 0.0 <= overlap < 1.0:
+            raise ValueError('overlap must be in [0, 1)')
+        if merge not in MERGE_METHODS:
+            raise ValueError(f"merge must be one of {MERGE_METHODS}")
+        if metric not in MERGE_METRICS:
+            raise ValueError(f"metric must be one of {MERGE_METRICS}")
+        self.engine = engine
+        self.tile = tile
+        self.overlap = overlap
+        self.batch_size = max(1, batch_size)
+        self.full_frame = full_frame
+        self.merge = merge
+        self.merge_threshold = merge_threshold
+        self.metric = metric
+
+    def __getattr__(self, name):
+        # names, imgsz, plot, ... come from the wrapped engine
+        return getattr(self.engine, name)
+
+    def predict(self, images: Sequence[np.ndarray], conf: float = 0.25, iou: float = 0.7) -> List[np.ndarray]:
+        slices, owners, offsets = [], [], []
+        for k, img in enumerate(images):
+            grid = tile_grid(img.shape[0], img.shape[1], self.tile, self.overlap)
+            if len(grid) > 1:
+                slices += tile_views(img, grid)
+                owners += [k] * len(grid)
+                offsets += grid[:, :2].tolist()
+            if len(grid) == 1 or self.full_frame:
+                slices.append(img)
+                owners.append(k)
+                offsets.append([0, 0])
+
+        results = []
+        for start in range(0, len(slices), self.batch_size):
+            results += self.engine.predict(slices[start:start + self.batch_size], conf=conf, iou=iou)
+
+        per_image = [[] for _ in images]
+        for dets, k, (dx, dy) in zip(results, owners, offsets):
+            if len(dets):
+                dets = dets.copy()
+                dets[:, [0, 2]] += dx
+                dets[:, [1, 3]] += dy
+                per_image[k].append(dets)
+        return [merge_detections(np.concatenate(d), self.merge, self.merge_threshold, self.metric)
+                if d else NO_DETECTIONS for d in per_image]
+
+
+def tiled(engine, tile: int = 0, **kwargs):
+    """`engine` wrapped in a TiledPredictor, or unchanged when `tile` is 0 (tiling off)."""
+    return TiledPredictor(engine, tile, **kwargs) if tile else engine
@@ -1,14 +1,39 @@
 """Simple training wrapper using Ultralytics YOLOv8
 Usage:
     python src/train.py --data data/dataset/dataset.yaml --epochs 5 --device cpu
+    python src/train.py --data data/dataset/dataset.yaml --augment hflip,scale=0.75:1.25,color
+    python src/sweep.py --data data/dataset/dataset.yaml --param imgsz=320|640   (many runs, see src/sweep.py)
+
+--augment takes a src/augment.py pipeline spec and applies it on the fly every epoch
+through Ultralytics' own augmentation settings, without writing augmented copies.
+
+train/val/test entries of the dataset yaml may point at packed datasets (see
+src/packed.py); they are unpacked to --stage-dir once and reused until repacked.
+--check validates the dataset first (src/dataset.py) and stops on any error, rather
+than finding broken images or labels part-way through training.
 """
 import argparse
 from ultralytics import YOLO
 
+from augment import parse_pipeline
+from dataset import print_report, scan
+from packed import stage_data_yaml
+
+DEFAULT_STAGE_DIR = 'outputs/pack_stage'
+
 
-def main(data_yaml, epochs=5, model='yolov8n.pt', device='cpu', name='train'):
+def main(data_yaml, epochs=5, model='yolov8n.pt', device='cpu', name='train', augment=None,
+         stage_dir=DEFAULT_STAGE_DIR, check=False, imgsz=640, project=None, exist_ok=False, workers=8):
+    if check:
+        report = scan(data_yaml)
+        print_report(report)
+        if report['errors']:
+            raise SystemExit(f'{data_yaml}: dataset check failed; fix the errors above or train without --check')
+    data_yaml = stage_data_yaml(data_yaml, stage_dir)
     y = YOLO(model)
-    y.train(data=data_yaml, epochs=epochs, device=device, imgsz=640, name=name)
+    hyp = parse_pipeline(augment).to_ultralytics() if augment else {}
+    y.train(data=data_yaml, epochs=epochs, device=device, imgsz=imgsz, name=name, project=project, exist_ok=exist_ok,
+            workers=workers, **hyp)
 
 
 if __name__ == '__main__':
@@ -18,5 +43,15 @@ if __name__ == '__main__':
     parser.add_argument('--model', type=str, default='yolov8n.pt')
     parser.add_argument('--device', type=str, default='cpu')
     parser.add_argument('--name', type=str, default='train')
+    parser.add_argument('--augment', type=str, default=None,
+                        help='augmentation pipeline, e.g. "hflip,scale,color" (see src/augment.py)')
+    parser.add_argument('--stage-dir', type=str, default=DEFAULT_STAGE_DIR,
+                        help='where packed dataset splits are unpacked for training')
+    parser.add_argument('--check', action='store_true', help='validate images and labels before training')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--project', type=str, default=None, help='parent folder of the run (default: runs/detect)')
+    parser.add_argument('--exist-ok', action='store_true', help='reuse --name instead of numbering a new run')
+    parser.add_argument('--workers', type=int, default=8, help='dataloader workers')
     args = parser.parse_args()
-    main(args.data, args.epochs, args.model, args.device, args.name)
+    main(args.data, args.epochs, args.model, args.device, args.name, args.augment, args.stage_dir, args.check,
+         args.imgsz, args.project, args.exist_ok, args.workers)
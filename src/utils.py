@@ -5,8 +5,99 @@ def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
 
+def write_text_atomic(path, text):
+    """Write `text` to `path` via a temporary file and a rename, so readers never see a partial file."""
+    directory = os.path.dirname(path) or '.'
+    ensure_dir(directory)
+    tmp = os.path.join(directory, f'.{os.path.basename(path)}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
 def save_image(path, img):
     # img is numpy array (BGR) — use cv2.imwrite where needed
     import cv2
     ensure_dir(os.path.dirname(path))
     cv2.imwrite(path, img)
+
+
+def decode_image(data, reduce=1):
+    """Decode encoded image bytes (JPEG/PNG/...) straight into a BGR numpy array.
+
+    `reduce` (1, 2, 4 or 8) asks the codec to decode at a fraction of the full
+    resolution, which is much cheaper than decoding at full size and resizing.
+    Returns None if the bytes can't be decoded.
+    """
+    import cv2
+    import numpy as np
+    flags = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }
+    if reduce not in flags:
+        raise ValueError(f"reduce must be one of {sorted(flags)}, got {reduce}")
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return None
+    return cv2.imdecode(buf, flags[reduce])
+
+
+# BGR colours cycled per class id
+PALETTE = [(56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+           (10, 249, 72), (23, 204, 146), (134, 219, 61), (187, 212, 0), (168, 153, 44)]
+
+
+def draw_detections(img, dets, names=None, inplace=False):
+    """Draw a box for each (x1, y1, x2, y2, conf, cls) row of `dets` on the BGR image `img`.
+
+    Returns an annotated copy, or with `inplace` draws straight onto `img` (no copy).
+    """
+    import cv2
+    out = img if inplace else img.copy()
+    lw = max(round(sum(img.shape[:2]) / 2 * 0.003), 2)
+    for x1, y1, x2, y2, conf, cls in dets.tolist() if len(dets) else []:
+        color = PALETTE[int(cls) % len(PALETTE)]
+        p1, p2 = (int(x1), int(y1)), (int(x2), int(y2))
+        cv2.rectangle(out, p1, p2, color, lw, cv2.LINE_AA)
+        label = f"{(names or {}).get(int(cls), int(cls))} {conf:.2f}"
+        (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, lw / 3, max(lw - 1, 1))
+        top = p1[1] - th - 3 if p1[1] - th - 3 >= 0 else p1[1] + th + 3
+        cv2.rectangle(out, p1, (p1[0] + tw, top), color, -1, cv2.LINE_AA)
+        cv2.putText(out, label, (p1[0], max(top, p1[1]) - 2), cv2.FONT_HERSHEY_SIMPLEX, lw / 3, (255, 255, 255),
+                    max(lw - 1, 1), cv2.LINE_AA)
+    return out
+
+
+IMAGE_FORMATS = {'jpeg': ('.jpg', 'image/jpeg'), 'webp': ('.webp', 'image/webp')}
+
+
+def encode_image(img, image_format='jpeg', quality=90):
+    """Encode a BGR array as JPEG or WebP bytes at `quality` (1-100)."""
+    import cv2
+    ext, _ = IMAGE_FORMATS[image_format]
+    flag = cv2.IMWRITE_JPEG_QUALITY if image_format == 'jpeg' else cv2.IMWRITE_WEBP_QUALITY
+    ok, buf = cv2.imencode(ext, img, [flag, int(quality)])
+    if not ok:
+        raise ValueError(f"could not encode image as {image_format}")
+    return buf.tobytes()
+
+
+def render_annotated(img, dets, names=None, max_dim=None, image_format='jpeg', quality=90):
+    """Draw `dets` on `img` and encode it; the fast path for annotated API responses.
+
+    `img` is drawn on in place, so pass a frame you no longer need. With
+    `max_dim` the frame is first shrunk so its longer side is at most `max_dim`
+    (boxes are scaled to match), which makes drawing and encoding cheaper.
+    """
+    import cv2
+    h, w = img.shape[:2]
+    if max_dim and max(h, w) > max_dim:
+        r = max_dim / max(h, w)
+        img = cv2.resize(img, (max(1, round(w * r)), max(1, round(h * r))), interpolation=cv2.INTER_AREA)
+        dets = dets.copy()
+        dets[:, :4] *= r
+    draw_detections(img, dets, names, inplace=True)
+    return encode_image(img, image_format, quality)
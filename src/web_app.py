@@ -1,15 +1,18 @@
 import streamlit as st
-from ultralytics import YOLO
 import cv2
 import numpy as np
 import tempfile
 import os
 
-MODEL_PATH = 'yolov8n.pt'  # will be downloaded by ultralytics if missing
+from engine import DEFAULT_BACKEND, DEFAULT_MODEL
+from registry import get_engine
+
+MODEL_PATH = DEFAULT_MODEL  # PATTERNDETECT_MODEL; yolov8n.pt is downloaded by ultralytics if missing
+BACKEND = DEFAULT_BACKEND  # PATTERNDETECT_BACKEND: auto, torch or onnx
 
 @st.cache_resource
 def load_model():
-    return YOLO(MODEL_PATH)
+    return get_engine(MODEL_PATH, BACKEND)
 
 st.title('Truck Inspection — Detection PoC')
 st.markdown('Upload an image (or use sample) to run YOLOv8 detection and show annotated output.')
@@ -33,19 +36,16 @@ if image_path:
     st.image(image_path, caption='Input image', use_column_width=True)
 
     st.write('Running detection...')
-    results = model.predict(source=image_path, conf=0.25, save=False)
-    r = results[0]
-    annotated = r.plot()  # RGB array
+    img = cv2.imread(image_path)
+    dets = model.predict([img], conf=0.25)[0]
+    annotated = model.plot(img, dets)  # BGR array
 
-    st.image(annotated, caption='Annotated', use_column_width=True)
+    st.image(annotated, caption='Annotated', channels='BGR', use_column_width=True)
 
     # show table of detections
     boxes = []
-    for box in r.boxes:
-        cls = int(box.cls[0])
-        conf = float(box.conf[0])
-        xyxy = box.xyxy[0].tolist()
-        boxes.append({'class': cls, 'conf': round(conf, 3), 'xyxy': [round(x, 2) for x in xyxy]})
+    for x1, y1, x2, y2, conf, cls in dets.tolist():
+        boxes.append({'class': int(cls), 'conf': round(conf, 3), 'xyxy': [round(x, 2) for x in (x1, y1, x2, y2)]})
 
     if boxes:
         st.subheader('Detections')
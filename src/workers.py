@@ -0,0 +1,164 @@
+"""Bounded worker pool for blocking inference work (predict, plot, encode).
+
+Each worker (thread or process) builds its own state once through the picklable
+`loader` callable; for the API that is a per-worker `ModelRegistry`, so every
+worker holds its own loaded engines. Jobs submitted to the pool call
+`worker_state()` to get it, and `broadcast()` runs a job once on every worker,
+e.g. to preload a new model version before it is published. Admission is bounded: `slot()`
+rejects with `Overloaded` once `max_pending` requests are in flight, so callers
+can shed load fast instead of queueing without limit.
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import multiprocessing
+import threading
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+try:
+    from .tiling import TiledPredictor
+    from .utils import render_annotated
+except ImportError:
+    from tiling import TiledPredictor
+    from utils import render_annotated
+
+_local = threading.local()
+_loader: Optional[Callable[[], Any]] = None
+
+
+class Overloaded(RuntimeError):
+    """Raised when the pool already has `max_pending` requests in flight."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _init_worker(loader):
+    global _loader
+    _loader = loader
+
+
+def worker_state():
+    """Return the state (e.g. model registry) owned by the current worker."""
+    state = getattr(_local, 'state', None)
+    if state is None:
+        if _loader is None:
+            raise RuntimeError('worker_state() called outside a WorkerPool worker')
+        state = _local.state = _loader()
+    return state
+
+
+def _on_each_worker(barrier, timeout, fn, *args):
+    # every broadcast task blocks here until all workers hold one, so each worker runs exactly one
+    barrier.wait(timeout)
+    return fn(*args)
+
+
+class WorkerPool(concurrent.futures.Executor):
+    """Thread or process pool whose workers each hold their own models.
+
+    The pool is a regular `concurrent.futures.Executor`, so it can be passed to
+    `loop.run_in_executor` (or `BatchScheduler(executor=...)`) directly.
+    """
+
+    def __init__(self, loader: Callable[[], Any], kind: str = 'thread', workers: int = 2, max_pending: int = 32,
+                 retry_after: int = 1):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"kind must be 'thread' or 'process', got {kind!r}")
+        self.loader = loader
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.pending = 0
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._manager = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        with self._lock:
+            if self._executor is None:
+                cls = concurrent.futures.ThreadPoolExecutor if self.kind == 'thread' else concurrent.futures.ProcessPoolExecutor
+                self._executor = cls(max_workers=self.workers, initializer=_init_worker, initargs=(self.loader,))
+            return self._executor
+
+    def start(self, preload: bool = True):
+        """Create the workers; with `preload` wait until every worker has built its state."""
+        self.executor
+        if preload:
+            self.broadcast(worker_state)
+
+    def broadcast(self, fn, *args, timeout: Optional[float] = 300):
+        """Run `fn(*args)` once on every worker and return the results."""
+        executor = self.executor
+        if self.kind == 'thread':
+            barrier = threading.Barrier(self.workers)
+        else:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            barrier = self._manager.Barrier(self.workers)
+        futures = [executor.submit(_on_each_worker, barrier, timeout, fn, *args) for _ in range(self.workers)]
+        return [f.result() for f in futures]
+
+    def submit(self, fn, /, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` on a worker without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self, fn, *args)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Admit one request, or raise `Overloaded` if `max_pending` are already in flight."""
+        # only touched from the event loop thread, so a plain counter is enough
+        if self.pending >= self.max_pending:
+            raise Overloaded(f'server busy ({self.pending} requests in flight)', self.retry_after)
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+
+# --- jobs executed on the workers -------------------------------------------------
+
+def preload(spec) -> str:
+    """Load (and warm up) `spec` in this worker's registry."""
+    worker_state().load(spec)
+    return spec.version
+
+
+def predict_batch(images: List[np.ndarray], confs: List[float], spec) -> List[np.ndarray]:
+    """Run one batched predict with the engine for `spec`; returns an (N, 6) float32 array per image.
+
+    Columns are x1, y1, x2, y2, conf, cls. The batch is predicted at the lowest
+    requested threshold and then filtered per image.
+    """
+    results = worker_state().load(spec).predict(images, conf=min(confs))
+    return [dets[dets[:, 4] >= conf] for dets, conf in zip(results, confs)]
+
+
+def predict_tiled(image: np.ndarray, conf: float, spec, tile: int, overlap: float, merge: str) -> np.ndarray:
+    """Predict `image` on overlapping tiles plus the full frame, all tiles in one batch (see src/tiling.py)."""
+    engine = TiledPredictor(worker_state().load(spec), tile, overlap, batch_size=64, merge=merge)
+    return engine.predict([image], conf=conf)[0]
+
+
+def encode_annotated(img: np.ndarray, dets: np.ndarray, spec, max_dim: Optional[int] = None,
+                     image_format: str = 'jpeg', quality: int = 90) -> bytes:
+    """Draw `dets` on `img` (in place) with the class names of `spec` and encode it (see utils.render_annotated)."""
+    names = worker_state().load(spec).names
+    return render_annotated(img, dets, names, max_dim, image_format, quality)
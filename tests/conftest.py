@@ -3,11 +3,17 @@ import shutil
 import subprocess
 import sys
 
+import pytest
+
 """Pytest conftest to ensure sample images exist before tests run.
 If `data/samples` is empty or missing, invoke `scripts/generate_samples.py`.
 Also ensures `data/sample1.jpg` exists (some tests expect that path).
+The CLI scripts import their siblings as top-level modules (`from utils import ...`),
+so `src/` is put on sys.path for tests that exercise them.
 """
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
 
 def pytest_sessionstart(session):
     out_dir = os.path.join("data", "samples")
@@ -21,3 +27,13 @@ def pytest_sessionstart(session):
     # copy sample1 into data/sample1.jpg if a top-level sample isn't present
     if not os.path.exists(dst) and os.path.exists(src):
         shutil.copy(src, dst)
+
+
+@pytest.fixture(scope='session')
+def yolo_weights(tmp_path_factory):
+    """Randomly initialised yolov8n weights: no download needed, enough to exercise the pipeline."""
+    pytest.importorskip('ultralytics')
+    from ultralytics import YOLO
+    path = tmp_path_factory.mktemp('weights') / 'model.pt'
+    YOLO('yolov8n.yaml').save(str(path))
+    return str(path)
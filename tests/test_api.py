@@ -1,3 +1,6 @@
+import json
+
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
 from src.api import app
@@ -14,3 +17,199 @@ def test_health():
 def test_detect_no_file():
     r = client.post('/detect')
     assert r.status_code == 422  # missing file
+
+
+def test_detect_undecodable_image():
+    r = client.post('/detect', files={'file': ('broken.jpg', b'not a jpeg', 'image/jpeg')})
+    assert r.status_code == 400
+
+
+def test_detect_bad_reduce():
+    with open('data/sample1.jpg', 'rb') as f:
+        r = client.post('/detect', files={'file': ('sample1.jpg', f, 'image/jpeg')}, params={'reduce': 3})
+    assert r.status_code == 400
+
+
+def test_detect_rejects_when_overloaded(monkeypatch):
+    from src import api
+    monkeypatch.setattr(api.pool, 'max_pending', 0)
+    with open('data/sample1.jpg', 'rb') as f:
+        r = client.post('/detect', files={'file': ('sample1.jpg', f, 'image/jpeg')})
+    assert r.status_code == 429
+    assert r.headers['retry-after'] == str(api.pool.retry_after)
+
+
+def _batch_app(monkeypatch, yolo_weights):
+    from src import api
+    from src.registry import DEFAULT_NAME, ModelRegistry
+    monkeypatch.setattr(api, 'registry', ModelRegistry())
+    api.registry.register(DEFAULT_NAME, yolo_weights)
+    return api.app
+
+
+def test_detect_batch(monkeypatch, yolo_weights):
+    import io
+    import zipfile
+    with open('data/sample1.jpg', 'rb') as f:
+        jpg = f.read()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('a/one.jpg', jpg)
+        zf.writestr('notes.txt', 'skipped')
+        zf.writestr('two.jpg', jpg)
+
+    with TestClient(_batch_app(monkeypatch, yolo_weights)) as c:
+        files = [('files', ('x.jpg', jpg, 'image/jpeg')), ('files', ('bad.jpg', b'nope', 'image/jpeg')),
+                 ('files', ('set.zip', archive.getvalue(), 'application/zip'))]
+        r = c.post('/detect/batch', files=files, params={'conf': 0.0})
+        assert r.status_code == 200
+        results = r.json()['results']
+        assert [x['name'] for x in results] == ['x.jpg', 'bad.jpg', 'a/one.jpg', 'two.jpg']
+        assert results[1]['error']
+        assert results[0]['width'] == 1280 and all(len(b) == 6 for b in results[0]['boxes'])
+        assert results[2]['boxes'] == results[0]['boxes']
+
+        r = c.post('/detect/batch', files=files, params={'stream': 'true'})
+        assert r.headers['content-type'].startswith('application/x-ndjson')
+        lines = [json.loads(line) for line in r.text.splitlines()]
+        assert sorted(x['index'] for x in lines) == [0, 1, 2, 3]
+
+        r = c.post('/detect/batch', files=[('files', ('a.txt', b'x', 'text/plain'))])
+        assert r.status_code == 400
+
+        from src import api
+        monkeypatch.setattr(api, 'MAX_BATCH_IMAGES', 1)
+        r = c.post('/detect/batch', files=[('files', ('set.zip', archive.getvalue(), 'application/zip'))])
+        assert r.status_code == 413
+        monkeypatch.setattr(api, 'MAX_BATCH_IMAGES', 256)
+        monkeypatch.setattr(api, 'MAX_ARCHIVE_MEMBER_BYTES', len(jpg) - 1)
+        r = c.post('/detect/batch', files=[('files', ('set.zip', archive.getvalue(), 'application/zip'))])
+        assert r.status_code == 413 and 'a/one.jpg' in r.json()['detail']
+        monkeypatch.setattr(api, 'MAX_ARCHIVE_MEMBER_BYTES', len(jpg))
+        monkeypatch.setattr(api, 'MAX_ARCHIVE_BYTES', len(jpg) + 1)
+        r = c.post('/detect/batch', files=[('files', ('set.zip', archive.getvalue(), 'application/zip'))])
+        assert r.status_code == 413
+
+
+def test_detect_response_formats(monkeypatch, yolo_weights):
+    from src import formats
+    with open('data/sample1.jpg', 'rb') as f:
+        jpg = f.read()
+    with TestClient(_batch_app(monkeypatch, yolo_weights)) as c:
+        def post(**kw):
+            return c.post('/detect', files={'file': ('a.jpg', jpg, 'image/jpeg')}, **kw)
+
+        ref = post(params={'conf': 0.0})
+        ref_boxes, ref_img = formats.decode(ref.headers['content-type'], ref.content)
+        assert len(ref_boxes) and ref_img
+
+        r = post(params={'conf': 0.0}, headers={'Accept': formats.BOXES})
+        assert r.headers['content-type'] == formats.BOXES
+        assert len(r.content) == 24 * len(ref_boxes)
+        np.testing.assert_allclose(formats.decode(formats.BOXES, r.content)[0], ref_boxes, atol=0.01)
+
+        r = post(params={'conf': 0.0, 'format': 'multipart'})
+        boxes, img = formats.decode(r.headers['content-type'], r.content)
+        assert img == ref_img and len(r.content) < len(ref.content)
+
+        assert post(params={'format': 'xml'}).status_code == 400
+
+
+def test_annotated_image_options(monkeypatch, yolo_weights):
+    import cv2
+    with open('data/sample1.jpg', 'rb') as f:
+        jpg = f.read()
+    with TestClient(_batch_app(monkeypatch, yolo_weights)) as c:
+        r = c.post('/detect/image', files={'file': ('a.jpg', jpg, 'image/jpeg')},
+                   params={'max_dim': 320, 'image_format': 'webp', 'quality': 50})
+        assert r.status_code == 200 and r.headers['content-type'] == 'image/webp'
+        img = cv2.imdecode(np.frombuffer(r.content, np.uint8), cv2.IMREAD_COLOR)
+        assert max(img.shape[:2]) == 320
+
+        r = c.post('/detect', files={'file': ('a.jpg', jpg, 'image/jpeg')}, params={'quality': 0})
+        assert r.status_code == 400
+
+
+def test_repeated_uploads_hit_the_result_cache(monkeypatch, yolo_weights):
+    from src import api
+    from src.result_cache import ResultCache
+    monkeypatch.setattr(api, 'result_cache', ResultCache())
+    with open('data/sample1.jpg', 'rb') as f:
+        jpg = f.read()
+    with TestClient(_batch_app(monkeypatch, yolo_weights)) as c:
+        first = c.post('/detect', files={'file': ('a.jpg', jpg, 'image/jpeg')})
+        second = c.post('/detect', files={'file': ('b.jpg', jpg, 'image/jpeg')})
+        assert first.content == second.content
+        stats = c.get('/cache').json()
+        # detections + annotated image: both computed once, then served from the cache
+        assert stats['misses'] == 2 and stats['hits'] == 2
+        c.post('/detect', files={'file': ('a.jpg', jpg, 'image/jpeg')}, params={'conf': 0.5})
+        assert c.get('/cache').json()['misses'] == 4
+
+
+def test_metrics_readiness_and_server_timing(monkeypatch, yolo_weights):
+    from src import api
+    from src.result_cache import ResultCache
+    monkeypatch.setattr(api, 'result_cache', ResultCache(max_entries=0))
+    monkeypatch.setattr(api, '_ready', {})
+    assert client.get('/ready').status_code == 503  # nothing preloaded without the startup hook
+    with open('data/sample1.jpg', 'rb') as f:
+        jpg = f.read()
+    with TestClient(_batch_app(monkeypatch, yolo_weights)) as c:
+        assert c.get('/ready').json()['ready'] is True
+        r = c.post('/detect', files={'file': ('a.jpg', jpg, 'image/jpeg')}, headers={'X-Server-Timing': '1'})
+        assert [t.split(';')[0] for t in r.headers['server-timing'].split(', ')] == \
+            ['read', 'decode', 'infer', 'render', 'serialize']
+        assert 'server-timing' not in c.get('/health').headers
+        c.post('/detect', files={'file': ('a.jpg', b'', 'image/jpeg')})
+        text = c.get('/metrics').text
+    assert 'patterndetect_stage_seconds_count{stage="infer"}' in text
+    assert 'patterndetect_batch_size_count' in text
+    assert 'patterndetect_errors_total{path="/detect",status="400"}' in text
+    assert 'patterndetect_model_load_seconds{model="default"' in text
+    assert 'patterndetect_queue_depth 0.0' in text
+
+
+def test_detect_stream_websocket(monkeypatch, yolo_weights):
+    with open('data/sample1.jpg', 'rb') as f:
+        jpg = f.read()
+    with TestClient(_batch_app(monkeypatch, yolo_weights)) as c:
+        with c.websocket_connect('/detect/stream?conf=0.0') as ws:
+            ws.send_bytes(jpg)
+            event = ws.receive_json()
+            assert event['frame'] == 0 and 'detections' in event and 'dropped' in event
+            ws.send_bytes(b'not an image')
+            assert ws.receive_json()['error']
+            ws.send_text('end')
+            end = ws.receive_json()
+            assert end['end'] and end['processed'] == 1
+
+
+def test_detect_stream_events(monkeypatch, yolo_weights, tmp_path):
+    import cv2
+    from src import api
+    img = cv2.imread('data/sample1.jpg')
+    writer = cv2.VideoWriter(str(tmp_path / 'lane.avi'), cv2.VideoWriter_fourcc(*'MJPG'), 10, (320, 180))
+    for _ in range(3):
+        writer.write(cv2.resize(img, (320, 180)))
+    writer.release()
+    monkeypatch.setattr(api, 'STREAM_ROOT', str(tmp_path))
+    with TestClient(_batch_app(monkeypatch, yolo_weights)) as c:
+        r = c.get('/detect/stream/events', params={'source': str(tmp_path / 'lane.avi'), 'realtime': 'false'})
+        assert r.headers['content-type'].startswith('text/event-stream')
+        events = [json.loads(line[6:]) for line in r.text.splitlines() if line.startswith('data: ')]
+        assert [e['frame'] for e in events[:-1]] == [0, 1, 2]
+        assert events[-1]['end'] and events[-1]['processed'] == 3
+        assert c.get('/detect/stream/events', params={'source': 'data/sample1.jpg'}).status_code == 400
+        assert c.get('/detect/stream/events', params={'source': 'rtsp://cam/1'}).status_code == 400
+
+
+def test_detect_tiled(monkeypatch, yolo_weights):
+    with open('data/sample1.jpg', 'rb') as f:
+        jpg = f.read()
+    with TestClient(_batch_app(monkeypatch, yolo_weights)) as c:
+        r = c.post('/detect', files={'file': ('a.jpg', jpg, 'image/jpeg')},
+                   params={'conf': 0.0, 'tile': 320, 'tile_merge': 'wbf', 'annotated': 'false'})
+        assert r.status_code == 200 and 'detections' in r.json()
+        r = c.post('/detect', files={'file': ('a.jpg', jpg, 'image/jpeg')}, params={'tile': 16})
+        assert r.status_code == 400
@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+
+from api_client import AsyncPatternDetectClient, PatternDetectClient, guess_mime
+
+
+def test_guess_mime_sniffs_content():
+    with open('data/sample1.jpg', 'rb') as f:
+        assert guess_mime('upload.bin', f.read(16)) == 'image/jpeg'
+    assert guess_mime('x.png', b'\x89PNG\r\n\x1a\n') == 'image/png'
+    assert guess_mime('scan.webp') == 'image/webp'
+    assert guess_mime('set.tgz') == 'application/x-tar'
+
+
+def _flaky_server(fail_times):
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request.headers['content-type'])
+        if len(calls) <= fail_times:
+            return httpx.Response(429, headers={'Retry-After': '0'})
+        return httpx.Response(200, json={'detections': []})
+    return handler, calls
+
+
+def test_async_client_retries_and_limits_concurrency():
+    handler, calls = _flaky_server(fail_times=2)
+    in_flight = peak = 0
+
+    async def slow(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return handler(request)
+
+    async def main():
+        transport = httpx.MockTransport(slow)
+        async with AsyncPatternDetectClient('http://api', transport=transport, backoff=0) as client:
+            paths = ['data/sample1.jpg'] * 10
+            return [r async for r in client.detect_many(paths, concurrency=3)]
+
+    results = asyncio.run(main())
+    assert len(results) == 10 and all(r == {'detections': []} for _, r in results)
+    assert len(calls) == 12  # two 429s were retried
+    assert peak <= 3
+
+
+def test_sync_client_parallel_and_gives_up_after_retries():
+    handler, calls = _flaky_server(fail_times=100)
+    client = PatternDetectClient('http://api', retries=2, backoff=0)
+    client.client = httpx.Client(transport=httpx.MockTransport(handler))
+    results = list(client.detect_many(['data/sample1.jpg'] * 2, workers=2))
+    assert all(isinstance(r, httpx.HTTPStatusError) for _, r in results)
+    assert len(calls) == 6
+
+
+def test_sync_detect_many_pulls_paths_lazily():
+    handler, calls = _flaky_server(fail_times=0)
+    client = PatternDetectClient('http://api', backoff=0)
+    client.client = httpx.Client(transport=httpx.MockTransport(handler))
+    pulled = []
+
+    def paths():
+        for i in range(100):
+            pulled.append(i)
+            yield 'data/sample1.jpg'
+
+    results = client.detect_many(paths(), workers=2)
+    next(results)
+    assert len(pulled) <= 2 * 2 + 1
+    assert len(list(results)) == 99 and len(calls) == 100
+
+
+def test_sync_detect_batch_retries_overload():
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request.read())
+        if len(calls) % 2:
+            return httpx.Response(503, headers={'Retry-After': '0'})
+        if request.url.params['stream'] == 'true':
+            return httpx.Response(200, content=b'{"index": 0}\n{"index": 1}\n')
+        return httpx.Response(200, json={'results': [{'index': 0}, {'index': 1}]})
+
+    client = PatternDetectClient('http://api', backoff=0)
+    client.client = httpx.Client(transport=httpx.MockTransport(handler))
+    files = iter(['data/sample1.jpg', ('b.jpg', b'\xff\xd8\xff')])
+    assert client.detect_batch(files) == [{'index': 0}, {'index': 1}]
+    assert len(calls) == 2 and len(calls[0]) == len(calls[1]) > 1000  # the file parts were re-sent whole
+    assert list(client.detect_batch(['data/sample1.jpg'], stream=True)) == [{'index': 0}, {'index': 1}]
+    assert len(calls) == 4
@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+import pytest
+
+from augment import (AugmentedDataset, ColorJitter, Compose, HFlip, RandomCrop, RandomScale, VFlip,
+                     augment_dataset, crop_boxes, hflip_labels, load_labels, parse_pipeline, xyxy_to_yolo,
+                     yolo_to_xyxy)
+from augment_flip import flip_yolo_label_line
+from augment_flip import main as flip_main
+
+
+def _dataset(tmp_path, n=3):
+    images, labels = tmp_path / 'images', tmp_path / 'labels'
+    (images / 'sub').mkdir(parents=True)
+    labels.mkdir()
+    for i in range(n):
+        img = np.zeros((120, 200, 3), np.uint8)
+        cv2.rectangle(img, (20 + i, 30), (80 + i, 90), (0, 0, 255), -1)
+        name = f'sub/img{i}' if i else f'img{i}'
+        cv2.imwrite(str(images / f'{name}.png'), img)
+        (labels / name).parent.mkdir(exist_ok=True)
+        (labels / f'{name}.txt').write_text(f'2 {(50 + i) / 200:.6f} 0.5 0.3 0.5\n')
+    return str(images), str(labels)
+
+
+def test_box_transforms_follow_the_pixels():
+    img = np.zeros((100, 200, 3), np.uint8)
+    img[10:30, 20:60] = 255
+    boxes = np.array([[1, 20, 10, 60, 30]], np.float32)
+    rng = np.random.default_rng(0)
+    for t in (HFlip(p=1.0), VFlip(p=1.0), RandomScale(0.5, 0.5)):
+        out, b = t(img, boxes, rng)
+        ys, xs = np.nonzero(out[..., 0] > 127)
+        assert b[0, 1:].tolist() == pytest.approx([xs.min(), ys.min(), xs.max() + 1, ys.max() + 1], abs=1)
+    out, b = ColorJitter()(img, boxes, rng)
+    assert out.shape == img.shape and (b == boxes).all()
+
+
+def test_crop_and_label_conversions():
+    boxes = np.array([[0, 10, 10, 50, 50], [1, 90, 90, 100, 100], [2, 0, 0, 5, 100]], np.float32)
+    cropped = crop_boxes(boxes, 20, 20, 60, 60, min_visibility=0.3)
+    assert cropped.tolist() == [[0, 0, 0, 30, 30]]
+    labels = np.array([[3, 0.25, 0.5, 0.1, 0.2]], np.float32)
+    assert xyxy_to_yolo(yolo_to_xyxy(labels, 200, 100), 200, 100) == pytest.approx(labels)
+    assert hflip_labels(labels)[0, 1] == pytest.approx(0.75)
+    assert flip_yolo_label_line('0 0.25 0.5 0.1 0.2') == '0 0.750000 0.500000 0.100000 0.200000'
+    out, b = RandomCrop(0.5, p=1.0)(np.zeros((100, 200, 3), np.uint8), boxes, np.random.default_rng(1))
+    assert out.base is not None and ((b[:, 1:] >= 0) & (b[:, [3]] <= out.shape[1])).all()
+
+
+def test_parse_pipeline_and_ultralytics_mapping():
+    pipe = parse_pipeline('hflip,scale=0.8:1.3,crop=0.6,color')
+    assert [type(t) for t in pipe.transforms] == [HFlip, RandomScale, RandomCrop, ColorJitter]
+    with pytest.raises(ValueError, match='crop'):
+        pipe.to_ultralytics()  # Ultralytics' translate shifts, it doesn't crop
+    hyp = parse_pipeline('hflip,scale=0.8:1.3,color').to_ultralytics()
+    assert hyp['fliplr'] == 0.5 and hyp['flipud'] == 0.0 and hyp['scale'] == pytest.approx(0.3)
+    assert hyp['translate'] == 0.0 and hyp['hsv_s'] == 0.7
+    with pytest.raises(ValueError):
+        parse_pipeline('rotate')
+
+
+def test_lazy_dataset_is_reproducible_and_streams(tmp_path):
+    images, labels = _dataset(tmp_path)
+    pipe = Compose([HFlip(), RandomScale(0.8, 1.2), ColorJitter()])
+    ds = AugmentedDataset(images, labels, pipe, copies=2, seed=7)
+    assert len(ds) == 6
+    img, lab = ds[3]
+    img2, lab2 = AugmentedDataset(images, labels, pipe, copies=2, seed=7)[3]
+    assert (img == img2).all() and (lab == lab2).all() and lab[0, 0] == 2
+    streamed = list(ds.stream(workers=2, chunksize=2))
+    assert len(streamed) == 6 and (streamed[3][0] == img).all()
+
+
+def test_augment_dataset_writes_shards(tmp_path):
+    images, labels = _dataset(tmp_path)
+    out = tmp_path / 'aug'
+    n = augment_dataset(images, labels, str(out), parse_pipeline('hflip=1'), copies=2, workers=2, shard_size=4)
+    assert n == 6
+    written = sorted(p.name for p in (out / 'labels').rglob('*.txt'))
+    assert len(written) == 6 and sorted(p.name for p in (out / 'labels').iterdir()) == ['shard-0000', 'shard-0001']
+    lab = load_labels(str(out / 'labels' / 'shard-0000' / written[0]))
+    assert lab[0, 1] == pytest.approx(1 - 50 / 200, abs=1e-4)
+
+
+def test_augment_flip_keeps_flat_layout(tmp_path):
+    images, labels = tmp_path / 'images', tmp_path / 'labels'
+    images.mkdir()
+    labels.mkdir()
+    cv2.imwrite(str(images / 'a.jpg'), np.tile(np.arange(8, dtype=np.uint8) * 30, (4, 1, 3)).reshape(4, 8, 3))
+    (labels / 'a.txt').write_text('0 0.25 0.5 0.1 0.2\n')
+    assert flip_main(str(images), str(labels), workers=1) == 1
+    assert (tmp_path / 'images_flip' / 'a_flip.jpg').exists()
+    assert (tmp_path / 'labels_flip' / 'a_flip.txt').read_text() == '0 0.750000 0.500000 0.100000 0.200000'
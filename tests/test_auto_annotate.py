@@ -0,0 +1,39 @@
+import os
+
+import cv2
+import numpy as np
+
+import auto_annotate
+
+
+def test_yolo_lines_keeps_or_forces_classes():
+    dets = np.array([[10, 20, 30, 60, 0.9, 3]], np.float32)
+    assert auto_annotate.yolo_lines(dets, 100, 200) == '0 0.200000 0.200000 0.200000 0.200000'
+    assert auto_annotate.yolo_lines(dets, 100, 200, keep_classes=True).startswith('3 ')
+    assert auto_annotate.yolo_lines(dets[:0], 100, 200) == ''
+
+
+def test_incremental_nested_run(tmp_path, yolo_weights):
+    images, labels = tmp_path / 'images', tmp_path / 'labels'
+    img = np.full((64, 64, 3), 127, np.uint8)
+    for name in ('a.jpg', 'nested/b.bmp', 'nested/deeper/c.webp', 'd.jpeg'):
+        (images / name).parent.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(images / name), img)
+    (images / 'broken.png').write_bytes(b'not an image')
+
+    stats = auto_annotate.main(str(images), str(labels), model_path=yolo_weights, batch_size=2)
+    assert (stats['annotated'], stats['skipped'], stats['unreadable']) == (4, 0, 1)
+    assert (labels / 'nested' / 'deeper' / 'c.txt').exists() and (labels / 'd.txt').exists()
+    assert not [p for p in os.listdir(labels) if p.endswith('.tmp')]
+
+    stats = auto_annotate.main(str(images), str(labels), model_path=yolo_weights)
+    assert (stats['annotated'], stats['skipped']) == (0, 4)
+
+    later = os.path.getmtime(labels / 'a.txt') + 10
+    os.utime(images / 'a.jpg', (later, later))
+    stats = auto_annotate.main(str(images), str(labels), model_path=yolo_weights)
+    assert (stats['annotated'], stats['skipped']) == (1, 3)
+
+    # other settings (here: class ids) make every label stale
+    stats = auto_annotate.main(str(images), str(labels), model_path=yolo_weights, keep_classes=True)
+    assert stats['annotated'] == 4
@@ -0,0 +1,85 @@
+import asyncio
+
+from src.batching import BatchScheduler, QueueFullError
+
+
+def test_concurrent_requests_are_batched():
+    calls = []
+
+    def predict(images, confs, model):
+        calls.append(list(images))
+        return [img * 10 for img in images]
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=4, max_wait_ms=50)
+        results = await asyncio.gather(*(scheduler.submit(i) for i in range(6)))
+        await scheduler.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert results == [i * 10 for i in range(6)]
+    assert [len(c) for c in calls] == [4, 2]
+
+
+def test_predict_errors_reach_every_caller():
+    def predict(images, confs, model):
+        raise RuntimeError('boom')
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=2, max_wait_ms=5)
+        results = await asyncio.gather(scheduler.submit(1), scheduler.submit(2), return_exceptions=True)
+        await scheduler.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_queue_full_rejects():
+    async def run():
+        scheduler = BatchScheduler(lambda images, confs, model: images, max_batch_size=1, max_queue=1)
+        # the second submit arrives before the batching task has drained the first
+        results = await asyncio.gather(scheduler.submit(1), scheduler.submit(2), return_exceptions=True)
+        await scheduler.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert results[0] == 1
+    assert isinstance(results[1], QueueFullError)
+
+
+def test_models_are_never_mixed_in_a_batch():
+    calls = []
+
+    def predict(images, confs, model):
+        calls.append((model, list(images)))
+        return [f'{model}:{img}' for img in images]
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=8, max_wait_ms=20)
+        results = await asyncio.gather(*(scheduler.submit(i, model='ab'[i % 2]) for i in range(4)))
+        await scheduler.stop()
+        return results
+
+    assert asyncio.run(run()) == ['a:0', 'b:1', 'a:2', 'b:3']
+    assert sorted(calls) == [('a', [0, 2]), ('b', [1, 3])]
+
+
+def test_batches_overlap_up_to_max_concurrent():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    # each call waits for a second one, which only arrives if two batches run at once
+    barrier = threading.Barrier(2, timeout=5)
+
+    def predict(images, confs, model):
+        barrier.wait()
+        return images
+
+    async def run():
+        with ThreadPoolExecutor(2) as pool:
+            scheduler = BatchScheduler(predict, max_batch_size=1, max_wait_ms=1, executor=pool, max_concurrent=2)
+            results = await asyncio.gather(scheduler.submit(1), scheduler.submit(2))
+            await scheduler.stop()
+        return results
+
+    assert asyncio.run(run()) == [1, 2]
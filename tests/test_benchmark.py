@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from benchmark import compare, make_dataset, summarise  # noqa: E402
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {'api': {'images_per_sec': 100.0, 'p95_ms': 50.0, 'peak_rss_mb': 500.0}}
+    ok = {'api': {'images_per_sec': 90.0, 'p95_ms': 55.0, 'peak_rss_mb': 510.0, 'p99_ms': None}}
+    assert compare(ok, baseline, 0.15) == []
+    bad = {'api': {'images_per_sec': 80.0, 'p95_ms': 60.0, 'peak_rss_mb': 500.0}, 'new': {'images_per_sec': 1.0}}
+    problems = compare(bad, baseline, 0.15)
+    assert len(problems) == 2
+    assert problems[0].startswith('api.images_per_sec')
+    assert problems[1].startswith('api.p95_ms')
+
+
+def test_make_dataset_is_reproducible(tmp_path):
+    images, labels, template = make_dataset(str(tmp_path), (160, 120), 2, seed=3)
+    assert sorted(os.listdir(images)) == ['sample1.jpg', 'sample2.jpg']
+    assert os.path.exists(template)
+    with open(os.path.join(labels, 'sample1.txt')) as f:
+        rows = [line.split() for line in f]
+    assert rows and all(r[0] == '0' and len(r) == 5 for r in rows)
+    assert all(0.0 <= float(v) <= 1.0 for r in rows for v in r[1:])
+    assert summarise(4, 2.0, [1.0, 2.0, 3.0, 4.0])['images_per_sec'] == 2.0
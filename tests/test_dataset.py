@@ -0,0 +1,73 @@
+import os
+
+import cv2
+import numpy as np
+import yaml
+
+import dataset
+
+
+def test_check_label_reports_each_problem():
+    assert dataset.check_label('0 0.5 0.5 0.2 0.2\n\n0 0.1 0.1 0.2 0.2\n', nc=1) == (2, [])
+    boxes, problems = dataset.check_label('2 0.5 0.5 0.2 0.2\n0 0.5 0.5\n0 1.5 0.5 0.2 0.2\n0 0.5 0.5 0 0.1\n'
+                                          '0 a 0.5 0.1 0.1\n0 0.5 0.5 0.1 0.1\n0 0.5 0.5 0.1 0.1\n', nc=2)
+    assert boxes == 5
+    assert [p.split(': ')[1].split(' ')[0] for p in problems] == ['class', 'expected', 'box', 'empty', 'not',
+                                                                  'duplicate']
+    assert problems[0] == 'line 1: class 2 outside 0..1'
+
+
+def test_labels_dir_for_follows_ultralytics():
+    assert dataset.labels_dir_for('/d/images/train') == '/d/labels/train'
+    assert dataset.labels_dir_for('/images/x/images') == '/images/x/labels'
+
+
+def _write(root):
+    rng = np.random.default_rng(0)
+    for split, names in (('train', ['a', 'b', 'nested/c']), ('val', ['v'])):
+        for name in names:
+            img = root / 'images' / split / f'{name}.jpg'
+            img.parent.mkdir(parents=True, exist_ok=True)
+            cv2.imwrite(str(img), rng.integers(0, 255, (32, 48, 3), dtype=np.uint8))
+            label = root / 'labels' / split / f'{name}.txt'
+            label.parent.mkdir(parents=True, exist_ok=True)
+            label.write_text('0 0.5 0.5 0.2 0.2\n')
+
+
+def test_init_writes_relative_yaml(tmp_path):
+    _write(tmp_path)
+    out = dataset.write_data_yaml(str(tmp_path), ['defect'])
+    cfg = yaml.safe_load(open(out))
+    assert (cfg['train'], cfg['val'], cfg['names']) == ('images/train', 'images/val', ['defect'])
+    assert 'path' not in cfg and 'test' not in cfg
+    root, splits, names = dataset.read_data_yaml(out)
+    assert splits['val'] == [str(tmp_path / 'images' / 'val')] and names == ['defect']
+
+
+def test_scan_finds_problems_and_rechecks_only_changes(tmp_path):
+    _write(tmp_path)
+    data = dataset.write_data_yaml(str(tmp_path), ['object'])
+    report = dataset.scan(data, workers=2)
+    assert (report['images'], report['boxes'], report['rechecked'], report['errors']) == (4, 4, 4, [])
+
+    (tmp_path / 'images' / 'train' / 'nested' / 'c.jpg').write_bytes(b'broken')
+    (tmp_path / 'labels' / 'train' / 'a.txt').write_text('1 0.5 0.5 0.2 0.2\n')
+    (tmp_path / 'labels' / 'train' / 'gone.txt').write_text('0 0.5 0.5 0.2 0.2\n')
+    os.remove(tmp_path / 'labels' / 'val' / 'v.txt')
+    (tmp_path / 'images' / 'train' / 'b_copy.jpg').write_bytes((tmp_path / 'images' / 'train' / 'b.jpg').read_bytes())
+    (tmp_path / 'images' / 'val' / 'a_copy.jpg').write_bytes((tmp_path / 'images' / 'train' / 'a.jpg').read_bytes())
+
+    report = dataset.scan(data, workers=2)
+    assert report['rechecked'] == 5  # c, a (label), v (label), and the two copies
+    errors = '\n'.join(report['errors'])
+    assert 'images/train/nested/c.jpg: cannot decode image' in errors
+    assert 'labels/train/a.txt: line 1: class 1 outside 0..0' in errors
+    assert 'labels/train/gone.txt: orphan label' in errors
+    assert 'identical images in different splits: images/train/a.jpg, images/val/a_copy.jpg' in errors
+    warnings = '\n'.join(report['warnings'])
+    assert 'images/val/v.jpg: no label file' in warnings
+    assert 'duplicate images: images/train/b.jpg, images/train/b_copy.jpg' in warnings
+
+    assert dataset.scan(data)['rechecked'] == 0
+    assert dataset.scan(data, rehash=True)['rechecked'] == 6
+    assert dataset.main(['check', '--data', data]) == 1
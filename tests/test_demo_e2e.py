@@ -54,10 +54,10 @@ def test_demo_e2e():
             page.set_input_files('#file', 'data/sample1.jpg')
             page.click('#run')
 
-            # wait for annotated image to appear
-            page.wait_for_selector('#imgOut img', timeout=20000)
-            img = page.query_selector('#imgOut img')
-            assert img is not None
+            # detect mode draws the returned boxes client-side on a canvas
+            page.wait_for_selector('#imgOut canvas', timeout=20000)
+            size = page.eval_on_selector('#imgOut canvas', 'c => [c.width, c.height]')
+            assert size[0] > 0 and size[1] > 0
 
             browser.close()
 
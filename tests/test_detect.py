@@ -0,0 +1,56 @@
+import json
+
+import os
+
+import pytest
+
+from detect import _annotated_name, _fingerprint, _source_root, run_bulk
+from sources import batched, iter_frames, list_sources
+
+
+def test_list_sources(tmp_path):
+    listing = tmp_path / 'images.txt'
+    listing.write_text('# nightly backlog\n/data/b.jpg\na.jpg\n')
+    assert list_sources(str(listing)) == ['/data/b.jpg', str(tmp_path / 'a.jpg')]
+    assert list_sources('data/samples/*.jpg') == ['data/samples/sample1.jpg', 'data/samples/sample2.jpg',
+                                                  'data/samples/sample3.jpg']
+
+
+def test_iter_frames_keeps_order_and_skips():
+    paths = list_sources('data/samples')
+    ids = [sid for sid, img in iter_frames(paths, workers=3, prefetch=2, skip=1)]
+    assert ids == paths[1:]
+    assert [len(b) for b in batched(range(5), 2)] == [2, 2, 1]
+
+
+def test_bulk_resume_matches_clean_run(tmp_path, yolo_weights):
+    clean = tmp_path / 'clean.jsonl'
+    run_bulk('data/samples', str(clean), model=yolo_weights, conf=0.0, batch_size=1)
+    lines = clean.read_text().splitlines()
+    assert [json.loads(line)['source'] for line in lines] == list_sources('data/samples')
+
+    # simulate a crash after the first item: checkpoint says 1 done, file has a partial extra line
+    out = tmp_path / 'resumed.jsonl'
+    out.write_text(lines[0] + '\n{"source": "half-writ')
+    ckpt = {'source': 'data/samples', 'fingerprint': _fingerprint(list_sources('data/samples'), 1), 'done': 1,
+            'offset': len(lines[0]) + 1}
+    (tmp_path / 'resumed.jsonl.ckpt').write_text(json.dumps(ckpt))
+    stats = run_bulk('data/samples', str(out), model=yolo_weights, conf=0.0, batch_size=2, resume=True)
+    assert stats['processed'] == len(lines) - 1
+    assert out.read_text().splitlines() == lines
+
+    # a file added or removed since the checkpoint would shift the items it skips
+    ckpt['fingerprint'] = _fingerprint(list_sources('data/samples')[1:], 1)
+    (tmp_path / 'resumed.jsonl.ckpt').write_text(json.dumps(ckpt))
+    with pytest.raises(ValueError, match='changed'):
+        run_bulk('data/samples', str(out), model=yolo_weights, conf=0.0, resume=True)
+
+
+def test_annotated_names_keep_sub_folders():
+    root = _source_root('data', ['data/a/x.jpg', 'data/b/x.jpg'])
+    assert _annotated_name('data/a/x.jpg', root) == os.path.join('a', 'x.jpg')
+    assert _annotated_name('data/b/x.jpg', root) == os.path.join('b', 'x.jpg')
+    assert _annotated_name('data/clip.mp4#12', root) == 'clip_000012.jpg'
+    # globs and lists: names are relative to the folder the inputs share
+    assert _annotated_name('/in/a/x.jpg', _source_root('/in/*/*.jpg', ['/in/a/x.jpg', '/in/b/x.jpg'])) == \
+        os.path.join('a', 'x.jpg')
@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.engine import letterbox, load_engine
+
+
+def _iou(a, b):
+    x1, y1 = np.maximum(a[:2], b[:, :2]).T
+    x2, y2 = np.minimum(a[2:4], b[:, 2:4]).T
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = lambda r: (r[..., 2] - r[..., 0]) * (r[..., 3] - r[..., 1])  # noqa: E731
+    return inter / (area(a) + area(b) - inter)
+
+
+def test_letterbox_pads_to_stride():
+    img = np.zeros((720, 1280, 3), dtype=np.uint8)
+    out, r, (left, top) = letterbox(img, 640)
+    assert out.shape == (384, 640, 3)
+    assert r == 0.5 and left == 0 and top == 12
+
+
+@pytest.fixture(scope='module')
+def onnx_weights(yolo_weights):
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from src.engine import export_onnx
+    return export_onnx(yolo_weights)
+
+
+def test_torch_and_onnx_backends_agree(yolo_weights, onnx_weights):
+    # randomly initialised weights are enough to compare the two backends
+    torch_engine = load_engine(yolo_weights, 'torch')
+    onnx_engine = load_engine(onnx_weights, 'auto')
+    assert onnx_engine.backend == 'onnx'
+
+    images = [cv2.imread('data/sample1.jpg'), cv2.imread('data/samples/sample2.jpg')]
+    for a, b in zip(torch_engine.predict(images, conf=0.0), onnx_engine.predict(images, conf=0.0)):
+        assert len(a) and len(b)
+        for row in a[:20]:
+            best = _iou(row, b).argmax()
+            assert _iou(row, b)[best] > 0.99
+            assert abs(row[4] - b[best, 4]) < 1e-4
+            assert row[5] == b[best, 5]
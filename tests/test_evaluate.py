@@ -0,0 +1,46 @@
+import numpy as np
+
+from evaluate import box_iou, evaluate_detections, match_predictions, read_yolo_labels
+
+
+def test_box_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [5, 5, 15, 15]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [20, 20, 30, 30]], dtype=np.float32)
+    iou = box_iou(a, b)
+    assert iou.shape == (2, 2)
+    np.testing.assert_allclose(iou, [[1.0, 0.0], [25 / 175, 0.0]])
+
+
+def test_matching_follows_confidence_not_list_order():
+    gt = np.array([[0, 0, 0, 10, 10]], dtype=np.float32)
+    dets = np.array([[0, 0, 10, 9, 0.3, 0],     # listed first, lower confidence
+                     [0, 0, 10, 8, 0.9, 0]], dtype=np.float32)
+    tp = match_predictions(dets, gt, np.array([0.5, 0.85]))
+    # at 0.5 the confident box claims the ground truth; at 0.85 only the other one overlaps enough
+    assert tp.tolist() == [[False, True], [True, False]]
+
+
+def test_class_aware_matching():
+    gt = np.array([[1, 0, 0, 10, 10]], dtype=np.float32)
+    dets = np.array([[0, 0, 10, 10, 0.9, 0]], dtype=np.float32)
+    assert match_predictions(dets, gt, np.array([0.5]), agnostic=True).all()
+    assert not match_predictions(dets, gt, np.array([0.5]), agnostic=False).any()
+
+
+def test_perfect_and_missing_predictions():
+    gt = np.array([[0, 0, 0, 10, 10], [0, 20, 20, 40, 40]], dtype=np.float32)
+    perfect = np.array([[0, 0, 10, 10, 0.9, 0], [20, 20, 40, 40, 0.8, 0]], dtype=np.float32)
+    m = evaluate_detections([(perfect, gt)])
+    assert m['precision'] == m['recall'] == m['f1'] == 1.0
+    assert m['map50'] > 0.99 and m['map50_95'] > 0.99
+
+    m = evaluate_detections([(perfect[:1], gt), (np.zeros((0, 6), np.float32), gt[:1])])
+    assert (m['tp'], m['fp'], m['fn']) == (1, 0, 2)
+    assert m['map50'] < 0.7
+
+
+def test_read_yolo_labels(tmp_path):
+    label = tmp_path / 'a.txt'
+    label.write_text('0 0.5 0.5 0.5 0.5\n\n')
+    np.testing.assert_allclose(read_yolo_labels(str(label), 100, 200), [[0, 25, 50, 75, 150]])
+    assert read_yolo_labels(str(tmp_path / 'missing.txt'), 1, 1).shape == (0, 5)
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+
+from feature_index import FeatureIndex, build_index
+
+
+def _pattern(seed):
+    rng = np.random.default_rng(seed)
+    img = np.full((160, 200), 255, np.uint8)
+    for _ in range(40):
+        x, y = rng.integers(0, 180), rng.integers(0, 140)
+        cv2.rectangle(img, (int(x), int(y)), (int(x + rng.integers(5, 30)), int(y + rng.integers(5, 30))),
+                      int(rng.integers(0, 200)), -1)
+    return img
+
+
+def test_saved_index_locates_the_right_template(tmp_path):
+    templates = {f'part{i}': _pattern(i) for i in range(4)}
+    build_index(templates, str(tmp_path))
+    index = FeatureIndex.load(str(tmp_path))
+    assert isinstance(index.descriptors, np.memmap)
+    assert index.names == list(templates)
+
+    scene = np.full((480, 640), 128, np.uint8)
+    scene[200:360, 300:500] = templates['part2']
+    found = index.match(cv2.cvtColor(scene, cv2.COLOR_GRAY2BGR))
+    assert found and found[0]['template'] == 'part2'
+    np.testing.assert_allclose(found[0]['xyxy'], [300, 200, 500, 360], atol=3)
+
+
+def test_orb_demo_draws_only_the_given_template(tmp_path, capsys):
+    from pattern_matching import orb_match_demo
+    templates = {f'part{i}': _pattern(i) for i in range(4)}
+    index = build_index(templates)
+    scene = np.full((480, 640), 128, np.uint8)
+    scene[200:360, 300:500] = templates['part2']
+    cv2.imwrite(str(tmp_path / 'scene.png'), scene)
+    for name in ('part0', 'part2'):
+        cv2.imwrite(str(tmp_path / f'{name}.png'), templates[name])
+
+    # part2 is the best match in the scene, but it isn't the template being drawn
+    orb_match_demo(str(tmp_path / 'scene.png'), str(tmp_path / 'part0.png'), str(tmp_path / 'p0.jpg'), index=index)
+    assert not (tmp_path / 'p0.jpg').exists()
+    orb_match_demo(str(tmp_path / 'scene.png'), str(tmp_path / 'part2.png'), str(tmp_path / 'p2.jpg'), index=index)
+    assert (tmp_path / 'p2.jpg').exists() and 'inliers=' in capsys.readouterr().out
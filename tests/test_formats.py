@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+import formats
+
+BOXES = np.array([[1.5, 2, 30, 40, 0.9, 3], [5, 6, 7, 8, 0.25, 0]], dtype=np.float32)
+
+
+@pytest.mark.parametrize('fmt', ['json', 'multipart', 'boxes', 'msgpack'])
+def test_round_trip(fmt):
+    if fmt == 'msgpack':
+        pytest.importorskip('msgpack')
+    image = None if fmt == 'boxes' else b'\xff\xd8\xff fake jpeg \r\n--'
+    body, content_type = formats.encode(fmt, BOXES, image)
+    boxes, img = formats.decode(content_type, body)
+    np.testing.assert_allclose(boxes, BOXES, atol=0.01)
+    assert img == image
+
+
+def test_negotiate():
+    assert formats.negotiate(None) == 'json'
+    assert formats.negotiate('*/*') == 'json'
+    assert formats.negotiate('application/json;q=0.5, application/vnd.patterndetect.boxes') == 'boxes'
+    assert formats.negotiate('application/msgpack;q=0.2, multipart/mixed;q=0.9') == 'multipart'
+    assert formats.negotiate('application/msgpack', fmt='boxes') == 'boxes'
+    with pytest.raises(ValueError):
+        formats.negotiate(None, fmt='xml')
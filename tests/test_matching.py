@@ -0,0 +1,31 @@
+import cv2
+import numpy as np
+
+from matching import TemplateMatcher, scale_range
+
+
+def _scene():
+    rng = np.random.default_rng(0)
+    tpl_a = cv2.GaussianBlur(rng.integers(0, 255, (48, 64), dtype=np.uint8), (5, 5), 0)
+    tpl_b = cv2.GaussianBlur(rng.integers(0, 255, (40, 40), dtype=np.uint8), (5, 5), 0)
+    img = cv2.GaussianBlur(rng.integers(0, 255, (480, 640), dtype=np.uint8), (9, 9), 0)
+    img[100:148, 50:114] = tpl_a
+    img[300:348, 400:464] = tpl_a
+    img[200:260, 250:310] = cv2.resize(tpl_b, (60, 60))  # tpl_b at 1.5x
+    return img, {'a': tpl_a, 'b': tpl_b}
+
+
+def test_finds_every_instance_over_scales():
+    img, templates = _scene()
+    matcher = TemplateMatcher(templates, scales=scale_range(1.0, 1.5, 3), threshold=0.8)
+    matches = matcher.match(cv2.cvtColor(img, cv2.COLOR_GRAY2BGR))
+    found = sorted((matcher.names[int(m[5])], int(m[0]), int(m[1]), int(m[2] - m[0])) for m in matches)
+    assert found == [('a', 50, 100, 64), ('a', 400, 300, 64), ('b', 250, 200, 60)]
+    assert (matches[:, 4] > 0.9).all()
+
+
+def test_pyramid_search_agrees_with_full_search():
+    img, templates = _scene()
+    coarse = TemplateMatcher(templates, threshold=0.8, max_levels=3).match(img)
+    full = TemplateMatcher(templates, threshold=0.8, max_levels=0).match(img)
+    np.testing.assert_allclose(coarse[np.lexsort(coarse.T[:2])], full[np.lexsort(full.T[:2])], atol=1e-3)
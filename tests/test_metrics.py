@@ -0,0 +1,29 @@
+from metrics import MetricsRegistry, server_timing, stage, start_timing
+
+
+def test_render_exposition_format():
+    reg = MetricsRegistry()
+    c = reg.counter('jobs_total', 'Jobs', ['status'])
+    h = reg.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    reg.gauge('depth', 'Queue depth', fn=lambda: 3)
+    c.inc(status='ok')
+    c.inc(2, status='ok')
+    h.observe(0.05)
+    h.observe(0.5)
+    text = reg.render()
+    assert 'jobs_total{status="ok"} 3.0' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert 'latency_seconds_count 2' in text
+    assert 'depth 3.0' in text
+    assert '# TYPE latency_seconds histogram' in text
+
+
+def test_stage_records_request_timings():
+    reg = MetricsRegistry()
+    h = reg.histogram('stage_seconds', 'Stages', ['stage'])
+    timings = start_timing()
+    with stage(h, 'decode'):
+        pass
+    assert h.count(stage='decode') == 1
+    assert server_timing(timings).startswith('decode;dur=')
@@ -0,0 +1,82 @@
+import os
+
+import cv2
+import numpy as np
+import yaml
+
+import auto_annotate
+import evaluate
+import packed
+
+
+def _dataset(root, count=5):
+    images, labels = root / 'images', root / 'labels'
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        name = f'nested/img{i}.png' if i % 2 else f'img{i}.jpg'
+        (images / name).parent.mkdir(parents=True, exist_ok=True)
+        (labels / name).parent.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(images / name), rng.integers(0, 255, (40 + i, 60, 3), dtype=np.uint8))
+        if i != 3:  # one image without a label file
+            rows = [f'0 0.5 0.5 0.{k + 1} 0.2' for k in range(i % 3)]
+            (labels / (os.path.splitext(name)[0] + '.txt')).write_text('\n'.join(rows))
+    (images / 'broken.jpg').write_bytes(b'not an image')
+    return images, labels
+
+
+def test_pack_roundtrip_and_random_access(tmp_path):
+    images, labels = _dataset(tmp_path)
+    out = tmp_path / 'set.pack'
+    # tiny shards: every image starts a new one
+    assert packed.pack(str(images), str(labels), str(out), shard_bytes=1, workers=2) == 5
+    assert packed.is_pack(str(out)) and not packed.is_pack(str(images))
+
+    ds = packed.PackedDataset(str(out))
+    assert len(ds) == 5 and len(ds.meta['shards']) == 5
+    i = ds.relpaths.index('nested/img1.png')
+    assert ds.shape(i) == (41, 60)
+    assert ds.image_bytes(i).tobytes() == (images / 'nested' / 'img1.png').read_bytes()
+    assert np.array_equal(ds.image(i), cv2.imread(str(images / 'nested' / 'img1.png')))
+    assert ds.labels(i).shape == (1, 5)
+    assert not ds.index[ds.relpaths.index('nested/img3.png')]['labeled']
+    assert ds.position(ds.paths[i]) == i
+
+    back = tmp_path / 'back'
+    assert packed.unpack(str(out), str(back / 'images'), str(back / 'labels')) == 5
+    assert (back / 'images' / 'nested' / 'img1.png').read_bytes() == (images / 'nested' / 'img1.png').read_bytes()
+    assert (back / 'labels' / 'img2.txt').read_text().count('\n') == 1
+    assert not (back / 'labels' / 'nested' / 'img3.txt').exists()
+
+
+def test_evaluate_and_auto_annotate_read_packs(tmp_path, yolo_weights):
+    images, labels = _dataset(tmp_path)
+    out = tmp_path / 'set.pack'
+    packed.pack(str(images), str(labels), str(out))
+
+    from_pack = evaluate.evaluate(yolo_weights, str(out), None, str(tmp_path / 'eval.csv'), cache_dir=None)
+    assert from_pack['fn'] == 4  # ground truth from the pack; random weights miss every box
+
+    stats = auto_annotate.main(str(out), str(tmp_path / 'auto'), model_path=yolo_weights, batch_size=2)
+    assert stats['annotated'] == 5 and (tmp_path / 'auto' / 'nested' / 'img1.txt').exists()
+    assert auto_annotate.main(str(out), str(tmp_path / 'auto'), model_path=yolo_weights)['skipped'] == 5
+
+
+def test_stage_data_yaml_unpacks_packed_splits_once(tmp_path):
+    images, labels = _dataset(tmp_path)
+    packed.pack(str(images), str(labels), str(tmp_path / 'train.pack'))
+    data = tmp_path / 'data.yaml'
+    data.write_text(yaml.safe_dump({'train': 'train.pack', 'val': 'images', 'nc': 1, 'names': ['object']}))
+
+    staged = packed.stage_data_yaml(str(data), str(tmp_path / 'stage'))
+    cfg = yaml.safe_load(open(staged))
+    assert cfg['train'] == str(tmp_path / 'stage' / 'train' / 'images') and cfg['val'] == 'images'
+    assert (tmp_path / 'stage' / 'train' / 'labels' / 'nested' / 'img1.txt').exists()
+
+    stamp = tmp_path / 'stage' / 'train' / '.pack_stamp'
+    mtime = os.path.getmtime(stamp)
+    packed.stage_data_yaml(str(data), str(tmp_path / 'stage'))
+    assert os.path.getmtime(stamp) == mtime
+
+    plain = tmp_path / 'plain.yaml'
+    plain.write_text(yaml.safe_dump({'train': 'images', 'val': 'images'}))
+    assert packed.stage_data_yaml(str(plain), str(tmp_path / 'stage')) == str(plain)
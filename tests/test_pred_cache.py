@@ -0,0 +1,30 @@
+import numpy as np
+
+from pred_cache import PredictionCache, content_hash
+
+
+def test_round_trip_through_shards(tmp_path):
+    dets = np.array([[1, 2, 3, 4, 0.5, 7], [5, 6, 7, 8, 0.01, 0]], dtype=np.float32)
+    cache = PredictionCache(str(tmp_path), 'a' * 64, {'conf': 0.001}, flush_every=2)
+    cache.put(content_hash(b'one'), (480, 640, 3), dets)
+    cache.put(content_hash(b'two'), (10, 20, 3), dets[:0])  # triggers a flush
+    cache.put(content_hash(b'three'), (1, 1, 3), dets[:1])
+    cache.flush()
+
+    reopened = PredictionCache(str(tmp_path), 'a' * 64, {'conf': 0.001})
+    assert len(reopened) == 3
+    shape, cached = reopened.get(content_hash(b'one'))
+    assert shape == (480, 640)
+    np.testing.assert_array_equal(cached, dets)
+    assert reopened.get(content_hash(b'two'))[1].shape == (0, 6)
+    assert reopened.get(content_hash(b'missing')) is None
+    assert (reopened.hits, reopened.misses) == (2, 1)
+
+
+def test_other_weights_or_params_miss(tmp_path):
+    cache = PredictionCache(str(tmp_path), 'a' * 64, {'conf': 0.001})
+    cache.put('h', (1, 1), np.zeros((0, 6)))
+    cache.flush()
+    assert PredictionCache(str(tmp_path), 'a' * 64, {'conf': 0.001}).get('h') is not None
+    assert PredictionCache(str(tmp_path), 'b' * 64, {'conf': 0.001}).get('h') is None
+    assert PredictionCache(str(tmp_path), 'a' * 64, {'conf': 0.01}).get('h') is None
@@ -0,0 +1,50 @@
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.registry import ModelRegistry
+
+
+def test_engines_are_cached_by_content(tmp_path, yolo_weights):
+    weights = tmp_path / 'best.pt'
+    shutil.copy(yolo_weights, weights)
+    reg = ModelRegistry(warmup=False)
+
+    first = reg.register('default', str(weights))
+    assert reg.get() is reg.get('default')
+    assert reg.load(reg.make_spec('other', str(weights))) is reg.get()
+
+    # new contents under the same path are a new version
+    weights.write_bytes(weights.read_bytes() + b'\0')
+    second = reg.register('default', str(weights))
+    assert second.sha256 != first.sha256
+    assert reg.get() is not reg.load(first)
+
+
+def test_unknown_model_name():
+    with pytest.raises(KeyError):
+        ModelRegistry().spec('nope')
+
+
+def test_api_hot_swap(tmp_path, yolo_weights, monkeypatch):
+    from src import api
+    from src.registry import DEFAULT_NAME
+
+    monkeypatch.setattr(api, 'registry', ModelRegistry())
+    monkeypatch.setattr(api, 'MODEL_ROOT', str(tmp_path))
+    api.registry.register(DEFAULT_NAME, yolo_weights)
+    new_weights = tmp_path / 'best.pt'
+    new_weights.write_bytes(open(yolo_weights, 'rb').read() + b'\0')
+
+    with TestClient(api.app) as client:
+        r = client.post(f'/models/{DEFAULT_NAME}', json={'weights': str(new_weights)})
+        assert r.status_code == 200
+        version = r.json()['version']
+        with open('data/sample1.jpg', 'rb') as f:
+            r = client.post('/detect', files={'file': ('sample1.jpg', f, 'image/jpeg')}, params={'annotated': 'false'})
+        assert r.status_code == 200
+        assert r.headers['x-model-version'] == f'{DEFAULT_NAME}@{version}'
+
+        assert client.post('/models/x', json={'weights': '/etc/passwd'}).status_code == 400
+        assert client.post('/detect', files={'file': ('a.jpg', b'x', 'image/jpeg')}, params={'model': 'x'}).status_code == 404
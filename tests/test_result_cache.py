@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import numpy as np
+
+from result_cache import MemoryBackend, ResultCache, SQLiteBackend
+
+
+def test_memory_lru_limits_and_ttl():
+    lru = MemoryBackend(max_entries=2, max_bytes=100)
+    lru.set('a', b'x' * 10, ttl=60)
+    lru.set('b', b'x' * 10, ttl=60)
+    lru.get('a')
+    lru.set('c', b'x' * 10, ttl=60)  # evicts b, the least recently used
+    assert lru.get('b') is None and lru.get('a') is not None
+    lru.set('big', b'x' * 95, ttl=60)  # over the byte budget together with the rest
+    assert len(lru) == 1 and lru.bytes == 95
+    lru.set('old', b'x', ttl=-1)
+    assert lru.get('old') is None
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    cache = ResultCache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return np.ones(3)
+
+    async def main():
+        results = await asyncio.gather(*[cache.get_or_compute('k', compute) for _ in range(5)])
+        results.append(await cache.get_or_compute('k', compute))
+        return results
+
+    results = asyncio.run(main())
+    assert calls == 1 and all((r == 1).all() for r in results)
+    assert cache.stats['misses'] == 1 and cache.stats['coalesced'] == 4 and cache.stats['hits'] == 1
+
+
+def test_errors_are_not_cached():
+    cache = ResultCache()
+
+    async def fail():
+        raise ValueError('bad image')
+
+    async def main():
+        for _ in range(2):
+            try:
+                await cache.get_or_compute('k', fail)
+            except ValueError:
+                pass
+    asyncio.run(main())
+    assert cache.stats['misses'] == 2
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    writer, reader = SQLiteBackend(path), SQLiteBackend(path)
+    writer.set(('h', 0.25), (np.array([480, 640]), np.zeros((2, 6), np.float32)), ttl=60)
+    writer.set('img', b'jpeg', ttl=60)
+    shape, dets = reader.get(('h', 0.25))
+    assert shape.tolist() == [480, 640] and dets.shape == (2, 6)
+    assert reader.get('img') == b'jpeg'
+    writer.set('gone', b'x', ttl=-1)
+    assert reader.get('gone') is None
+
+    small = SQLiteBackend(str(tmp_path / 'small.sqlite'), max_entries=3)
+    for i in range(5):
+        small.set(i, b'x', ttl=60)
+        time.sleep(0.001)
+    assert len(small) <= 3 and small.get(4) == b'x'
@@ -0,0 +1,75 @@
+import json
+import shutil
+
+import httpx
+import pytest
+
+import runs
+from api_client import PatternDetectClient
+
+HEADER = 'epoch,time,metrics/precision(B),metrics/recall(B),metrics/mAP50(B),metrics/mAP50-95(B)\n'
+
+
+def _run(root, name, imgsz, rows, weights=None):
+    run_dir = root / name
+    run_dir.mkdir(parents=True)
+    (run_dir / 'args.yaml').write_text(f'model: yolov8n.pt\ndata: data.yaml\nepochs: 2\nimgsz: {imgsz}\n')
+    (run_dir / 'results.csv').write_text(HEADER + ''.join(f'{i + 1},{i + 1.5},{r}\n' for i, r in enumerate(rows)))
+    if weights:
+        (run_dir / 'weights').mkdir()
+        shutil.copyfile(weights, run_dir / 'weights' / 'best.pt')
+    return run_dir
+
+
+def test_scan_is_incremental_and_ranks_runs(tmp_path):
+    root = tmp_path / 'runs'
+    _run(root, 'detect/train', 640, ['0.5,0.5,0.5,0.3', '0.6,0.6,0.7,0.4'])
+    b = _run(root, 'detect/train2', 320, ['0.2,0.2,0.2,0.1'])
+    (root / 'sweep' / 'trial-000').mkdir(parents=True)
+    (root / 'sweep' / 'trial-000' / 'args.yaml').write_text('imgsz: 64\n')
+
+    with runs.RunIndex(str(tmp_path / 'index.sqlite'), str(root)) as index:
+        assert index.scan() == {'runs': 3, 'updated': 3, 'removed': 0, 'benchmarked': 0}
+        assert index.scan()['updated'] == 0
+        (b / 'results.csv').write_text(HEADER + '1,1.0,0.9,0.9,0.9,0.8\n')
+        assert index.scan()['updated'] == 1
+
+        ranked = index.list()
+        assert [r['run'] for r in ranked] == ['detect/train2', 'detect/train', 'sweep/trial-000']
+        assert ranked[1]['best_epoch'] == 2 and ranked[1]['map50_95'] == 0.4
+        assert len(index.epochs('train')) == 2
+        assert index.compare(['train', 'train2'])['differences'] == {'imgsz': [640, 320]}
+        with pytest.raises(KeyError):
+            index.get('nope')
+        with pytest.raises(LookupError):
+            index.best()  # no run has weights
+
+        shutil.rmtree(b)
+        assert index.scan()['removed'] == 1
+
+
+def test_bench_and_promote(tmp_path, yolo_weights):
+    root = tmp_path / 'runs'
+    _run(root, 'detect/good', 64, ['0.6,0.6,0.7,0.5'], yolo_weights)
+    _run(root, 'detect/bad', 64, ['0.1,0.1,0.1,0.1'], yolo_weights)
+    index = runs.RunIndex(str(tmp_path / 'index.sqlite'), str(root))
+    index.scan()
+    assert index.bench(['good'], iterations=2) == 1
+    assert index.bench(iterations=2) == 0  # same weights hash: already measured on this host
+    assert index.get('bad')['ms_per_image'] > 0
+
+    requests = []
+
+    def handler(request):
+        requests.append((request.url.path, json.loads(request.content)))
+        return httpx.Response(200, json={'name': 'default', 'version': 'abc'})
+    client = PatternDetectClient('http://api')
+    client.client = httpx.Client(transport=httpx.MockTransport(handler))
+
+    target = tmp_path / 'models' / 'promoted.pt'
+    result = index.promote(target=str(target), client=client)
+    assert result['run'] == 'detect/good' and result['api']['version'] == 'abc'
+    assert target.read_bytes() == (root / 'detect' / 'good' / 'weights' / 'best.pt').read_bytes()
+    assert requests == [('/models/default', {'weights': str(target), 'backend': 'auto'})]
+    assert index.promotions()[0]['run'] == 'detect/good'
+    index.close()
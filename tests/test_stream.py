@@ -0,0 +1,61 @@
+import time
+
+import cv2
+import numpy as np
+
+from stream import FrameReader, Tracker, frame_event
+
+
+def _video(path, frames=20, size=(160, 120), fps=20):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+    for i in range(frames):
+        img = np.zeros((size[1], size[0], 3), np.uint8)
+        cv2.rectangle(img, (5 + 4 * i, 30), (45 + 4 * i, 70), (255, 255, 255), -1)
+        writer.write(img)
+    writer.release()
+    return str(path)
+
+
+def test_offline_reader_yields_every_frame(tmp_path):
+    path = _video(tmp_path / 'v.avi')
+    with FrameReader(path, stride=2) as reader:
+        items = list(reader)
+    assert [i for i, _, _ in items] == list(range(0, 20, 2))
+    assert items[1][1] == 2 / reader.fps and items[0][2].shape == (120, 160, 3)
+    assert reader.dropped == 10
+
+
+def test_realtime_reader_drops_frames_for_a_slow_consumer(tmp_path):
+    path = _video(tmp_path / 'v.avi', frames=20, fps=100)
+    with FrameReader(path, realtime=True) as reader:
+        seen = []
+        for index, _, _ in reader:
+            seen.append(index)
+            time.sleep(0.05)  # 5 frame intervals per frame
+            reader.report(0.05)
+    assert len(seen) < 20 and seen == sorted(seen)
+    assert reader.stride == 5
+    assert len(seen) + reader.dropped == reader.read_frames == 20
+
+
+def test_tracker_reports_each_object_once():
+    tracker = Tracker(iou_threshold=0.3, max_age=0.2, min_hits=3)
+    new, ended, ids = [], [], set()
+    for i in range(10):
+        x = 10.0 * i
+        dets = np.array([[x, 0, x + 50, 50, 0.5 + 0.01 * i, 2], [300, 300, 340, 340, 0.9, 0]], np.float32)
+        if i >= 6:
+            dets = dets[:1]  # the second object leaves the view
+        tracked, confirmed, gone = tracker.update(dets, t=0.1 * i, frame=i)
+        new += confirmed
+        ended += gone
+        ids.update(tracked[:, 6].tolist())
+        assert tracked.shape == (len(dets), 7)
+    assert len(new) == 2 and {t['cls'] for t in new} == {0, 2}
+    assert [t['cls'] for t in ended] == [0] and ended[0]['last_frame'] == 5
+    final = tracker.flush()
+    assert len(final) == 1 and final[0]['hits'] == 10 and final[0]['conf'] == 0.59
+    assert ids == {-1.0, 1.0, 2.0}
+
+    event = frame_event(3, 0.3, tracked, [], [], 0)
+    assert event['detections'][0]['track'] == 1
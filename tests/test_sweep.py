@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import sweep
+
+
+def test_space_parsing_and_expansion():
+    assert sweep.parse_param('imgsz=320|640') == ('imgsz', [320, 640])
+    assert sweep.parse_param('augment=null|hflip,color') == ('augment', [None, 'hflip,color'])
+    with pytest.raises(ValueError):
+        sweep.parse_param('lr=0.1')
+
+    grid = sweep.expand_space({'imgsz': [320, 640], 'model': ['a.pt', 'b.pt']})
+    assert len(grid) == 4 and grid[0] == {'epochs': 5, 'imgsz': 320, 'model': 'a.pt', 'augment': None}
+    picked = sweep.expand_space({'imgsz': [320, 640], 'model': ['a.pt', 'b.pt']}, 'random', trials=3, seed=1)
+    assert len(picked) == 3 and all(p in grid for p in picked)
+    assert picked == sweep.expand_space({'imgsz': [320, 640], 'model': ['a.pt', 'b.pt']}, 'random', 3, seed=1)
+
+
+def test_median_stopping_rule():
+    peers = [[0.2, 0.4, 0.5], [0.3, 0.5, 0.6], [0.1]]
+    assert not sweep.should_stop([0.1], peers, grace=2)
+    assert sweep.should_stop([0.1, 0.3], peers, grace=2)  # median of 0.4, 0.5
+    assert not sweep.should_stop([0.1, 0.5], peers, grace=2)
+    assert not sweep.should_stop([0.1, 0.1, 0.1], peers[:1], grace=2)  # too few peers got that far
+    assert not sweep.should_stop([0.1, 0.3], peers, grace=0)
+
+
+def test_train_command_and_core_sets():
+    trial = sweep.Trial('trial-000', {'epochs': 3, 'imgsz': 320, 'model': 'yolov8n.pt', 'augment': 'hflip'},
+                        cores=[0, 1])
+    cmd = sweep.train_command(trial, 'data.yaml', 'out')
+    assert cmd[cmd.index('--imgsz') + 1] == '320' and cmd[-2:] == ['--augment', 'hflip']
+    assert '--exist-ok' in cmd and cmd[cmd.index('--name') + 1] == 'trial-000'
+    assert cmd[cmd.index('--stage-dir') + 1] == os.path.abspath(os.path.join('out', 'pack_stage'))
+    sets = sweep.core_sets(1, parallel=2)
+    assert 1 <= len(sets) <= 2 and all(len(s) == 1 for s in sets)
+
+
+def _fake_start(trial, cmd, log):
+    """Stands in for train.py: writes a results.csv epoch by epoch."""
+    out, name = cmd[cmd.index('--project') + 1], trial.name
+    value = 0.5 if trial.params['model'] == 'good' else 0.1
+    script = (f"import os, time\nd = os.path.join({out!r}, {name!r})\nos.makedirs(d, exist_ok=True)\n"
+              f"f = open(os.path.join(d, 'results.csv'), 'w')\n"
+              f"f.write('epoch,metrics/mAP50-95(B)\\n')\n"
+              f"for e in range(1, {trial.params['epochs']} + 1):\n"
+              f"    f.write(f'{{e}},{value}\\n'); f.flush(); time.sleep(0.15)\n")
+    return subprocess.Popen([sys.executable, '-c', script], stdout=log, stderr=subprocess.STDOUT)
+
+
+def test_sweep_stops_losers_ranks_and_resumes(tmp_path):
+    params = sweep.expand_space({'epochs': [6], 'model': ['good', 'bad']})
+    params = [params[0], params[0], params[1]]
+    data = tmp_path / 'data.yaml'
+    data.write_text('train: images\nval: images\n')
+    rows = sweep.run_sweep(str(data), params, str(tmp_path), cores_per_run=1, parallel=1, grace=2, poll=0.05,
+                           start=_fake_start)
+    by_trial = {r['trial']: r for r in rows}
+    assert by_trial['trial-000']['status'] == 'done' and by_trial['trial-000']['epochs_run'] == 6
+    assert by_trial['trial-002']['status'] == 'stopped' and by_trial['trial-002']['epochs_run'] < 6
+    assert rows[-1]['trial'] == 'trial-002' and rows[0]['metric'] == 0.5
+    assert (tmp_path / 'leaderboard.csv').read_text().startswith('rank,trial,status')
+
+    # resuming the finished sweep runs nothing; another space needs another folder
+    assert sweep.run_sweep(str(data), params, str(tmp_path), poll=0.05, start=None) == rows
+    with pytest.raises(ValueError):
+        sweep.run_sweep(str(data), params[::-1], str(tmp_path), poll=0.05, start=None)
+
+
+def test_resumed_trial_starts_from_a_clean_results_csv(tmp_path):
+    params = sweep.expand_space({'epochs': [3], 'model': ['good']})
+    stale = tmp_path / 'trial-000' / 'results.csv'
+    stale.parent.mkdir()
+    stale.write_text('epoch,metrics/mAP50-95(B)\n' + ''.join(f'{e},0.9\n' for e in range(1, 11)))
+    data = tmp_path / 'data.yaml'
+    data.write_text('train: images\nval: images\n')
+    rows = sweep.run_sweep(str(data), params, str(tmp_path), cores_per_run=1, parallel=1, poll=0.05,
+                           start=_fake_start)
+    assert rows[0]['epochs_run'] == 3 and rows[0]['metric'] == 0.5
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from tiling import TiledPredictor, merge_detections, tile_grid, tile_views, tiled
+
+
+def test_tile_grid_covers_image_with_full_size_tiles():
+    grid = tile_grid(1000, 1500, tile=640, overlap=0.25)
+    assert (grid[:, 2] - grid[:, 0] == 640).all() and (grid[:, 3] - grid[:, 1] == 640).all()
+    assert grid[:, 2].max() == 1500 and grid[:, 3].max() == 1000
+    covered = np.zeros((1000, 1500), bool)
+    for x1, y1, x2, y2 in grid:
+        covered[y1:y2, x1:x2] = True
+    assert covered.all()
+    assert tile_grid(300, 400, tile=640).tolist() == [[0, 0, 400, 300]]
+
+
+def test_tile_views_share_memory():
+    img = np.zeros((1000, 1500, 3), np.uint8)
+    views = tile_views(img, tile_grid(1000, 1500, 640))
+    assert all(np.shares_memory(v, img) for v in views)
+
+
+def test_merge_nms_and_wbf():
+    dets = np.array([[0, 0, 100, 100, 0.9, 1],
+                     [50, 0, 100, 100, 0.6, 1],     # cut by a tile edge: inside the first box
+                     [10, 10, 110, 110, 0.3, 1],
+                     [0, 0, 100, 100, 0.8, 2]], np.float32)
+    nms = merge_detections(dets, 'nms', 0.5, 'ios')
+    assert nms[:, 4].tolist() == pytest.approx([0.9, 0.8])
+    assert len(merge_detections(dets, 'nms', 0.6, 'iou')) == 3
+    assert len(merge_detections(dets, 'nms', 0.5, 'ios', agnostic=True)) == 1
+    wbf = merge_detections(dets, 'wbf', 0.5, 'ios')
+    assert wbf[0, 4] == pytest.approx(0.9) and 0 < wbf[0, 0] < 50
+
+
+class _Engine:
+    """Finds one 20x20 bright square per image."""
+    names = {0: 'defect'}
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, images, conf=0.25, iou=0.7):
+        self.batches.append(len(images))
+        out = []
+        for img in images:
+            ys, xs = np.nonzero(img[..., 0] > 0)
+            out.append(np.array([[xs.min(), ys.min(), xs.max() + 1, ys.max() + 1, 0.9, 0]], np.float32)
+                       if len(xs) else np.zeros((0, 6), np.float32))
+        return out
+
+
+def test_tiled_predictor_maps_boxes_to_image_coordinates():
+    img = np.zeros((1200, 2000, 3), np.uint8)
+    img[700:720, 1500:1520] = 255
+    engine = _Engine()
+    predictor = TiledPredictor(engine, tile=640, overlap=0.2, batch_size=4)
+    dets = predictor.predict([img])[0]
+    assert dets[:, :4].tolist() == [[1500, 700, 1520, 720]]
+    assert max(engine.batches) == 4 and sum(engine.batches) == len(tile_grid(1200, 2000, 640, 0.2)) + 1
+    assert predictor.names == engine.names
+    assert tiled(engine, 0) is engine
+    with pytest.raises(ValueError):
+        TiledPredictor(engine, merge='mean')
@@ -0,0 +1,55 @@
+import asyncio
+import functools
+import os
+import threading
+
+import pytest
+
+from src.workers import Overloaded, WorkerPool, worker_state
+
+
+def _state_id():
+    return id(worker_state())
+
+
+def test_each_worker_builds_its_own_state():
+    loads = []
+
+    def loader():
+        loads.append(threading.get_ident())
+        return object()
+
+    pool = WorkerPool(loader, kind='thread', workers=2)
+    pool.start()
+    try:
+        assert len(set(loads)) == 2
+        ids = {pool.submit(_state_id).result() for _ in range(8)}
+        assert len(ids) <= 2
+    finally:
+        pool.shutdown()
+
+
+def test_process_pool_runs_jobs():
+    pool = WorkerPool(functools.partial(dict, name='model'), kind='process', workers=2)
+    try:
+        assert asyncio.run(pool.run(sum, [1, 2, 3])) == 6
+        assert len(set(pool.broadcast(os.getpid))) == 2
+    finally:
+        pool.shutdown()
+
+
+def test_slot_rejects_when_full():
+    pool = WorkerPool(object, max_pending=1, retry_after=7)
+
+    async def run():
+        async with pool.slot():
+            with pytest.raises(Overloaded) as exc:
+                async with pool.slot():
+                    pass
+            assert exc.value.retry_after == 7
+        # released once the first request finishes
+        async with pool.slot():
+            pass
+
+    asyncio.run(run())
+    assert pool.pending == 0